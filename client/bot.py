@@ -0,0 +1,446 @@
+# client/bot.py
+"""
+Monte-Carlo bot opponent for practice matches.
+
+A shot is just (piece, angle, power), so the bot searches that space by
+brute force: sample candidate shots for its pieces, simulate each one to
+rest on a copy of the world, score where things ended up, then spend the
+rest of the turn's time budget perturbing the best few. Candidates are
+evaluated in batches on a process pool, so the number tried per turn (and
+with it the play strength) grows with the cores available. A batch stops
+at the turn's deadline and returns what it finished, so batches can be
+large enough to keep the pool's per-task overhead out of the way.
+
+    outcome value = +/-WIN for a goal for / against
+                  - distance from the ball to the goal it attacks
+                  - exposure: ball near its own goal with an opponent closer to it
+                  + a little for each piece between the ball and its own goal
+
+BotPeer stands in for UDPPeer, so GameScreen plays against it unchanged.
+
+    python client/bot.py --games 4 --budget 0.5 --workers 2   # headless duel vs a naive shooter
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from pygame.math import Vector2 as Vec2
+
+from client.game_world import GameWorld
+
+Shot = Tuple[int, float, float]   # (piece_id, angle, power), as GameWorld.apply_shot takes it
+
+TICK_DT = 1.0 / 120.0
+MAX_TICKS = 120 * 12      # a shot that is still moving after 12s is scored where it is
+DEFAULT_BUDGET = 1.5      # seconds of thinking per turn
+MIN_THINK = 0.4           # never shoot sooner than this after the world came to rest
+BATCH = 8                 # candidates per pool task (cut short at the deadline)
+GRACE = 0.1               # past the deadline, wait this long for batches finishing their last candidate
+FIRST_PER_PIECE = 6
+KEEP = 6                  # best candidates refined each round
+WIN = 10000.0
+
+
+# ---------------- evaluation (runs in the pool workers) ----------------
+def _world_at(snap: Dict[str, Any]) -> GameWorld:
+    w = GameWorld(you_team=int(snap["turn_team"]), start_turn_team=int(snap["turn_team"]))
+    w.import_positions(snap)
+    return w
+
+
+def _goals(w: GameWorld) -> Tuple[Vec2, Vec2]:
+    f = w.field_rect()
+    return Vec2(f.left, f.centery), Vec2(f.right, f.centery)
+
+
+def outcome_value(w: GameWorld, team: int, scorer: Optional[int]) -> float:
+    if scorer is not None:
+        return WIN if scorer == team else -WIN
+    left, right = _goals(w)
+    attack, defend = (right, left) if team == 0 else (left, right)
+    b = w.ball().pos
+    value = -b.distance_to(attack)
+
+    own = [d for d in w.discs if d.team == team]
+    opp = [d for d in w.discs if d.team == 1 - team]
+    to_own_goal = b.distance_to(defend)
+    if to_own_goal < w.field_rect().width / 3:
+        nearest_own = min(d.pos.distance_to(b) for d in own)
+        nearest_opp = min(d.pos.distance_to(b) for d in opp)
+        if nearest_opp < nearest_own:
+            value -= (w.field_rect().width / 3 - to_own_goal) * 2.0
+    goal_side = sum(1 for d in own if abs(d.pos.x - defend.x) < abs(b.x - defend.x))
+    return value + 25.0 * min(goal_side, 3)
+
+
+def simulate(snap: Dict[str, Any], shot: Shot) -> float:
+    """Value of the world after shot has played out, for the team whose turn it is in snap."""
+    w = _world_at(snap)
+    team = w.turn_team
+    if not w.apply_shot(*shot):
+        return -WIN * 2
+    scorer = None
+    for _ in range(MAX_TICKS):
+        w.update(TICK_DT)
+        scorer = w.check_goal()
+        if scorer is not None or not any(d.vel for d in w.discs):
+            break
+    return outcome_value(w, team, scorer)
+
+
+def evaluate(snap: Dict[str, Any], shots: List[Shot], deadline: Optional[float] = None) -> List[Tuple[float, Shot]]:
+    """Score shots in order, starting none once time.monotonic() is past deadline."""
+    out = []
+    for s in shots:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        out.append((simulate(snap, s), s))
+    return out
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+# ---------------- search ----------------
+def first_candidates(snap: Dict[str, Any], rng: random.Random) -> List[Shot]:
+    """Per piece: aim through the ball at the goal, straight at the ball, and a few random angles."""
+    w = _world_at(snap)
+    team = w.turn_team
+    left, right = _goals(w)
+    attack = right if team == 0 else left
+    b = w.ball()
+    out: List[Shot] = []
+    for d in w.discs:
+        if d.team != team:
+            continue
+        to_goal = attack - b.pos
+        if to_goal.length_squared() > 0:
+            contact = b.pos - to_goal.normalize() * (d.r + b.r)
+            aim = contact - d.pos
+            out.append((d.id, math.atan2(aim.y, aim.x), rng.uniform(0.7, 1.0)))
+        direct = b.pos - d.pos
+        out.append((d.id, math.atan2(direct.y, direct.x), rng.uniform(0.4, 1.0)))
+        for _ in range(FIRST_PER_PIECE - 2):
+            out.append((d.id, rng.uniform(-math.pi, math.pi), rng.uniform(0.3, 1.0)))
+    rng.shuffle(out)
+    return out
+
+
+def refine(best: List[Tuple[float, Shot]], rnd: int, n: int, rng: random.Random) -> List[Shot]:
+    """n perturbations of the best shots, tighter every round."""
+    scale = 0.7 ** rnd
+    out = []
+    for i in range(n):
+        _, (pid, angle, power) = best[i % len(best)]
+        out.append((pid, angle + rng.gauss(0.0, 0.12 * scale),
+                    max(0.1, min(1.0, power + rng.gauss(0.0, 0.12 * scale)))))
+    return out
+
+
+class Planner:
+    """Picks a shot within a time budget. workers=0 evaluates inline (no processes)."""
+
+    def __init__(self, budget: float = DEFAULT_BUDGET, workers: Optional[int] = None, seed: Optional[int] = None):
+        self.budget = budget
+        self.workers = max(1, os.cpu_count() or 1) if workers is None else workers
+        self.rng = random.Random(seed)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.evaluated = 0        # candidates scored on the last turn
+        self.best_value = 0.0
+        if self.workers > 0:
+            # spawn: workers must not inherit the parent's SDL display state
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+
+    def warm_up(self) -> List[Future]:
+        """Start the workers now rather than on the first turn."""
+        if self.pool is None:
+            return []
+        return [self.pool.submit(_warm_up) for _ in range(self.workers)]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def choose(self, snap: Dict[str, Any], cancelled: Optional[threading.Event] = None) -> Optional[Shot]:
+        deadline = time.monotonic() + self.budget
+        queue = first_candidates(snap, self.rng)
+        if not queue:
+            return None
+        results: List[Tuple[float, Shot]] = []
+        rnd = 0
+        pending: Set[Future] = set()
+        # one batch queued behind each busy worker; more would only run on into the next turn
+        in_flight = self.workers + 1
+
+        while time.monotonic() < deadline and not (cancelled and cancelled.is_set()):
+            if not queue:
+                rnd += 1
+                results.sort(key=lambda r: r[0], reverse=True)
+                queue = refine(results[:KEEP], rnd, BATCH * max(1, self.workers), self.rng)
+            if self.pool is None:
+                batch, queue = queue[:BATCH], queue[BATCH:]
+                results.extend(evaluate(snap, batch, deadline))
+                continue
+            while queue and len(pending) < in_flight:
+                batch, queue = queue[:BATCH], queue[BATCH:]
+                pending.add(self.pool.submit(evaluate, snap, batch, deadline))
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            for fut in done:
+                results.extend(fut.result())
+            if not results and not pending:
+                break
+        for fut in pending:
+            fut.cancel()   # not started yet
+        pending = {fut for fut in pending if not fut.cancelled()}
+        if pending and not (cancelled and cancelled.is_set()):
+            # running batches stop at the deadline: collect what they finished
+            done, pending = wait(pending, timeout=GRACE)
+            for fut in done:
+                results.extend(fut.result())
+
+        self.evaluated = len(results)
+        if not results:
+            # out of time before anything came back: the aimed shot is a fine default
+            return first_candidates(snap, self.rng)[0]
+        self.best_value, shot = max(results, key=lambda r: r[0])
+        return shot
+
+
+# ---------------- GameScreen opponent ----------------
+class BotPeer:
+    """
+    Stands in for UDPPeer in a practice match: GameScreen sends its events
+    here and polls the bot's SHOTs back.
+
+    The bot keeps its own copy of the world and plays every shot out to rest
+    at once, which is all it needs to know. It shoots only once one of
+    GameScreen's periodic STATE_HASHes matches its copy, and since the hash
+    covers velocities that means the screen's world is at rest too: that
+    physics runs on frame time, and a shot that arrives while the previous
+    one is still rolling there would merge the two turns.
+    """
+
+    def __init__(self, team: int = 1, budget: float = DEFAULT_BUDGET, workers: Optional[int] = None,
+                 name: str = "bot"):
+        self.team = int(team)
+        self.name = name
+        self.planner = Planner(budget, workers)
+        self.status_text = f"Practice vs {name}"
+        self.world: Optional[GameWorld] = None
+        self._outbox: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._plan: Optional[threading.Thread] = None
+        self._planned: Optional[Tuple[int, Optional[Shot]]] = None   # (generation, shot)
+        self._generation = 0
+        self._cancel = threading.Event()
+        self._turn_since = 0.0
+        self._peer_hash: Optional[str] = None
+        self.game_over = False
+        self.turns = 0
+
+    # ---------- what GameScreen calls on a UDPPeer ----------
+    def begin_match(self, match_id: str, peer_ip: str = "", peer_port: int = 0, my_username: str = "",
+                    relay_addr=None, relay_token=None):
+        self.world = GameWorld(you_team=self.team, start_turn_team=0)
+        self._new_turn()
+        self._outbox.clear()
+        self.game_over = False
+        self.planner.warm_up()
+
+    def poll(self) -> List[Dict[str, Any]]:
+        self._step()
+        out, self._outbox = self._outbox, []
+        return out
+
+    def send_shot(self, piece_id: int, angle: float, power: float) -> int:
+        if self.world is not None and self.world.apply_shot(piece_id, angle, power):
+            self._play_out()
+        return 0
+
+    def send_reset(self, payload: dict):
+        if self.world is not None:
+            self.world.import_positions(payload)
+            self._new_turn()
+
+    def send_end(self, winner_team: int, score_blue: int, score_red: int):
+        self.game_over = True
+        self._new_turn()
+
+    def send_goal(self, scorer_team: int, score_blue: int, score_red: int):
+        pass   # a RESET follows
+
+    def send_state_hash(self, shot: int, tick: int, hash_str: str):
+        self._peer_hash = hash_str
+
+    def send_snapshot_req(self, tick: int):
+        pass
+
+    def send_snapshot(self, tick: int, state: dict, ack: Optional[int] = None):
+        pass
+
+    # nothing to bisect: the bot never sends a STATE_HASH, so GameScreen never sees a mismatch
+    def send_desync_probe(self, shot: int, ticks: List[int]) -> int:
+        return 0
+
+    def send_desync_hashes(self, shot: int, ticks: List[int], hashes: List[Optional[str]]) -> int:
+        return 0
+
+    def send_desync_fetch(self, shot: int, tick: int, digests: List[list]) -> int:
+        return 0
+
+    def send_desync_state(self, shot: int, tick: int, discs: List[list]) -> int:
+        return 0
+
+    def flush(self) -> int:
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"via": "bot", "connected": True, "evaluated": self.planner.evaluated,
+                "workers": self.planner.workers, "turns": self.turns}
+
+    def stop(self):
+        self._new_turn()
+        self.planner.close()
+
+    # ---------- the bot's side of the match ----------
+    def _new_turn(self):
+        """Forget the plan in progress and the screen's last hash; both belong to the previous turn."""
+        self._cancel.set()
+        self._cancel = threading.Event()
+        with self._lock:
+            self._generation += 1
+            self._planned = None
+        self._plan = None
+        self._peer_hash = None
+        self._turn_since = time.monotonic()
+
+    def _play_out(self):
+        """Run the shot just applied to rest (where every step leaves the world unchanged), then pass the turn."""
+        w = self.world
+        for _ in range(MAX_TICKS * 4):
+            still = not any(d.vel for d in w.discs)
+            before = [(d.pos.x, d.pos.y) for d in w.discs] if still else None
+            w.update(TICK_DT)
+            if still and [(d.pos.x, d.pos.y) for d in w.discs] == before:
+                break
+        w.turn_team = 1 - w.turn_team
+        self._new_turn()
+
+    def _step(self):
+        w = self.world
+        if w is None or self.game_over or w.turn_team != self.team:
+            return
+        if self._plan is None:
+            self._start_plan()
+            return
+        with self._lock:
+            planned = self._planned
+        if (planned is None or planned[0] != self._generation
+                or time.monotonic() - self._turn_since < MIN_THINK
+                or self._peer_hash != w.state_hash()):
+            return
+        shot = planned[1]
+        if shot is None or not w.apply_shot(*shot):
+            self._plan = None   # plan again
+            return
+        self.turns += 1
+        pid, angle, power = shot
+        self._outbox.append({"type": "SHOT", "piece": pid, "angle": angle, "power": power})
+        self._play_out()
+
+    def _start_plan(self):
+        snap = self.world.make_snapshot()
+        gen, cancel = self._generation, self._cancel
+
+        def run():
+            try:
+                shot = self.planner.choose(snap, cancel)
+            except Exception as e:  # a dead pool must not freeze the match
+                print(f"! bot planning failed: {e}")
+                shot = None
+            with self._lock:
+                if gen == self._generation:
+                    self._planned = (gen, shot)
+
+        self._plan = threading.Thread(target=run, daemon=True)
+        self._plan.start()
+
+
+# ---------------- headless duel ----------------
+def naive_shot(w: GameWorld, rng: random.Random) -> Shot:
+    """Any piece, roughly at the ball: about what net_bench's scripted players do."""
+    d = rng.choice([d for d in w.discs if d.team == w.turn_team])
+    to_ball = w.ball().pos - d.pos
+    return d.id, math.atan2(to_ball.y, to_ball.x) + rng.uniform(-0.35, 0.35), rng.uniform(0.4, 1.0)
+
+
+def duel(planner: Planner, games: int, win_score: int, max_turns: int, seed: int):
+    rng = random.Random(seed)
+    wins = goals_for = goals_against = 0
+    evaluated: List[int] = []
+    for g in range(games):
+        bot_team = g % 2
+        score = [0, 0]
+        w = GameWorld(you_team=bot_team, start_turn_team=0)
+        for _ in range(max_turns):
+            if w.turn_team == bot_team:
+                shot = planner.choose(w.make_snapshot())
+                evaluated.append(planner.evaluated)
+            else:
+                shot = naive_shot(w, rng)
+            w.apply_shot(*shot)
+            scorer = None
+            for _ in range(MAX_TICKS):
+                w.update(TICK_DT)
+                scorer = w.check_goal()
+                if scorer is not None or not any(d.vel for d in w.discs):
+                    break
+            if scorer is not None:
+                score[scorer] += 1
+                if max(score) >= win_score:
+                    break
+                w = GameWorld(you_team=bot_team, start_turn_team=scorer)
+            else:
+                w.turn_team = 1 - w.turn_team
+        goals_for += score[bot_team]
+        goals_against += score[1 - bot_team]
+        wins += score[bot_team] > score[1 - bot_team]
+        print(f"game {g + 1}: bot ({'BLUE' if bot_team == 0 else 'RED'}) {score[bot_team]} - {score[1 - bot_team]} naive")
+    avg = sum(evaluated) / len(evaluated) if evaluated else 0.0
+    print(f"bot won {wins}/{games}  goals {goals_for}-{goals_against}  "
+          f"candidates per turn: {avg:.0f} (budget {planner.budget}s, workers {planner.workers})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless duel: Monte-Carlo bot vs a naive shooter")
+    ap.add_argument("--games", type=int, default=4)
+    ap.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds per bot turn")
+    ap.add_argument("--workers", type=int, default=None, help="pool size (default: cores; 0 = inline)")
+    ap.add_argument("--win-score", type=int, default=2)
+    ap.add_argument("--max-turns", type=int, default=60)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    planner = Planner(args.budget, args.workers, seed=args.seed)
+    wait(planner.warm_up())
+    try:
+        duel(planner, args.games, args.win_score, args.max_turns, args.seed)
+    finally:
+        planner.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# client/bot_swarm.py
+"""
+Asyncio bot swarm for load-testing server/server.py on localhost.
+
+    python client/bot_swarm.py --bots 2000 --duration 60 --mix list=4,invite=2,port=1,presence=1
+
+Each bot registers (first run only), logs in, sets a UDP port and then runs
+random commands from the mix. Bots accept incoming invites with probability
+--accept and end their matches after --match-seconds. At the end it prints
+throughput and p50/p95/p99 latency per command, plus INVITE -> MATCH_START
+and QUICKMATCH -> MATCH_START (time-to-match).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+class Metrics:
+    def __init__(self):
+        self.lat: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.timeouts: Dict[str, int] = defaultdict(int)
+
+    def report(self, elapsed: float):
+        print(f"{'command':<22}{'ok':>8}{'err':>7}{'tmo':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name in sorted(set(self.lat) | set(self.errors) | set(self.timeouts)):
+            xs = sorted(self.lat.get(name, []))
+            n = len(xs)
+
+            def p(q):
+                return xs[min(n - 1, int(q * n))] * 1000.0 if n else float("nan")
+
+            print(f"{name:<22}{n:>8}{self.errors.get(name, 0):>7}{self.timeouts.get(name, 0):>6}"
+                  f"{n / elapsed:>10.1f}{p(0.50):>10.2f}{p(0.95):>10.2f}{p(0.99):>10.2f}")
+
+
+class Bot:
+    def __init__(self, swarm: "Swarm", name: str):
+        self.swarm = swarm
+        self.name = name
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._rid = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self.known: List[str] = []
+        self.invited_at: Optional[float] = None
+        self.queued_at: Optional[float] = None
+        self.in_match = False
+
+    # ---------- wire ----------
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.swarm.args.host, self.swarm.args.port)
+        asyncio.create_task(self._read_loop())
+
+    def _write(self, msg: dict):
+        self.writer.write((json.dumps(msg, separators=(",", ":")) + "\n").encode("utf-8"))
+
+    async def request(self, label: str, msg: dict, timeout: float = 10.0) -> Optional[dict]:
+        self._rid += 1
+        rid = self._rid
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[rid] = fut
+        t0 = time.perf_counter()
+        self._write(dict(msg, rid=rid))
+        try:
+            reply = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(rid, None)
+            self.swarm.metrics.timeouts[label] += 1
+            return None
+        if reply.get("type") == "ERROR":
+            self.swarm.metrics.errors[label] += 1
+        else:
+            self.swarm.metrics.lat[label].append(time.perf_counter() - t0)
+        return reply
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                rid = msg.get("rid")
+                if rid is not None:
+                    fut = self._pending.pop(rid, None)
+                    if fut and not fut.done():
+                        fut.set_result(msg)
+                    continue
+                self._on_push(msg)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.swarm.disconnects += 1
+
+    def _on_push(self, msg: dict):
+        t = msg.get("type")
+        if t == "INVITE_RECEIVED":
+            accept = self.swarm.rng.random() < self.swarm.args.accept
+            asyncio.create_task(self.request("INVITE_RESPONSE",
+                                             {"type": "INVITE_RESPONSE", "from": msg.get("from"), "accepted": accept}))
+        elif t == "MATCH_START":
+            if self.invited_at is not None:
+                self.swarm.metrics.lat["INVITE->MATCH_START"].append(time.perf_counter() - self.invited_at)
+                self.invited_at = None
+            if self.queued_at is not None:
+                self.swarm.metrics.lat["QUICKMATCH->MATCH_START"].append(time.perf_counter() - self.queued_at)
+                self.queued_at = None
+            self.swarm.matches += 1
+            self.in_match = True
+            asyncio.create_task(self._play_match())
+        elif t == "PING":
+            self._write({"type": "PONG"})
+        elif t in ("INVITE_DECLINED", "INVITE_CANCELLED", "INVITE_EXPIRED"):
+            self.invited_at = None
+        elif t == "QUICKMATCH_TIMEOUT":
+            self.queued_at = None
+            self.swarm.metrics.timeouts["QUICKMATCH->MATCH_START"] += 1
+        elif t == "USERS":
+            self.known = [u["username"] for u in msg.get("users", [])]
+
+    async def _play_match(self):
+        await asyncio.sleep(self.swarm.args.match_seconds)
+        self._write({"type": "MATCH_END"})
+        self.in_match = False
+
+    # ---------- behaviour ----------
+    async def run(self, deadline: float):
+        args = self.swarm.args
+        await self.connect()
+        if not args.skip_register:
+            await self.request("REGISTER", {"type": "REGISTER", "username": self.name,
+                                            "email": f"{self.name}@bots.local", "password": args.password}, timeout=120)
+        r = await self.request("LOGIN", {"type": "LOGIN", "username": self.name, "password": args.password}, timeout=120)
+        if not r or r.get("type") != "OK":
+            return
+        await self.request("SET_UDP_PORT", {"type": "SET_UDP_PORT", "udp_port": 20000 + self.swarm.rng.randrange(20000)})
+
+        actions, weights = zip(*self.swarm.mix.items())
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.swarm.rng.expovariate(1.0 / args.think))
+            if self.in_match or self.queued_at is not None:
+                continue
+            act = self.swarm.rng.choices(actions, weights)[0]
+            if act == "list":
+                r = await self.request("LIST_USERS", {"type": "LIST_USERS"})
+                if r and r.get("type") == "USERS":
+                    self.known = [u["username"] for u in r.get("users", [])]
+            elif act == "presence":
+                r = await self.request("SUBSCRIBE_PRESENCE", {"type": "SUBSCRIBE_PRESENCE"})
+                if r and r.get("type") == "USERS":
+                    self.known = [u["username"] for u in r.get("users", [])]
+            elif act == "port":
+                await self.request("SET_UDP_PORT", {"type": "SET_UDP_PORT",
+                                                    "udp_port": 20000 + self.swarm.rng.randrange(20000)})
+            elif act == "invite":
+                pool = [u for u in self.known if u != self.name] or self.swarm.names
+                target = self.swarm.rng.choice(pool)
+                if target == self.name:
+                    continue
+                self.invited_at = time.perf_counter()
+                r = await self.request("INVITE", {"type": "INVITE", "to": target})
+                if not r or r.get("type") != "OK":
+                    self.invited_at = None
+            elif act == "quick":
+                self.queued_at = time.perf_counter()
+                r = await self.request("QUICKMATCH", {"type": "QUICKMATCH",
+                                                      "rating": int(self.swarm.rng.gauss(1000, 200))})
+                if not r or r.get("type") != "OK":
+                    self.queued_at = None
+
+    async def close(self):
+        if self.writer:
+            try:
+                self._write({"type": "LOGOUT"})
+                self.writer.close()
+            except Exception:
+                pass
+
+
+class Swarm:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.mix = parse_mix(args.mix)
+        self.metrics = Metrics()
+        self.names = [f"{args.prefix}{i}" for i in range(args.bots)]
+        self.matches = 0
+        self.disconnects = 0
+
+    async def run(self):
+        bots = [Bot(self, n) for n in self.names]
+        t0 = time.perf_counter()
+        deadline = t0 + self.args.ramp + self.args.duration
+
+        async def start(i, bot):
+            await asyncio.sleep(self.args.ramp * i / max(1, len(bots)))
+            try:
+                await bot.run(deadline)
+            except (ConnectionError, OSError) as e:
+                self.metrics.errors["CONNECT"] += 1
+                if self.metrics.errors["CONNECT"] == 1:
+                    print(f"! connect failed: {e}")
+
+        await asyncio.gather(*(start(i, b) for i, b in enumerate(bots)))
+        elapsed = time.perf_counter() - t0
+        for b in bots:
+            await b.close()
+
+        print(f"bots: {len(bots)}  elapsed: {elapsed:.1f}s  matches started: {self.matches}  "
+              f"disconnects: {self.disconnects}")
+        self.metrics.report(elapsed)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        k, _, v = part.partition("=")
+        k = k.strip()
+        if k not in ("list", "invite", "port", "presence", "quick"):
+            raise SystemExit(f"unknown mix entry: {k}")
+        mix[k] = float(v or 1)
+    return mix
+
+
+def raise_fd_limit():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load-test the lobby server with a swarm of asyncio bots")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--bots", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds of steady state after ramp-up")
+    ap.add_argument("--ramp", type=float, default=5.0, help="seconds over which bots connect")
+    ap.add_argument("--think", type=float, default=1.0, help="mean seconds between a bot's commands")
+    ap.add_argument("--mix", default="list=4,invite=2,port=1,presence=1",
+                    help="weights of list, invite, port, presence, quick")
+    ap.add_argument("--accept", type=float, default=0.7, help="probability a bot accepts an invite")
+    ap.add_argument("--match-seconds", type=float, default=5.0)
+    ap.add_argument("--prefix", default="bot")
+    ap.add_argument("--password", default="botpass")
+    ap.add_argument("--skip-register", action="store_true", help="accounts already exist")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    raise_fd_limit()
+    asyncio.run(Swarm(args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# client/desync.py
+"""
+Desync bisection: find the first physics step at which two peers' worlds
+differ, and repair only what differs, from there.
+
+Both GameScreens hash every step of the current shot (shared.statehash)
+and keep the exact disc rows of each step next to its hash. When the
+peer's STATE_HASH does not match ours at the same step, the side that
+did not take the shot runs the search. The shooter is authoritative, so
+it only answers:
+
+    DESYNC_PROBE   shot, ticks          -> your hashes at these steps?
+    DESYNC_HASHES  shot, ticks, hashes     (null where it has none any more)
+        ... each answer narrows (agreed, bad] to one of PROBES + 1 slices ...
+    DESYNC_FETCH   shot, tick, digests  -> my per-disc digests at the first bad step
+    DESYNC_STATE   shot, tick, discs       exact [id, x, y, vx, vy] of the discs that differ
+
+The searching side then sets those discs to the shooter's rows at that
+step and re-simulates to the present (GameScreen._repair): a few hundred
+bytes instead of every disc, and the log says when and where the worlds
+split. If that cannot be done (the step is no longer in the history, a
+kickoff replaced the world since, the peer stopped answering) it asks for
+a snapshot at rest instead, as before.
+"""
+import math
+from typing import Dict, List, Optional
+
+PROBES = 7        # hashes asked for per round: 120 steps take 3 rounds
+TIMEOUT = 0.4     # seconds to wait for an answer before resending
+TRIES = 4         # resends before giving up
+
+
+def world_rows(world) -> tuple:
+    """Exact (id, x, y, vx, vy) of every disc: what GameScreen keeps per step."""
+    return tuple((d.id, d.pos.x, d.pos.y, d.vel.x, d.vel.y) for d in world.discs)
+
+
+class Bisector:
+    """Search state on the side looking for the first bad step of one shot."""
+
+    def __init__(self, shot: int, agreed: int, bad: int):
+        self.shot = shot
+        self.lo = agreed        # last step known to match (-1: none this shot)
+        self.hi = bad           # first step known to differ
+        self.detected = bad
+        self.rounds = 0
+        self.ticks: List[int] = []   # steps of the probe in flight
+        self.wait = TIMEOUT
+        self.tries = 0
+        self.bytes = 0          # sent by this side for the search
+
+    def done(self) -> bool:
+        return self.hi - self.lo <= 1
+
+    def probe_ticks(self) -> List[int]:
+        span = self.hi - self.lo
+        n = min(PROBES, span - 1)
+        self.ticks = sorted({self.lo + span * (i + 1) // (n + 1) for i in range(n)})
+        return self.ticks
+
+    def narrow(self, theirs: List[Optional[str]], ours: List[Optional[str]]) -> bool:
+        """Cut the range with the answer to the probe in flight; False if either side lacks a hash."""
+        self.rounds += 1
+        for tick, a, b in zip(self.ticks, theirs, ours):
+            if a is None or b is None:
+                return False
+            if a != b:
+                self.hi = tick
+                break
+            self.lo = tick
+        self.ticks = []
+        return True
+
+
+def report(shot: int, b: Bisector, ours: tuple, theirs: Dict[int, tuple], resimulated: int) -> List[str]:
+    """Log lines for a repaired desync: where it started and how far each disc was off."""
+    mine = {int(r[0]): r[1:] for r in ours}
+    lines = [f"! desync in shot {shot}: first bad step {b.hi} (seen at {b.detected}, "
+             f"{b.rounds} probe rounds, {b.bytes} bytes sent), {len(theirs)} disc(s) taken from the shooter, {resimulated} steps re-simulated"]
+    for did in sorted(theirs):
+        x, y, vx, vy = mine.get(did, (0.0, 0.0, 0.0, 0.0))
+        tx, ty, tvx, tvy = theirs[did]
+        lines.append(f"    disc {did}: pos off by {math.hypot(tx - x, ty - y):.3f}px "
+                     f"({x:.3f},{y:.3f} vs {tx:.3f},{ty:.3f}), vel off by {math.hypot(tvx - vx, tvy - vy):.3f}px/s")
+    return lines
@@ -1,5 +1,4 @@
 # client/game_world.py
-import hashlib
 from dataclasses import dataclass
 from typing import Dict, Any, List, Optional, Tuple
 
@@ -7,6 +6,7 @@ import pygame
 from pygame.math import Vector2 as Vec2
 
 from shared.constants import WIDTH, HEIGHT, WHITE, BLACK, BLUE, RED
+from shared.statehash import StateHasher, hash_hex
 
 
 # ---------------- Configuration ----------------
@@ -30,6 +30,8 @@ class WorldCfg:
     # stop condition
     stop_eps: float = 8.0
     sleep_frames: int = 8
+    # overlap floats cannot push apart (~1e-13 px); resting on it is not motion
+    rest_overlap: float = 1e-6
 
     # input
     max_drag: float = 120.0
@@ -88,6 +90,8 @@ class GameWorld:
         # goal guard (avoid double-trigger in same entry)
         self._goal_latched: bool = False
 
+        self._hasher = StateHasher()
+
         self._spawn()
 
     # ---------------- Layout ----------------
@@ -249,6 +253,7 @@ class GameWorld:
         self._step_soft_correction()
 
         f = self.field_rect()
+        eps2 = CFG.stop_eps * CFG.stop_eps
 
         for d in self.discs:
             if d.vel.length_squared() > 0:
@@ -258,9 +263,6 @@ class GameWorld:
                 fr = CFG.friction_per_60fps ** (dt * 60.0)
                 d.vel *= fr
 
-            if d.vel.length() < CFG.stop_eps:
-                d.vel.update(0, 0)
-
             left = f.left + d.r
             right = f.right - d.r
             top = f.top + d.r
@@ -280,9 +282,15 @@ class GameWorld:
                 d.pos.y = bottom
                 d.vel.y *= -CFG.wall_restitution
 
-        self._resolve_collisions()
+            # after the bounce, and with any_moving()'s test: a step never leaves a
+            # velocity for any_moving() to zero, so how often a frame calls it
+            # (frame rate) cannot change the simulation
+            if d.vel.length_squared() <= eps2:
+                d.vel.update(0, 0)
+
+        self._resolve_collisions(eps2)
 
-    def _resolve_collisions(self):
+    def _resolve_collisions(self, eps2: float):
         n = len(self.discs)
         e = CFG.restitution
         collided = False
@@ -291,10 +299,15 @@ class GameWorld:
             a = self.discs[i]
             for j in range(i + 1, n):
                 b = self.discs[j]
+                min_dist = a.r + b.r
+
+                # farther apart than min_dist on one axis: cannot touch (same
+                # outcome as the distance test below, without building vectors)
+                if abs(b.pos.x - a.pos.x) > min_dist or abs(b.pos.y - a.pos.y) > min_dist:
+                    continue
 
                 delta = b.pos - a.pos
                 dist = delta.length()
-                min_dist = a.r + b.r
 
                 if dist == 0:
                     delta = Vec2(1, 0)
@@ -303,9 +316,10 @@ class GameWorld:
                 if dist >= min_dist:
                     continue
 
-                collided = True
                 nrm = delta / dist
                 overlap = min_dist - dist
+                if overlap > CFG.rest_overlap:
+                    collided = True
 
                 ma, mb = a.mass, b.mass
                 inv_ma = 1.0 / ma
@@ -326,9 +340,9 @@ class GameWorld:
                 a.vel -= impulse * inv_ma
                 b.vel += impulse * inv_mb
 
-                if a.vel.length() < CFG.stop_eps:
+                if a.vel.length_squared() <= eps2:
                     a.vel.update(0, 0)
-                if b.vel.length() < CFG.stop_eps:
+                if b.vel.length_squared() <= eps2:
                     b.vel.update(0, 0)
 
         if collided:
@@ -413,32 +427,35 @@ class GameWorld:
     # Phase 7 — hash/snapshot (kept)
     # =========================================================
 
+    def state_hash64(self) -> int:
+        """Hash of quantized positions and velocities; only discs that changed since the last call are rehashed."""
+        return self._hasher.update(self.discs)
+
     def state_hash(self) -> str:
-        discs_sorted = sorted(self.discs, key=lambda d: d.id)
-        parts = [f"{int(round(d.pos.x))},{int(round(d.pos.y))}" for d in discs_sorted]
-        payload = (";".join(parts)).encode("utf-8")
-        return hashlib.md5(payload).hexdigest()
+        return hash_hex(self.state_hash64())
 
     def make_snapshot(self) -> Dict[str, Any]:
         discs_sorted = sorted(self.discs, key=lambda d: d.id)
         discs = []
         for d in discs_sorted:
+            # quantized on the wire by shared.snapshot
             discs.append({
                 "id": d.id,
-                "x": int(round(d.pos.x)),
-                "y": int(round(d.pos.y)),
-                "vx": float(round(d.vel.x, 3)),
-                "vy": float(round(d.vel.y, 3)),
+                "x": float(d.pos.x),
+                "y": float(d.pos.y),
+                "vx": float(d.vel.x),
+                "vy": float(d.vel.y),
             })
         return {"discs": discs, "turn_team": int(self.turn_team)}
 
-    def apply_snapshot_soft(self, snap: Dict[str, Any], pos_threshold: float = 6.0):
+    def apply_snapshot_soft(self, snap: Dict[str, Any], pos_threshold: float = 6.0) -> bool:
+        """False if ignored (world still moving or bad snapshot)."""
         if self.any_moving():
-            return
+            return False
 
         discs = snap.get("discs", [])
         if not isinstance(discs, list):
-            return
+            return False
 
         targets: Dict[int, Vec2] = {}
         for item in discs:
@@ -465,6 +482,7 @@ class GameWorld:
             self.turn_team = int(snap.get("turn_team", self.turn_team))
         except Exception:
             pass
+        return True
 
     def _step_soft_correction(self):
         if not self._corr_active or not self._corr_targets:
@@ -27,8 +27,15 @@ class App:
         # Run second client as:
         #   UDP_PORT=10002 python client/main.py
         self.my_udp_port = int(os.getenv("UDP_PORT", "10001"))
+        # match replays (client/replay_player.py plays them back); REPLAY_DIR= turns recording off
+        self.replay_dir = os.getenv("REPLAY_DIR", os.path.join(ROOT, "replays"))
+        # practice bot: seconds of search per turn, and processes searching (default: one per core)
+        self.bot_budget = float(os.getenv("BOT_BUDGET", "1.5"))
+        self.bot_workers = int(os.environ["BOT_WORKERS"]) if os.getenv("BOT_WORKERS") else None
 
         self.me = None
+        # from LOGIN; lets LobbyScreen RESUME the session after a dropped connection
+        self.resume_token = None
         self.match_info = None
 
         self.net = TcpClient()
@@ -76,6 +83,7 @@ class App:
                     self.current.handle_event(event)
 
                 self.current.update(dt)
+                self.udp_peer.flush()
 
                 for msg in self.net.poll():
                     self.current.on_network(msg)
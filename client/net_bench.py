@@ -0,0 +1,301 @@
+# client/net_bench.py
+"""
+Headless netcode benchmark: two GameScreens talk through a LossyLink on
+loopback and play scripted shots in real time.
+
+    python client/net_bench.py --latency 0.08 --jitter 0.03 --loss 0.1 --shots 30
+
+Reports SHOT delivery latency, resends, STATE_HASH mismatch rate, desync
+bisections (repaired / given up) with their traffic, snapshot fallbacks and
+time-to-resync (optionally forcing drift with --drift).
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pygame
+
+from shared.constants import FPS
+from client.netem import LossyLink, LinkProfile
+from client.udp_peer import UDPPeer
+from client.screens import GameScreen
+
+
+class BenchPeer(UDPPeer):
+    """UDPPeer that timestamps shots and counts hash checks and snapshot requests for the report."""
+
+    def __init__(self, local_port: int, shot_log: Dict[Tuple[str, int], float]):
+        super().__init__(local_port)
+        self.shot_log = shot_log
+        self.peer_name: Optional[str] = None
+        self.shot_latency: List[float] = []
+        self.shots_received = 0
+        self.hash_checks = 0
+        self.snapshot_reqs = 0   # bisection gave up (or never could start) and asked for the state at rest
+
+    def send_shot(self, piece_id: int, angle: float, power: float) -> int:
+        seq = super().send_shot(piece_id, angle, power)
+        self.shot_log[(self.my_username, seq)] = time.time()
+        return seq
+
+    def send_snapshot_req(self, tick: int):
+        self.snapshot_reqs += 1
+        super().send_snapshot_req(tick)
+
+    def poll(self):
+        msgs = super().poll()
+        now = time.time()
+        for m in msgs:
+            t = m.get("type")
+            if t == "SHOT":
+                self.shots_received += 1
+                sent = self.shot_log.pop((self.peer_name, int(m.get("seq", 0))), None)
+                if sent is not None:
+                    self.shot_latency.append(now - sent)
+            elif t == "STATE_HASH":
+                self.hash_checks += 1
+        return msgs
+
+
+class _NullNet:
+    connected = False
+
+    def send(self, msg):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class HeadlessApp:
+    """The slice of client.main.App that GameScreen touches."""
+
+    def __init__(self, me: str, udp_peer: UDPPeer, replay_dir: Optional[str] = None):
+        self.me = me
+        self.udp_peer = udp_peer
+        self.replay_dir = replay_dir
+        self.net = _NullNet()
+        self.match_info = None
+        self.returned = False
+
+    def change_screen(self, name, **kwargs):
+        self.returned = True
+
+
+class Side:
+    def __init__(self, name: str, port: int, shot_log, replay_dir: Optional[str] = None):
+        self.peer = BenchPeer(port, shot_log)
+        self.app = HeadlessApp(name, self.peer, replay_dir)
+        self.screen = GameScreen(self.app)
+        self.local_shots = 0
+
+    def start(self, match: dict):
+        self.app.returned = False
+        self.local_shots = 0
+        self.peer.shots_received = 0
+        self.screen.on_enter(match=match)
+
+    def applied(self) -> int:
+        return self.local_shots + self.peer.shots_received
+
+    def at_rest(self) -> bool:
+        w = self.screen.world
+        return (not w.any_moving()) and (not self.screen.shot_in_progress)
+
+
+def in_step(a: Side, b: Side) -> Tuple[Optional[Tuple[int, int]], Optional[bool]]:
+    """
+    Omniscient check: (shot_no, step) of the last step of this shot both sides
+    reached, and whether both hashed alike there (None: not comparable).
+    """
+    sa, sb = a.screen, b.screen
+    if sa.shot_no != sb.shot_no:
+        return None, None
+    step = min(sa.shot_step, sb.shot_step)
+    ha, hb = sa.hashes.get(step), sb.hashes.get(step)
+    if ha is None or hb is None:
+        return None, None
+    return (sa.shot_no, step), ha == hb
+
+
+def drift(rng: random.Random, s: Side):
+    """Move one disc outside physics: a forced desync. The drifted side's replay records it as a REPAIR
+    (discs set exactly), so its file still verifies."""
+    w = s.screen.world
+    d = rng.choice(w.discs)
+    d.pos.x += rng.choice((-1, 1)) * rng.uniform(8.0, 20.0)
+    if s.screen.replay:
+        s.screen.replay.repair(s.screen.sim_tick, [(d.id, d.pos.x, d.pos.y, d.vel.x, d.vel.y)])
+
+
+def pct(xs: List[float], p: float) -> float:
+    if not xs:
+        return float("nan")
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(math.ceil(p / 100.0 * len(xs))) - 1)]
+
+
+def pick_shot(rng: random.Random, screen: GameScreen) -> Tuple[int, float, float]:
+    w = screen.world
+    mine = [d for d in w.discs if d.team == w.you_team]
+    d = rng.choice(mine)
+    to_ball = w.ball().pos - d.pos
+    angle = math.atan2(to_ball.y, to_ball.x) + rng.uniform(-0.35, 0.35)
+    return d.id, angle, rng.uniform(0.4, 1.0)
+
+
+def run(args) -> int:
+    pygame.init()
+    rng = random.Random(args.seed)
+
+    profile = LinkProfile(args.latency, args.jitter, args.loss, args.dup, args.reorder)
+    link = LossyLink(args.port_a, args.port_b, profile, seed=args.seed)
+    link.start()
+
+    shot_log: Dict[Tuple[str, int], float] = {}
+    a = Side("bench_a", args.port_a, shot_log, args.replays)
+    b = Side("bench_b", args.port_b, shot_log, args.replays)
+    a.peer.peer_name, b.peer.peer_name = "bench_b", "bench_a"
+
+    def new_match(n: int):
+        mid = f"bench{n}"
+        a.start({"match_id": mid, "peer_ip": "127.0.0.1", "peer_udp_port": link.port_a, "you_start": True})
+        b.start({"match_id": mid, "peer_ip": "127.0.0.1", "peer_udp_port": link.port_b, "you_start": False})
+
+    matches = 1
+    new_match(matches)
+
+    shots = 0
+    desync_since: Optional[float] = None
+    desync_at: Optional[Tuple[int, int]] = None   # (shot_no, step) it was seen at
+    resync_times: List[float] = []
+    desyncs = 0
+    ended_at: Optional[float] = None
+    drain_until: Optional[float] = None
+    gap_rolled = False   # the drift dice were rolled since the last shot
+
+    dt = 1.0 / FPS
+    next_frame = time.time()
+    t0 = time.time()
+    try:
+        while True:
+            now = time.time()
+            if now - t0 > args.max_seconds:
+                print("! time limit reached")
+                break
+
+            for s in (a, b):
+                s.screen.update(dt)
+                s.peer.flush()
+
+            # omniscient desync check: a desync starts with the forced drift, or with worlds that differ
+            # at rest; it lasts until both hash alike at a later step (mid-shot repairs included)
+            at, same = in_step(a, b)
+            if desync_since is None:
+                if (same is False and a.at_rest() and b.at_rest() and a.applied() == b.applied()
+                        and a.screen.world.state_hash() != b.screen.world.state_hash()):
+                    desync_since, desync_at = now, at
+                    desyncs += 1
+            elif same and at > desync_at:
+                resync_times.append(now - desync_since)
+                desync_since = None
+
+            if drain_until is None:
+                # once per gap between two shots, maybe force a desync; the next shot then waits a frame,
+                # so the drift is never folded into the frame that fires it
+                drifted = False
+                if not gap_rolled and same and desync_since is None and a.at_rest() and b.at_rest() and a.applied() == b.applied():
+                    gap_rolled = True
+                    if rng.random() < args.drift:
+                        drift(rng, b)
+                        desync_since, desync_at = now, (b.screen.shot_no, b.screen.shot_step)
+                        desyncs += 1
+                        drifted = True
+                for s in (a, b):
+                    w = s.screen.world
+                    if (not drifted and shots < args.shots and w.is_my_turn() and s.at_rest()
+                            and a.applied() == b.applied()):
+                        if s.screen.take_shot(*pick_shot(rng, s.screen)):
+                            s.local_shots += 1
+                            shots += 1
+                            gap_rolled = False
+                if shots >= args.shots and a.at_rest() and b.at_rest():
+                    drain_until = now + args.drain
+            elif now >= drain_until:
+                break
+
+            # match over: restart once both sides left (or one side is stuck)
+            if a.app.returned or b.app.returned:
+                ended_at = ended_at or now
+                if (a.app.returned and b.app.returned) or now - ended_at > 3.0:
+                    matches += 1
+                    ended_at = None
+                    new_match(matches)
+
+            next_frame += dt
+            time.sleep(max(0.0, next_frame - time.time()))
+    finally:
+        a.screen.on_exit()
+        b.screen.on_exit()
+        a.peer.stop()
+        b.peer.stop()
+        link.stop()
+
+    lat = a.peer.shot_latency + b.peer.shot_latency
+    checks = a.peer.hash_checks + b.peer.hash_checks
+    sync = {k: a.screen.sync_stats[k] + b.screen.sync_stats[k] for k in a.screen.sync_stats}
+    print(f"link: latency={args.latency}s jitter={args.jitter}s loss={args.loss} dup={args.dup} reorder={args.reorder}")
+    print(f"matches: {matches}  shots: {shots}  delivered: {len(lat)}")
+    print(f"shot latency ms: p50={pct(lat, 50) * 1000:.1f}  p95={pct(lat, 95) * 1000:.1f}  max={pct(lat, 100) * 1000:.1f}")
+    sa, sb = a.peer.stats(), b.peer.stats()
+    print(f"resends: {sa.get('resends', 0) + sb.get('resends', 0)}  "
+          f"timeouts: {sa.get('timeouts', 0) + sb.get('timeouts', 0)}  "
+          f"dup drops: {sa.get('dup_drops', 0) + sb.get('dup_drops', 0)}")
+    print(f"packets out: {sa.get('packets_out', 0) + sb.get('packets_out', 0)}  "
+          f"msgs out: {sa.get('msgs_out', 0) + sb.get('msgs_out', 0)}  "
+          f"rtt ms p50: a={sa.get('rtt_ms', {}).get('p50', 0.0):.1f} b={sb.get('rtt_ms', {}).get('p50', 0.0):.1f}")
+    rate = (100.0 * sync["mismatches"] / checks) if checks else 0.0
+    print(f"hash checks: {checks}  mismatches: {sync['mismatches']} ({rate:.1f}%)")
+    print(f"desync bisections: {sync['bisections']}  repaired: {sync['repairs']}  "
+          f"gave up: {sync['fallbacks']}  "
+          f"traffic: {sa.get('desync_msgs', 0) + sb.get('desync_msgs', 0)} msgs "
+          f"{sa.get('desync_bytes', 0) + sb.get('desync_bytes', 0)} bytes")
+    print(f"snapshot requests: {a.peer.snapshot_reqs + b.peer.snapshot_reqs}  "
+          f"snapshots sent: {sa.get('snapshots_sent', 0) + sb.get('snapshots_sent', 0)}")
+    print(f"desyncs: {desyncs}  resynced: {len(resync_times)}  "
+          f"time-to-resync s: p50={pct(resync_times, 50):.2f}  max={pct(resync_times, 100):.2f}")
+    print(f"proxy: forwarded={link.forwarded} dropped={link.dropped} dup={link.duplicated} reordered={link.reordered}")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless P2P netcode benchmark over a lossy loopback link")
+    ap.add_argument("--latency", type=float, default=0.040)
+    ap.add_argument("--jitter", type=float, default=0.010)
+    ap.add_argument("--loss", type=float, default=0.0)
+    ap.add_argument("--dup", type=float, default=0.0)
+    ap.add_argument("--reorder", type=float, default=0.0)
+    ap.add_argument("--shots", type=int, default=20)
+    ap.add_argument("--drift", type=float, default=0.0,
+                    help="chance (0-1) of a forced desync between two shots; bench_b's replay records each as a REPAIR")
+    ap.add_argument("--drain", type=float, default=3.0, help="seconds to keep running after the last shot")
+    ap.add_argument("--max-seconds", type=float, default=300.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--port-a", type=int, default=12101)
+    ap.add_argument("--port-b", type=int, default=12102)
+    ap.add_argument("--replays", default=None, help="record each side's matches into this directory")
+    sys.exit(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
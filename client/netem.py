@@ -0,0 +1,130 @@
+# client/netem.py
+"""
+Loopback UDP proxy that emulates a bad link between two UDPPeers.
+
+    peer A  ->  link.port_a  ~~(latency, jitter, loss, dup, reorder)~~>  peer B
+    peer B  ->  link.port_b  ~~(same impairments)~~>                    peer A
+
+Point A's peer_port at link.port_a and B's at link.port_b.
+"""
+import heapq
+import random
+import select
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+Addr = Tuple[str, int]
+
+
+@dataclass
+class LinkProfile:
+    latency: float = 0.040   # one-way, seconds
+    jitter: float = 0.010    # +/- uniform, seconds
+    loss: float = 0.0        # drop probability
+    dup: float = 0.0         # duplicate probability
+    reorder: float = 0.0     # probability a datagram is held back an extra latency
+
+
+class LossyLink:
+    def __init__(self, peer_a_port: int, peer_b_port: int,
+                 profile: Optional[LinkProfile] = None, seed: Optional[int] = None):
+        self.profile = profile or LinkProfile()
+        self.rng = random.Random(seed)
+
+        self.peer_a: Addr = ("127.0.0.1", int(peer_a_port))
+        self.peer_b: Addr = ("127.0.0.1", int(peer_b_port))
+
+        # A sends into sock_a (we forward out of sock_b), and vice versa,
+        # so each peer sees the proxy as its remote end.
+        self.sock_a = self._bind()
+        self.sock_b = self._bind()
+        self.port_a = self.sock_a.getsockname()[1]
+        self.port_b = self.sock_b.getsockname()[1]
+
+        self.forwarded = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.reordered = 0
+
+        self._heap: List[Tuple[float, int, socket.socket, bytes, Addr]] = []
+        self._n = 0
+        self.running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _bind() -> socket.socket:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("127.0.0.1", 0))
+        s.setblocking(False)
+        return s
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        for s in (self.sock_a, self.sock_b):
+            try:
+                s.close()
+            except Exception:
+                pass
+
+    # ---------------- impairments ----------------
+    def _schedule(self, now: float, out: socket.socket, data: bytes, dest: Addr):
+        p = self.profile
+        if self.rng.random() < p.loss:
+            self.dropped += 1
+            return
+
+        copies = 1
+        if self.rng.random() < p.dup:
+            copies = 2
+            self.duplicated += 1
+
+        for _ in range(copies):
+            delay = p.latency + self.rng.uniform(-p.jitter, p.jitter)
+            if self.rng.random() < p.reorder:
+                delay += p.latency
+                self.reordered += 1
+            self._n += 1
+            heapq.heappush(self._heap, (now + max(0.0, delay), self._n, out, data, dest))
+
+    def _loop(self):
+        while self.running:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, out, data, dest = heapq.heappop(self._heap)
+                try:
+                    out.sendto(data, dest)
+                    self.forwarded += 1
+                except OSError:
+                    pass
+
+            timeout = 0.05
+            if self._heap:
+                timeout = max(0.0, min(timeout, self._heap[0][0] - now))
+            try:
+                ready, _, _ = select.select([self.sock_a, self.sock_b], [], [], timeout)
+            except (OSError, ValueError):
+                break
+
+            now = time.time()
+            for s in ready:
+                while True:
+                    try:
+                        data, _addr = s.recvfrom(65535)
+                    except (BlockingIOError, OSError):
+                        break
+                    if s is self.sock_a:
+                        self._schedule(now, self.sock_b, data, self.peer_b)
+                    else:
+                        self._schedule(now, self.sock_a, data, self.peer_a)
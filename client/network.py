@@ -1,19 +1,38 @@
 # client/network.py
 import socket
 import threading
+import time
 import queue
-from typing import Dict, Any, List, Optional
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
-from shared.netcodec import dumps_line, loads_line
+from shared.netcodec import LineFramer, dumps_line, loads_line
+from shared.netstats import NetStats
+
+Callback = Callable[[Dict[str, Any]], None]
+
+# USERS snapshots grow with the lobby, so replies may be far longer than requests
+MAX_REPLY_LINE = 8 * 1024 * 1024
 
 
 class TcpClient:
     def __init__(self):
         self.sock: Optional[socket.socket] = None
         self.reader_thread: Optional[threading.Thread] = None
-        self.inbox: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        # (enqueue time, msg)
+        self.inbox: "queue.Queue[Tuple[float, Dict[str, Any]]]" = queue.Queue()
         self.connected: bool = False
         self._stop = False
+        self.net_stats = NetStats()
+
+        # request/response correlation: rid -> (future, callback, deadline, sent_at)
+        self._rid = 0
+        self._requests: Dict[int, Tuple[Future, Optional[Callback], float, float]] = {}
+        self._req_lock = threading.Lock()
+        # the reader thread answers PING itself, so sends can come from two threads
+        self._send_lock = threading.Lock()
+        # replies whose callbacks still have to run on the main thread (in poll)
+        self._done: "queue.Queue[Tuple[Callback, Dict[str, Any]]]" = queue.Queue()
 
     def connect(self, host: str, port: int) -> bool:
         try:
@@ -24,15 +43,24 @@ class TcpClient:
 
             self.reader_thread = threading.Thread(target=self._read_loop, daemon=True)
             self.reader_thread.start()
+            self.net_stats.incr("connects")
             return True
         except Exception as e:
-            self.inbox.put({"type": "ERROR", "message": f"Connect failed: {e}"})
+            self.net_stats.incr("connect_failures")
+            self._deliver({"type": "ERROR", "message": f"Connect failed: {e}"})
             self.connected = False
             return False
 
     def close(self):
         self._stop = True
         self.connected = False
+        try:
+            if self.sock:
+                # shutdown first: close() alone waits for the blocked reader thread,
+                # so the server would not see the FIN (and the LEAVE) until exit
+                self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
         try:
             if self.sock:
                 self.sock.close()
@@ -41,26 +69,34 @@ class TcpClient:
         self.sock = None
 
     def _read_loop(self):
-        buf = b""
+        framer = LineFramer(MAX_REPLY_LINE)
         try:
             while not self._stop and self.sock:
-                data = self.sock.recv(4096)
+                data = self.sock.recv(65536)
                 if not data:
                     break
-                buf += data
+                self.net_stats.incr("packets_in")
+                self.net_stats.incr("bytes_in", len(data))
 
-                while b"\n" in buf:
-                    line, buf = buf.split(b"\n", 1)
-                    msg = loads_line(line)
+                for line in framer.feed(data):
+                    msg = loads_line(line) if line is not None else None
+                    self.net_stats.incr("msgs_in")
                     if msg is None:
-                        self.inbox.put({"type": "ERROR", "message": "Bad JSON from server"})
+                        self._deliver({"type": "ERROR", "message": "Bad JSON from server"})
+                    elif msg.get("type") == "PING":
+                        self.send({"type": "PONG"})  # server heartbeat; answered even mid-match
+                    elif "rid" in msg:
+                        self._resolve(msg)
                     else:
-                        self.inbox.put(msg)
+                        self._deliver(msg)
 
         except Exception as e:
-            self.inbox.put({"type": "ERROR", "message": f"Disconnected: {e}"})
+            self._deliver({"type": "ERROR", "message": f"Disconnected: {e}"})
         finally:
+            if self.connected:
+                self.net_stats.incr("disconnects")
             self.connected = False
+            self._fail_all("Disconnected")
             try:
                 if self.sock:
                     self.sock.close()
@@ -69,19 +105,116 @@ class TcpClient:
 
     def send(self, msg: Dict[str, Any]):
         if not self.connected or not self.sock:
-            self.inbox.put({"type": "ERROR", "message": "Not connected"})
+            self._deliver({"type": "ERROR", "message": "Not connected"})
             return
+        data = dumps_line(msg)
         try:
-            self.sock.sendall(dumps_line(msg))
+            with self._send_lock:
+                self.sock.sendall(data)
+            self.net_stats.incr("msgs_out")
+            self.net_stats.incr("packets_out")
+            self.net_stats.incr("bytes_out", len(data))
         except Exception as e:
-            self.inbox.put({"type": "ERROR", "message": f"Send failed: {e}"})
+            self._deliver({"type": "ERROR", "message": f"Send failed: {e}"})
             self.connected = False
 
+    # ---------------- requests ----------------
+    def request(self, msg: Dict[str, Any], callback: Optional[Callback] = None,
+                timeout: float = 5.0) -> Future:
+        """
+        Send msg tagged with a request id. The returned Future (and callback,
+        run from poll() on the main thread) gets the matching OK/ERROR/USERS
+        reply, or a synthetic ERROR on timeout/disconnect. Any number of
+        requests may be in flight at once.
+        """
+        fut: Future = Future()
+        now = time.time()
+        with self._req_lock:
+            self._rid += 1
+            rid = self._rid
+            self._requests[rid] = (fut, callback, now + timeout, now)
+
+        if not self.connected or not self.sock:
+            self._complete(rid, {"type": "ERROR", "message": "Not connected", "rid": rid})
+            return fut
+        self.send(dict(msg, rid=rid))
+        if not self.connected:
+            self._complete(rid, {"type": "ERROR", "message": "Send failed", "rid": rid})
+        return fut
+
+    def _complete(self, rid: int, msg: Dict[str, Any]) -> bool:
+        with self._req_lock:
+            entry = self._requests.pop(rid, None)
+        if entry is None:
+            return False
+        fut, callback, _deadline, _sent = entry
+        fut.set_result(msg)
+        if callback:
+            self._done.put((callback, msg))
+        return True
+
+    def _resolve(self, msg: Dict[str, Any]):
+        try:
+            rid = int(msg["rid"])
+        except (TypeError, ValueError):
+            return
+        with self._req_lock:
+            entry = self._requests.get(rid)
+        if entry is None:
+            self.net_stats.incr("late_replies")  # already timed out
+            return
+        self.net_stats.observe("rtt_ms", (time.time() - entry[3]) * 1000.0)
+        self._complete(rid, msg)
+
+    def _expire(self):
+        now = time.time()
+        with self._req_lock:
+            expired = [rid for rid, e in self._requests.items() if e[2] <= now]
+        for rid in expired:
+            if self._complete(rid, {"type": "ERROR", "message": "Request timed out", "rid": rid}):
+                self.net_stats.incr("timeouts")
+
+    def _fail_all(self, reason: str):
+        with self._req_lock:
+            rids = list(self._requests)
+        for rid in rids:
+            self._complete(rid, {"type": "ERROR", "message": reason, "rid": rid})
+
+    def in_flight(self) -> int:
+        return len(self._requests)
+
+    def _deliver(self, msg: Dict[str, Any]):
+        self.inbox.put((time.time(), msg))
+
     def poll(self) -> List[Dict[str, Any]]:
+        self._expire()
+        while True:
+            try:
+                callback, reply = self._done.get_nowait()
+            except queue.Empty:
+                break
+            callback(reply)
+
         msgs: List[Dict[str, Any]] = []
+        now = time.time()
+        self.net_stats.observe("inbox_depth", self.inbox.qsize())
         while True:
             try:
-                msgs.append(self.inbox.get_nowait())
+                t_in, msg = self.inbox.get_nowait()
             except queue.Empty:
                 break
-        return msgs
\ No newline at end of file
+            self.net_stats.observe("inbox_wait_ms", (now - t_in) * 1000.0)
+            msgs.append(msg)
+        return msgs
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters: bytes_in/out, packets_in/out, msgs_in/out, connects,
+        connect_failures, disconnects, timeouts, late_replies.
+        Histograms (n/p50/p95/max): rtt_ms (request -> reply), inbox_wait_ms, inbox_depth.
+        """
+        out = self.net_stats.snapshot()
+        out["inbox_queued"] = self.inbox.qsize()
+        out["in_flight"] = self.in_flight()
+        out["connected"] = self.connected
+        return out
\ No newline at end of file
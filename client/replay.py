@@ -0,0 +1,378 @@
+# client/replay.py
+"""
+Compact binary match replays.
+
+A match is fully determined by its inputs: the SHOTs, plus the events that
+replace positions wholesale (a kickoff after a local goal, a peer's RESET,
+an accepted resync snapshot, a desync repair). GameScreen records those with the physics
+tick they happened at; client/replay_player.py re-simulates them through
+GameWorld and checks the periodic state hashes along the way.
+
+File layout (little-endian):
+
+    b"SSRP" | version u8 | header length u16 | header JSON
+    records...
+    index: n u32, last tick u32, n x (tick u32, offset u32)
+    index offset u32 | b"SSIX"
+
+Each record is  kind u8 | tick delta (varint) | payload,  where the tick
+delta is counted from the previous record. Records with the same tick
+are applied in file order, after that many physics steps.
+
+    SHOT      piece u8, angle f64, power f64, source u8 (LOCAL / PEER)
+    TURN      team u8
+    GOAL      scorer u8, score blue u8, score red u8, source u8
+    KICKOFF   next turn u8            (local goal: fresh GameWorld)
+    RESET     turn u8, n u8, n x (id u8, x f64, y f64)
+    SNAP      turn u8, n u8, n x (id u8, x f64, y f64)   (accepted resync)
+    HASH      state_digest() 8 bytes
+    END       winner u8, score blue u8, score red u8
+    KEYFRAME  turn u8, score blue u8, score red u8, n u8,
+              n x (id u8, x f64, y f64, vx f64, vy f64)
+    REPAIR    n u8, n x (id u8, x f64, y f64, vx f64, vy f64)
+              (discs a desync repair changed; client/desync.py)
+
+HASH is written every HASH_EVERY ticks, but only when the state changed
+since the last one, so resting between turns costs nothing. A shot is
+20 bytes, a second of motion 10.
+
+KEYFRAME is the whole world at rest (make_snapshot() with exact floats)
+plus the score, written at most every KEYFRAME_EVERY ticks when a turn
+ends. Playback can start from any keyframe, so a seek only simulates
+from the nearest one: at most KEYFRAME_EVERY ticks plus one shot, however
+long the match is. The index footer lists every keyframe's tick and file
+offset; it is written on close, and rebuilt by scanning the records when
+a client died before writing it.
+"""
+import hashlib
+import json
+import mmap
+import struct
+import time
+from bisect import bisect_right
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+MAGIC = b"SSRP"
+VERSION = 3           # 2: KEYFRAME + index footer, 3: REPAIR
+# version 1 files were recorded before GameWorld.update() stopped slow discs
+# right after the wall bounce; their physics depended on the frame rate, so
+# an occasional one does not reproduce on any build
+STEADY_PHYSICS = 2
+TICK_RATE = 120       # GameScreen.fixed_dt = 1 / TICK_RATE
+HASH_EVERY = 120      # ticks
+KEYFRAME_EVERY = 10 * TICK_RATE
+
+SHOT, TURN, GOAL, KICKOFF, RESET, SNAP, HASH, END, KEYFRAME, REPAIR = range(1, 11)
+KIND_NAMES = {SHOT: "SHOT", TURN: "TURN", GOAL: "GOAL", KICKOFF: "KICKOFF", RESET: "RESET",
+              SNAP: "SNAP", HASH: "HASH", END: "END", KEYFRAME: "KEYFRAME", REPAIR: "REPAIR"}
+
+LOCAL, PEER = 0, 1
+
+INDEX_MAGIC = b"SSIX"
+
+_SHOT = struct.Struct("<BddB")
+_GOAL = struct.Struct("<BBBB")
+_END = struct.Struct("<BBB")
+_POSHEAD = struct.Struct("<BB")
+_POS = struct.Struct("<Bdd")
+_KEYHEAD = struct.Struct("<BBBB")
+_KEYROW = struct.Struct("<Bdddd")
+_DISC = struct.Struct("<dddd")
+_INDEX_HEAD = struct.Struct("<II")
+_INDEX_ROW = struct.Struct("<II")
+_TRAILER = struct.Struct("<I4s")
+DIGEST_SIZE = 8
+
+
+class Record(NamedTuple):
+    tick: int
+    kind: int
+    data: tuple
+
+
+def state_digest(world) -> bytes:
+    """8-byte hash of every disc's exact position and velocity."""
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for d in sorted(world.discs, key=lambda d: d.id):
+        h.update(_DISC.pack(d.pos.x, d.pos.y, d.vel.x, d.vel.y))
+    return h.digest()
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _positions(turn: int, discs: List[Dict[str, Any]]) -> bytes:
+    rows = [_POS.pack(int(d["id"]), float(d["x"]), float(d["y"])) for d in discs]
+    return _POSHEAD.pack(int(turn), len(rows)) + b"".join(rows)
+
+
+class ReplayWriter:
+    """Appends records to an open replay file; GameScreen owns one per match."""
+
+    def __init__(self, f: BinaryIO, header: Dict[str, Any]):
+        self.f = f
+        self.last_tick = 0
+        self.last_hash: Optional[bytes] = None
+        self.last_keyframe = 0   # kickoff is an implicit keyframe
+        self.index: List[Tuple[int, int]] = []
+        head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        first = MAGIC + struct.pack("<BH", VERSION, len(head)) + head
+        f.write(first)
+        self.offset = len(first)
+
+    @classmethod
+    def open(cls, path: str, header: Dict[str, Any]) -> "ReplayWriter":
+        header = dict(header, tick_rate=TICK_RATE, created=int(time.time()))
+        return cls(open(path, "wb"), header)
+
+    def _put(self, tick: int, kind: int, payload: bytes = b"") -> Optional[int]:
+        """Write one record; returns its offset (None when not recording)."""
+        if self.f is None:
+            return None
+        rec = bytes((kind,)) + _varint(max(0, tick - self.last_tick)) + payload
+        try:
+            self.f.write(rec)
+        except OSError:
+            self._drop()  # disk full or similar: stop recording, keep playing
+            return None
+        offset = self.offset
+        self.offset += len(rec)
+        self.last_tick = max(tick, self.last_tick)
+        return offset
+
+    # ---------- records ----------
+    def shot(self, tick: int, piece: int, angle: float, power: float, source: int):
+        self._put(tick, SHOT, _SHOT.pack(int(piece), float(angle), float(power), source))
+
+    def turn(self, tick: int, team: int):
+        self._put(tick, TURN, bytes((int(team),)))
+
+    def goal(self, tick: int, scorer: int, score_blue: int, score_red: int, source: int):
+        self._put(tick, GOAL, _GOAL.pack(int(scorer), score_blue, score_red, source))
+
+    def kickoff(self, tick: int, next_turn: int):
+        self._put(tick, KICKOFF, bytes((int(next_turn),)))
+
+    def reset(self, tick: int, payload: Dict[str, Any]):
+        """payload as from GameWorld.export_positions()."""
+        self._put(tick, RESET, _positions(payload.get("turn_team", 0), payload.get("discs", [])))
+
+    def snapshot(self, tick: int, snap: Dict[str, Any]):
+        """A make_snapshot() shaped dict the world accepted."""
+        self._put(tick, SNAP, _positions(snap.get("turn_team", 0), snap.get("discs", [])))
+
+    def repair(self, tick: int, rows: List[tuple]):
+        """Exact (id, x, y, vx, vy) of every disc a desync repair (or net_bench's forced drift) moved."""
+        self._put(tick, REPAIR, bytes((len(rows),)) + b"".join(_KEYROW.pack(*r) for r in rows))
+
+    def stepped(self, tick: int, world):
+        """Called after every physics step; writes the periodic HASH."""
+        if tick % HASH_EVERY == 0:
+            self.hash(tick, world)
+
+    def hash(self, tick: int, world):
+        digest = state_digest(world)
+        if digest != self.last_hash:
+            self.last_hash = digest
+            self._put(tick, HASH, digest)
+
+    def keyframe(self, tick: int, world, score_blue: int, score_red: int):
+        """Call with the world at rest; writes a KEYFRAME if the last one is KEYFRAME_EVERY ticks old."""
+        if tick - self.last_keyframe < KEYFRAME_EVERY or world._corr_active:
+            return
+        snap = world.make_snapshot()
+        rows = [_KEYROW.pack(d["id"], d["x"], d["y"], d["vx"], d["vy"]) for d in snap["discs"]]
+        offset = self._put(tick, KEYFRAME,
+                           _KEYHEAD.pack(snap["turn_team"], score_blue, score_red, len(rows)) + b"".join(rows))
+        if offset is not None:
+            self.index.append((tick, offset))
+            self.last_keyframe = tick
+
+    def end(self, tick: int, world, winner: int, score_blue: int, score_red: int):
+        self.hash(tick, world)
+        self._put(tick, END, _END.pack(int(winner), score_blue, score_red))
+
+    def close(self):
+        """Write the keyframe index and close the file."""
+        if self.f is None:
+            return
+        index = [_INDEX_HEAD.pack(len(self.index), self.last_tick)]
+        index += [_INDEX_ROW.pack(tick, offset) for tick, offset in self.index]
+        try:
+            self.f.write(b"".join(index) + _TRAILER.pack(self.offset, INDEX_MAGIC))
+        except OSError:
+            pass
+        self._drop()
+
+    def _drop(self):
+        f, self.f = self.f, None
+        try:
+            f.close()
+        except OSError:
+            pass
+
+
+class ReplayReader:
+    """Parses a replay from bytes or, via map(), straight from an mmap of the file."""
+
+    def __init__(self, data):
+        if data[:4] != MAGIC:
+            raise ValueError("not a replay file")
+        if len(data) < 7:
+            raise ValueError("truncated replay header")
+        version, n = struct.unpack_from("<BH", data, 4)
+        if version not in (1, 2, VERSION):
+            raise ValueError(f"unsupported replay version {version}")
+        self.version = version
+        self.data = data
+        self.header: Dict[str, Any] = json.loads(data[7:7 + n].decode("utf-8"))
+        self.start = 7 + n
+        self.end = len(data)      # records stop here (at the index, if there is one)
+        self.truncated = False    # set when iteration hit a half-written or unreadable record
+        self._index: Optional[List[Tuple[int, int]]] = None
+        self._last_tick: Optional[int] = None
+        self._read_index()
+
+    @classmethod
+    def load(cls, path: str) -> "ReplayReader":
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    @classmethod
+    def map(cls, path: str) -> "ReplayReader":
+        """Map the file instead of reading it: a seek only touches the pages it needs."""
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def _read_index(self):
+        data = self.data
+        size = len(data)
+        if size < self.start + _INDEX_HEAD.size + _TRAILER.size:
+            return
+        at, magic = _TRAILER.unpack_from(data, size - _TRAILER.size)
+        if magic != INDEX_MAGIC or not self.start <= at <= size - _TRAILER.size - _INDEX_HEAD.size:
+            return
+        n, last_tick = _INDEX_HEAD.unpack_from(data, at)
+        rows = at + _INDEX_HEAD.size
+        if rows + n * _INDEX_ROW.size + _TRAILER.size != size:
+            return
+        self.end = at
+        self._last_tick = last_tick
+        self._index = [_INDEX_ROW.unpack_from(data, rows + i * _INDEX_ROW.size) for i in range(n)]
+
+    def _scan_index(self):
+        """No footer (old file, or the client died mid-match): find the keyframes the slow way."""
+        index, last = [], 0
+        for offset, rec in self.scan():
+            if rec.kind == KEYFRAME:
+                index.append((rec.tick, offset))
+            last = rec.tick
+        self._index, self._last_tick = index, last
+
+    @property
+    def keyframes(self) -> List[Tuple[int, int]]:
+        """(tick, offset) of every KEYFRAME record, in order."""
+        if self._index is None:
+            self._scan_index()
+        return self._index
+
+    @property
+    def last_tick(self) -> int:
+        if self._last_tick is None:
+            self._scan_index()
+        return self._last_tick
+
+    def keyframe_before(self, tick: int) -> Optional[Tuple[int, int]]:
+        """The last keyframe at or before tick, or None if there is none (start from kickoff)."""
+        keys = self.keyframes
+        i = bisect_right(keys, (tick, 1 << 32))
+        return keys[i - 1] if i else None
+
+    def __iter__(self) -> Iterator[Record]:
+        for _, rec in self.scan():
+            yield rec
+
+    def scan(self, pos: Optional[int] = None, at_tick: Optional[int] = None) -> Iterator[Tuple[int, Record]]:
+        """(offset, record) from pos (default: the first record). at_tick is the tick of
+        the record at pos, for starting in the middle, e.g. at a keyframe from the index."""
+        data, end = self.data, self.end
+        pos = self.start if pos is None else pos
+        tick = 0
+        while pos < end:
+            offset = pos
+            try:
+                kind = data[pos]
+                pos += 1
+                delta, shift = 0, 0
+                while True:
+                    b = data[pos]
+                    pos += 1
+                    delta |= (b & 0x7F) << shift
+                    shift += 7
+                    if b < 0x80:
+                        break
+                if at_tick is not None:
+                    tick, at_tick = at_tick, None
+                else:
+                    tick += delta
+                rec, pos = self._payload(kind, pos)
+                if pos > end:
+                    raise IndexError(pos)
+            except (IndexError, struct.error, ValueError):
+                # a client that crashed mid-match leaves a half-written tail
+                # (or garbage, whose first byte is no record kind we know)
+                self.truncated = True
+                return
+            yield offset, Record(tick, kind, rec)
+
+    def _payload(self, kind: int, pos: int) -> Tuple[tuple, int]:
+        data = self.data
+        if kind == SHOT:
+            return _SHOT.unpack_from(data, pos), pos + _SHOT.size
+        if kind in (TURN, KICKOFF):
+            return (data[pos],), pos + 1
+        if kind == GOAL:
+            return _GOAL.unpack_from(data, pos), pos + _GOAL.size
+        if kind in (RESET, SNAP):
+            turn, n = _POSHEAD.unpack_from(data, pos)
+            pos += _POSHEAD.size
+            rows = [_POS.unpack_from(data, pos + i * _POS.size) for i in range(n)]
+            return (turn, rows), pos + n * _POS.size
+        if kind == HASH:
+            if pos + DIGEST_SIZE > len(data):
+                raise IndexError(pos)
+            return (data[pos:pos + DIGEST_SIZE],), pos + DIGEST_SIZE
+        if kind == END:
+            return _END.unpack_from(data, pos), pos + _END.size
+        if kind == KEYFRAME:
+            turn, blue, red, n = _KEYHEAD.unpack_from(data, pos)
+            pos += _KEYHEAD.size
+            rows = [_KEYROW.unpack_from(data, pos + i * _KEYROW.size) for i in range(n)]
+            return (turn, blue, red, rows), pos + n * _KEYROW.size
+        if kind == REPAIR:
+            n = data[pos]
+            pos += 1
+            rows = [_KEYROW.unpack_from(data, pos + i * _KEYROW.size) for i in range(n)]
+            return (rows,), pos + n * _KEYROW.size
+        raise ValueError(f"unknown replay record kind {kind}")
+
+
+def positions_payload(turn: int, rows: List[tuple]) -> Dict[str, Any]:
+    """RESET / SNAP record data -> the dict import_positions / apply_snapshot_soft take."""
+    return {"turn_team": turn, "discs": [{"id": did, "x": x, "y": y} for did, x, y in rows]}
+
+
+def keyframe_snapshot(turn: int, rows: List[tuple]) -> Dict[str, Any]:
+    """KEYFRAME record data -> a make_snapshot() shaped dict."""
+    return {"turn_team": turn,
+            "discs": [{"id": did, "x": x, "y": y, "vx": vx, "vy": vy} for did, x, y, vx, vy in rows]}
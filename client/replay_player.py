@@ -0,0 +1,242 @@
+# client/replay_player.py
+"""
+Headless replay player: re-simulates a recorded match through GameWorld
+and checks every state hash the recording client wrote.
+
+    python client/replay_player.py replays/20261019-101500-1a2b3c4d-alice.ssr
+    python client/replay_player.py --events replays/*.ssr
+
+Only ticks where something moves are simulated. Once a physics step leaves
+every disc exactly where it was (all at rest, no soft correction running)
+the world is a fixed point, and the player jumps straight to the next
+record's tick instead of stepping through the pause between turns.
+
+ReplayPlayer.seek() starts from the nearest keyframe instead of kickoff;
+client/replay_viewer.py uses it to scrub through a match.
+
+Exit status is 1 if any hash did not match, i.e. the recorded match does
+not reproduce on this build.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from client import replay
+from client.game_world import CFG, GameWorld
+
+
+def _motion(world) -> tuple:
+    return tuple((d.pos.x, d.pos.y, d.vel.x, d.vel.y) for d in world.discs)
+
+
+class ReplayPlayer:
+    """Applies a replay's records to a GameWorld at the ticks they were recorded."""
+
+    def __init__(self, reader: replay.ReplayReader):
+        h = reader.header
+        self.reader = reader
+        self.you_team = int(h.get("you_team", 0))
+        self.dt = 1.0 / int(h.get("tick_rate", replay.TICK_RATE))
+        self.steps = 0            # physics steps actually simulated
+        self.records = 0
+        self.hash_checks = 0
+        self.mismatches: List[int] = []   # ticks whose HASH (or KEYFRAME) did not match
+        self._kickoff()
+
+    def _kickoff(self):
+        self.world = GameWorld(you_team=self.you_team, start_turn_team=int(self.reader.header.get("start_turn", 0)))
+        self.tick = 0
+        self.score_blue = 0
+        self.score_red = 0
+        self.winner: Optional[int] = None
+        self._resting = False
+        self._records = self.reader.scan()
+        self._next = self._pull()
+
+    def _pull(self) -> Optional[replay.Record]:
+        item = next(self._records, None)
+        return item[1] if item is not None else None
+
+    def _load_keyframe(self, tick: int, offset: int):
+        """Restart from the KEYFRAME record at offset, as if everything before it had been played."""
+        self._records = self.reader.scan(offset, at_tick=tick)
+        rec = self._pull()
+        turn, self.score_blue, self.score_red, rows = rec.data
+        self.world = _world_from_keyframe(self.you_team, turn, rows)
+        self.tick = rec.tick
+        self.winner = None
+        self._resting = False
+        self._next = self._pull()
+
+    def advance(self, target: int):
+        """Simulate up to tick target, skipping ahead once the world stops changing."""
+        w = self.world
+        while self.tick < target:
+            if self._resting:
+                self.tick = target
+                return
+            still = not w._corr_active and not any(d.vel for d in w.discs)
+            before = _motion(w) if still else None
+            w.update(self.dt)
+            self.tick += 1
+            self.steps += 1
+            if still and _motion(w) == before:
+                self._resting = True
+
+    def apply(self, rec: replay.Record):
+        kind, data = rec.kind, rec.data
+        w = self.world
+        self.records += 1
+        if kind == replay.SHOT:
+            piece, angle, power, _source = data
+            w.apply_shot(piece, angle, power)
+            self._resting = False
+        elif kind == replay.TURN:
+            w.turn_team = data[0]
+        elif kind == replay.GOAL:
+            _scorer, self.score_blue, self.score_red, _source = data
+        elif kind == replay.KICKOFF:
+            self.world = GameWorld(you_team=self.you_team, start_turn_team=data[0])
+            self._resting = False
+        elif kind == replay.RESET:
+            w.import_positions(replay.positions_payload(*data))
+            self._resting = False
+        elif kind == replay.SNAP:
+            # it was accepted live, so the world was at rest there; the rest
+            # counter behind any_moving() counts frames, which a replay has not got
+            w._below_eps_frames = max(w._below_eps_frames, CFG.sleep_frames)
+            w.apply_snapshot_soft(replay.positions_payload(*data))
+            self._resting = False
+        elif kind == replay.HASH:
+            self.hash_checks += 1
+            if replay.state_digest(w) != data[0]:
+                self.mismatches.append(rec.tick)
+        elif kind == replay.END:
+            self.winner, self.score_blue, self.score_red = data
+        elif kind == replay.REPAIR:
+            for did, x, y, vx, vy in data[0]:
+                d = w.get(did)
+                if d is not None:
+                    d.pos.update(x, y)
+                    d.vel.update(vx, vy)
+            self._resting = False
+        elif kind == replay.KEYFRAME:
+            # reached by playing, so it is one more check on the simulation
+            self.hash_checks += 1
+            if _motion(_world_from_keyframe(self.you_team, data[0], data[3])) != _motion(w):
+                self.mismatches.append(rec.tick)
+
+    def play_to(self, target: Optional[int] = None):
+        """Apply every record up to tick target (all of them for None), simulating in between."""
+        while self._next is not None and (target is None or self._next.tick <= target):
+            rec = self._next
+            self._next = self._pull()
+            self.advance(rec.tick)
+            self.apply(rec)
+        if target is not None:
+            self.advance(target)
+
+    def seek(self, target: int):
+        """Go to tick target, simulating from the nearest keyframe (or from here, if that is closer)."""
+        key = self.reader.keyframe_before(target)
+        if target < self.tick or (key is not None and key[0] > self.tick):
+            if key is None:
+                self._kickoff()
+            else:
+                self._load_keyframe(*key)
+        self.play_to(target)
+
+    def run(self) -> "ReplayPlayer":
+        self.play_to()
+        return self
+
+
+def _world_from_keyframe(you_team: int, turn: int, rows: List[tuple]) -> GameWorld:
+    snap = replay.keyframe_snapshot(turn, rows)
+    w = GameWorld(you_team=you_team, start_turn_team=turn)
+    w.import_positions(snap)
+    for item in snap["discs"]:
+        d = w.get(item["id"])
+        if d is not None:
+            d.vel.update(item["vx"], item["vy"])
+    return w
+
+
+def _clock(tick: int, tick_rate: int) -> str:
+    s = tick / tick_rate
+    return f"{int(s // 60)}:{s % 60:06.3f}"
+
+
+def _describe(rec: replay.Record) -> str:
+    kind, data = rec.kind, rec.data
+    if kind == replay.SHOT:
+        who = "local" if data[3] == replay.LOCAL else "peer"
+        return f"piece={data[0]} angle={data[1]:.4f} power={data[2]:.3f} ({who})"
+    if kind in (replay.RESET, replay.SNAP):
+        return f"turn={data[0]} discs={len(data[1])}"
+    if kind == replay.KEYFRAME:
+        return f"turn={data[0]} score={data[1]}-{data[2]} discs={len(data[3])}"
+    if kind == replay.REPAIR:
+        return "discs=" + ",".join(str(r[0]) for r in data[0])
+    if kind == replay.HASH:
+        return data[0].hex()
+    return " ".join(str(x) for x in data)
+
+
+def play(path: str, events: bool = False) -> bool:
+    reader = replay.ReplayReader.map(path)
+    h = reader.header
+    rate = int(h.get("tick_rate", replay.TICK_RATE))
+    if events:
+        for rec in reader:
+            print(f"  {_clock(rec.tick, rate)}  {replay.KIND_NAMES.get(rec.kind, rec.kind):<9}{_describe(rec)}")
+
+    t0 = time.perf_counter()
+    p = ReplayPlayer(reader).run()
+    wall = time.perf_counter() - t0
+    match_s = p.tick / rate
+
+    print(f"{path}: match {h.get('match_id')}  {h.get('me')} (team {p.you_team}) vs {h.get('peer')}  "
+          f"{len(reader.data)} bytes  {p.records} records  {len(reader.keyframes)} keyframes"
+          f"{'  (truncated)' if reader.truncated else ''}")
+    reader.close()
+    result = "unfinished" if p.winner is None else ("BLUE" if p.winner == 0 else "RED") + " wins"
+    print(f"  {_clock(p.tick, rate)}  score {p.score_blue}-{p.score_red}  {result}")
+    print(f"  simulated {p.steps}/{p.tick} ticks in {wall * 1000:.1f}ms  "
+          f"({match_s / wall if wall > 0 else float('inf'):.0f}x realtime)")
+    if p.mismatches:
+        first = p.mismatches[0]
+        print(f"  hashes: {p.hash_checks} checked, {len(p.mismatches)} MISMATCHED, "
+              f"first at tick {first} ({_clock(first, rate)})")
+        if reader.version < replay.STEADY_PHYSICS:
+            print(f"  (version {reader.version} replay: recorded with frame-rate dependent physics)")
+    else:
+        print(f"  hashes: {p.hash_checks} checked, all match")
+    return not p.mismatches
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Re-simulate recorded matches and verify their state hashes.")
+    ap.add_argument("files", nargs="+", help=".ssr replay files")
+    ap.add_argument("--events", action="store_true", help="print every record")
+    args = ap.parse_args()
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    ok = True
+    for path in args.files:
+        try:
+            ok = play(path, args.events) and ok
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}")
+            ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# client/replay_viewer.py
+"""
+Replay viewer: plays a recorded match in a window and scrubs through it.
+
+    python client/replay_viewer.py replays/20261019-101500-1a2b3c4d-alice.ssr
+    python client/replay_viewer.py --bench 200 replays/...ssr   # headless seek timing
+
+The file is mmap'ed, not read. A seek looks up the nearest keyframe in
+the index footer and simulates forward from there, so jumping to minute
+25 costs the same as jumping to minute 2.
+
+Keys: SPACE pause, LEFT/RIGHT -/+10s, UP/DOWN speed, 0-9 jump to 0-90%,
+HOME restart, click the timeline to seek, ESC quit.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pygame
+
+from shared.constants import WIDTH, HEIGHT, FPS, WHITE, BLACK, GRAY, ORANGE
+from client import replay
+from client.replay_player import ReplayPlayer
+
+SEEK_STEP = 10.0   # seconds for LEFT / RIGHT
+SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+BAR_H = 8
+
+
+def _fmt(tick: int, rate: int) -> str:
+    s = tick // rate
+    return f"{s // 60}:{s % 60:02d}"
+
+
+class ReplayViewer:
+    def __init__(self, path: str):
+        self.reader = replay.ReplayReader.map(path)
+        self.player = ReplayPlayer(self.reader)
+        self.rate = int(self.reader.header.get("tick_rate", replay.TICK_RATE))
+        self.total = self.reader.last_tick
+        self.speed_i = SPEEDS.index(1.0)
+        self.paused = False
+        self.pos = 0.0   # playback position in ticks (fractional between frames)
+        self.seek_ms = 0.0
+
+    def seek(self, tick: float):
+        tick = max(0, min(self.total, int(tick)))
+        t0 = time.perf_counter()
+        self.player.seek(tick)
+        self.seek_ms = (time.perf_counter() - t0) * 1000.0
+        self.pos = float(tick)
+
+    def handle_event(self, event) -> bool:
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                return False
+            if event.key == pygame.K_SPACE:
+                self.paused = not self.paused
+            elif event.key == pygame.K_LEFT:
+                self.seek(self.pos - SEEK_STEP * self.rate)
+            elif event.key == pygame.K_RIGHT:
+                self.seek(self.pos + SEEK_STEP * self.rate)
+            elif event.key == pygame.K_UP:
+                self.speed_i = min(len(SPEEDS) - 1, self.speed_i + 1)
+            elif event.key == pygame.K_DOWN:
+                self.speed_i = max(0, self.speed_i - 1)
+            elif event.key == pygame.K_HOME:
+                self.seek(0)
+            elif pygame.K_0 <= event.key <= pygame.K_9:
+                self.seek(self.total * (event.key - pygame.K_0) / 10)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and event.pos[1] >= HEIGHT - 3 * BAR_H:
+            self.seek(self.total * event.pos[0] / WIDTH)
+        return True
+
+    def update(self, dt: float):
+        if self.paused or self.pos >= self.total:
+            return
+        self.pos = min(self.total, self.pos + dt * self.rate * SPEEDS[self.speed_i])
+        self.player.play_to(int(self.pos))
+
+    def draw(self, surface, font):
+        p = self.player
+        p.world.draw(surface)
+        h = self.reader.header
+        state = "paused" if self.paused else f"x{SPEEDS[self.speed_i]:g}"
+        lines = [
+            f"{h.get('me')} vs {h.get('peer')}  match {h.get('match_id')}",
+            f"{_fmt(p.tick, self.rate)} / {_fmt(self.total, self.rate)}  {state}  "
+            f"score: BLUE {p.score_blue}  -  RED {p.score_red}",
+            f"last seek {self.seek_ms:.1f}ms  keyframes {len(self.reader.keyframes)}  "
+            f"hash mismatches {len(p.mismatches)}",
+        ]
+        y = 10
+        for line in lines:
+            surface.blit(font.render(line, True, WHITE), (10, y))
+            y += 22
+
+        bar = pygame.Rect(0, HEIGHT - BAR_H, WIDTH, BAR_H)
+        pygame.draw.rect(surface, BLACK, bar)
+        if self.total:
+            for tick, _ in self.reader.keyframes:
+                x = int(WIDTH * tick / self.total)
+                pygame.draw.line(surface, GRAY, (x, bar.top), (x, bar.bottom))
+            pygame.draw.rect(surface, ORANGE, (0, bar.top, int(WIDTH * p.tick / self.total), BAR_H))
+
+    def run(self):
+        pygame.init()
+        pygame.display.set_caption("Soccer Stars replay")
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        clock = pygame.time.Clock()
+        font = pygame.font.SysFont(None, 24)
+        try:
+            running = True
+            while running:
+                dt = clock.tick(FPS) / 1000.0
+                for event in pygame.event.get():
+                    running = self.handle_event(event) and running
+                self.update(dt)
+                self.draw(screen, font)
+                pygame.display.flip()
+        finally:
+            pygame.quit()
+            self.reader.close()
+
+
+def _pct(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100.0))]
+
+
+def bench(path: str, n: int, seed: int):
+    """Random seeks with the index against replaying from kickoff each time."""
+    reader = replay.ReplayReader.map(path)
+    rate = int(reader.header.get("tick_rate", replay.TICK_RATE))
+    total = reader.last_tick
+    rng = random.Random(seed)
+    targets = [rng.randint(0, total) for _ in range(n)]
+
+    player = ReplayPlayer(reader)
+    indexed = []
+    for t in targets:
+        t0 = time.perf_counter()
+        player.seek(t)
+        indexed.append((time.perf_counter() - t0) * 1000.0)
+
+    full = []
+    for t in targets[:max(1, n // 10)]:
+        t0 = time.perf_counter()
+        ReplayPlayer(reader).play_to(t)
+        full.append((time.perf_counter() - t0) * 1000.0)
+
+    print(f"{path}: {_fmt(total, rate)} of match, {len(reader.data)} bytes, {len(reader.keyframes)} keyframes")
+    print(f"  keyframe seek ms:   p50={_pct(indexed, 50):.1f}  p95={_pct(indexed, 95):.1f}  max={max(indexed):.1f}  ({n} seeks)")
+    print(f"  from kickoff ms:    p50={_pct(full, 50):.1f}  p95={_pct(full, 95):.1f}  max={max(full):.1f}  ({len(full)} seeks)")
+    print(f"  hash mismatches while seeking: {len(player.mismatches)}")
+    reader.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Watch a recorded match, or time seeking in it.")
+    ap.add_argument("file", help=".ssr replay file")
+    ap.add_argument("--bench", type=int, default=0, metavar="N", help="time N random seeks headlessly instead")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    if args.bench:
+        bench(args.file, args.bench, args.seed)
+    else:
+        ReplayViewer(args.file).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
 # client/screens.py
+import os
+import time
+
 import pygame
 from shared.constants import WIDTH, HEIGHT, WHITE, BLACK, GRAY, DARK, BLUE, GREEN, ORANGE, RED
 from client.ui import Button, TextInput
 from client.game_world import GameWorld
+from client import desync, replay
+from client.bot import BotPeer
+from shared.statehash import HashRing, disc_digests, hash_hex
+
+
+def start_practice(app):
+    """Offline match against client/bot.py; needs neither the server nor a second player."""
+    bot = BotPeer(team=1, budget=app.bot_budget, workers=app.bot_workers)
+    match = {"match_id": "practice", "peer_username": bot.name, "you_start": True, "practice": True}
+    app.change_screen("game", match=match, peer=bot)
 
 
 class Screen:
@@ -25,6 +38,8 @@ class SplashScreen(Screen):
         self.small_font = pygame.font.SysFont(None, 26)
         self.connect_btn = Button((WIDTH//2 - 160, HEIGHT//2 + 70, 320, 55),
                                   "Connect + Go to Login", self.small_font, BLUE, WHITE)
+        self.practice_btn = Button((WIDTH//2 - 160, HEIGHT//2 + 140, 320, 45),
+                                   "Practice vs bot", self.small_font, ORANGE, BLACK)
         self.status = "Not connected"
 
     def on_enter(self, **kwargs):
@@ -41,6 +56,8 @@ class SplashScreen(Screen):
                 self.status = "Connected ✅" if ok else "Connect failed ❌"
             if self.app.net.connected:
                 self.app.change_screen("login")
+        elif self.practice_btn.is_clicked(event):
+            start_practice(self.app)
 
     def draw(self, surface):
         surface.fill(DARK)
@@ -49,6 +66,7 @@ class SplashScreen(Screen):
         st = self.small_font.render(self.status, True, GRAY)
         surface.blit(st, st.get_rect(center=(WIDTH//2, HEIGHT//2)))
         self.connect_btn.draw(surface)
+        self.practice_btn.draw(surface)
 
 
 # -------------------- Login --------------------
@@ -85,21 +103,28 @@ class LoginScreen(Screen):
             if not pw:
                 self.msg = "Password is required."
                 return
+            if self.waiting_for:
+                return
             self.waiting_for = "LOGIN"
-            self.app.net.send({"type": "LOGIN", "username": u, "password": pw})
+            self.app.net.request({"type": "LOGIN", "username": u, "password": pw},
+                                 lambda reply: self._on_login_reply(u, reply))
+            # pipelined behind LOGIN; harmless "Login first" error if the login fails
+            self.app.net.request({"type": "SET_UDP_PORT", "udp_port": self.app.my_udp_port})
 
         if self.goto_signup_btn.is_clicked(event):
             self.app.change_screen("signup")
 
-    def on_network(self, msg):
-        t = msg.get("type")
-        if t == "OK" and self.waiting_for == "LOGIN":
-            self.waiting_for = None
-            self.app.me = self.username.value()
-            self.app.net.send({"type": "SET_UDP_PORT", "udp_port": self.app.my_udp_port})
+    def _on_login_reply(self, username, reply):
+        self.waiting_for = None
+        if reply.get("type") == "OK":
+            self.app.me = username
+            self.app.resume_token = reply.get("token")
             self.app.change_screen("lobby")
-        elif t == "ERROR":
-            self.waiting_for = None
+        else:
+            self.msg = reply.get("message", "Error")
+
+    def on_network(self, msg):
+        if msg.get("type") == "ERROR":
             self.msg = msg.get("message", "Error")
 
     def draw(self, surface):
@@ -153,17 +178,22 @@ class SignupScreen(Screen):
             if not pw:
                 self.msg = "Password is required."
                 return
+            if self.waiting_for:
+                return
             self.waiting_for = "REGISTER"
             self.msg = "Registering..."
-            self.app.net.send({"type": "REGISTER", "username": u, "email": e, "password": pw})
+            self.app.net.request({"type": "REGISTER", "username": u, "email": e, "password": pw},
+                                 self._on_register_reply)
 
-    def on_network(self, msg):
-        t = msg.get("type")
-        if t == "OK" and self.waiting_for == "REGISTER":
-            self.waiting_for = None
+    def _on_register_reply(self, reply):
+        self.waiting_for = None
+        if reply.get("type") == "OK":
             self.app.change_screen("login", message="Signup success ✅ Now login.")
-        elif t == "ERROR":
-            self.waiting_for = None
+        else:
+            self.msg = reply.get("message", "Error")
+
+    def on_network(self, msg):
+        if msg.get("type") == "ERROR":
             self.msg = msg.get("message", "Error")
 
     def draw(self, surface):
@@ -189,43 +219,111 @@ class LobbyScreen(Screen):
         self.small_font = pygame.font.SysFont(None, 24)
 
         self.users = []
-        self.timer = 0.0
         self.msg = "Click a free user to invite."
 
         self.incoming_from = None
         self.accept_btn = Button((WIDTH//2 - 170, HEIGHT//2 + 40, 160, 50), "Accept", self.small_font, GREEN, WHITE)
         self.decline_btn = Button((WIDTH//2 + 10,  HEIGHT//2 + 40, 160, 50), "Decline", self.small_font, RED, WHITE)
 
+        self.searching = False
+        self.quick_btn = Button((WIDTH - 200, 30, 170, 44), "Quick match", self.small_font, BLUE, WHITE)
+        self.practice_btn = Button((WIDTH - 200, 84, 170, 44), "Practice vs bot", self.small_font, ORANGE, BLACK)
+
     def on_enter(self, **kwargs):
-        self.timer = 0.0
         self.incoming_from = None
+        self._set_searching(False)
+
+        self.msg = "Click a free user to invite."
 
-        # ✅ Auto-reconnect TCP if it dropped
+        # ✅ Auto-reconnect TCP if it dropped, and take our session back
         if not self.app.net.connected:
             ok = self.app.net.connect(self.app.server_host, self.app.server_port)
             if not ok:
                 self.msg = "Not connected to server."
                 return
+            if not self.app.resume_token:
+                self.app.change_screen("login", message="Reconnected. Please login again.")
+                return
+            self.app.net.request({"type": "RESUME", "token": self.app.resume_token}, self._on_resume)
 
-            # after reconnect, re-identify session (simple approach):
-            # your server doesn't support token sessions, so we just show message.
-            # user can re-login if needed.
-            self.msg = "Reconnected. If you were logged out, login again."
+        # full list once, then the server pushes PRESENCE_DELTA events
+        self.app.net.request({"type": "SUBSCRIBE_PRESENCE"}, self._on_users)
 
-        # refresh list
-        self.app.net.send({"type": "LIST_USERS"})
-        self.msg = "Click a free user to invite."
+    def _on_resume(self, reply):
+        if reply.get("type") != "OK":
+            self.app.resume_token = None
+            self.app.change_screen("login", message=reply.get("message", "Session expired, login again"))
+            return
+        self.app.resume_token = reply.get("token")
+        self.msg = "Reconnected."
+        if reply.get("status") == "busy":
+            # the match ended while we were offline; we're in the lobby, so we're free
+            self.app.net.send({"type": "MATCH_END"})
+        if reply.get("invite_from"):
+            self.incoming_from = reply.get("invite_from")
+
+    def _on_users(self, reply):
+        if reply.get("type") == "USERS":
+            self.users = reply.get("users", [])
+        elif reply.get("type") == "ERROR":
+            self.msg = reply.get("message", "Error")
+
+    def _apply_presence(self, events):
+        by_name = {u["username"]: u for u in self.users}
+        for e in events:
+            name = e.get("username")
+            if not name:
+                continue
+            if e.get("ev") == "LEAVE":
+                by_name.pop(name, None)
+            else:
+                by_name[name] = {"username": name, "status": e.get("status", "free")}
+        self.users = list(by_name.values())
+
+    def _on_reply(self, reply):
+        if reply.get("type") == "ERROR":
+            self.msg = reply.get("message", "Error")
+
+    def _set_searching(self, on: bool):
+        self.searching = on
+        self.quick_btn.text = "Cancel search" if on else "Quick match"
+        self.quick_btn.bg = ORANGE if on else BLUE
+
+    def _on_quickmatch_reply(self, reply):
+        if reply.get("type") == "ERROR":
+            self._set_searching(False)
+            self.msg = reply.get("message", "Error")
 
     def handle_event(self, event):
         if self.incoming_from:
             if self.accept_btn.is_clicked(event):
-                self.app.net.send({"type": "INVITE_RESPONSE", "from": self.incoming_from, "accepted": True})
+                self.app.net.request({"type": "INVITE_RESPONSE", "from": self.incoming_from, "accepted": True},
+                                     self._on_reply)
                 self.incoming_from = None
             elif self.decline_btn.is_clicked(event):
-                self.app.net.send({"type": "INVITE_RESPONSE", "from": self.incoming_from, "accepted": False})
+                self.app.net.request({"type": "INVITE_RESPONSE", "from": self.incoming_from, "accepted": False},
+                                     self._on_reply)
                 self.incoming_from = None
             return
 
+        if self.quick_btn.is_clicked(event):
+            if self.searching:
+                self.app.net.request({"type": "QUICKMATCH_CANCEL"}, self._on_reply)
+                self._set_searching(False)
+                self.msg = "Click a free user to invite."
+            else:
+                self.app.net.request({"type": "QUICKMATCH"}, self._on_quickmatch_reply)
+                self._set_searching(True)
+                self.msg = "Searching for an opponent..."
+            return
+
+        if self.practice_btn.is_clicked(event):
+            if self.searching:
+                self.app.net.request({"type": "QUICKMATCH_CANCEL"}, self._on_reply)
+                self._set_searching(False)
+            start_practice(self.app)
+            return
+
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             if not self.app.net.connected:
                 self.msg = "Not connected to server."
@@ -245,26 +343,32 @@ class LobbyScreen(Screen):
                     if u.get("status") != "free":
                         self.msg = f"{target} is busy."
                         return
-                    self.app.net.send({"type": "INVITE", "to": target})
+                    self.app.net.request({"type": "INVITE", "to": target}, self._on_reply)
                     self.msg = f"Invite sent to {target}..."
                     return
 
-    def update(self, dt):
-        self.timer += dt
-        if self.timer >= 1.0:
-            self.timer = 0.0
-            if self.app.net.connected:
-                self.app.net.send({"type": "LIST_USERS"})
-
     def on_network(self, msg):
         t = msg.get("type")
         if t == "USERS":
             self.users = msg.get("users", [])
+        elif t == "PRESENCE_DELTA":
+            self._apply_presence(msg.get("events", []))
         elif t == "INVITE_RECEIVED":
             self.incoming_from = msg.get("from")
         elif t == "INVITE_DECLINED":
             self.msg = f"Invite declined by {msg.get('by')}"
+        elif t == "INVITE_CANCELLED":
+            if self.incoming_from == msg.get("from"):
+                self.incoming_from = None
+                if msg.get("reason") == "expired":
+                    self.msg = f"Invite from {msg.get('from')} expired"
+        elif t == "INVITE_EXPIRED":
+            self.msg = f"{msg.get('to')} did not answer your invite"
+        elif t == "QUICKMATCH_TIMEOUT":
+            self._set_searching(False)
+            self.msg = "No opponent found. Try again."
         elif t == "MATCH_START":
+            self._set_searching(False)
             self.app.match_info = msg
             self.app.change_screen("game", match=msg)
         elif t == "ERROR":
@@ -278,6 +382,9 @@ class LobbyScreen(Screen):
         msg = self.small_font.render(self.msg, True, GRAY)
         surface.blit(msg, (WIDTH//2 - 300, 160))
 
+        self.quick_btn.draw(surface)
+        self.practice_btn.draw(surface)
+
         start_y = 200
         row_h = 36
         header = self.small_font.render("Online users (click to invite):", True, WHITE)
@@ -315,6 +422,7 @@ class LobbyScreen(Screen):
 class GameScreen(Screen):
     name = "game"
     WIN_SCORE = 2
+    HASH_EVERY = 120  # physics steps between STATE_HASH messages
 
     def __init__(self, app):
         super().__init__(app)
@@ -323,6 +431,8 @@ class GameScreen(Screen):
 
         self.match = None
         self.world = None
+        # app.udp_peer, or a BotPeer in practice; both take the same calls
+        self.peer = None
 
         self.p2p_status = "Starting…"
 
@@ -332,14 +442,26 @@ class GameScreen(Screen):
 
         # fixed timestep
         self.accum = 0.0
-        self.fixed_dt = 1.0 / 120.0
-
-        # Phase 7
-        self.hash_timer = 0.0
-        self.local_tick = 0
-        self.last_peer_hash = None
-        self.last_local_hash = None
+        self.fixed_dt = 1.0 / replay.TICK_RATE
+        self.sim_tick = 0  # physics steps since kickoff; replay records are stamped with it
+
+        # ReplayWriter for this match, None when not recording
+        self.replay = None
+
+        # Phase 7: a hash (and the disc rows) of every physics step, keyed by (shot_no, shot_step),
+        # the same on both peers whenever each applied that shot at rest (sim_tick is not)
+        self.shot_no = 0
+        self.shot_step = 0
+        self.shot_local = False  # we took shot shot_no, so our world is the authoritative one
+        self.hashes = HashRing()
+        self.peer_hash = None  # (shot_no, shot_step, hash) from the peer, waiting for us to get there
+        self.agreed_step = -1  # last step of this shot whose hashes matched
+        self.world_since = 0   # first step of this shot simulated by the current world (no kickoff/reset/correction since)
+        self.bisect = None     # desync.Bisector while we look for the first bad step
+        self.resync_wanted = False
         self.snapshot_cooldown = 0.0
+        # hash mismatches seen, bisections started, repaired, given up on (snapshot); all matches, for net_bench
+        self.sync_stats = {"mismatches": 0, "bisections": 0, "repairs": 0, "fallbacks": 0}
 
         # Phase 8
         self.score_blue = 0
@@ -353,18 +475,28 @@ class GameScreen(Screen):
         self.return_timer = 0.0
         self._returned = False
 
+        # F3 toggles the connection-quality HUD line
+        self.show_net_stats = False
+
     def on_enter(self, **kwargs):
         self.match = kwargs.get("match")
+        self.peer = kwargs.get("peer") or self.app.udp_peer
 
         self.p2p_status = "Starting…"
         self.shot_in_progress = False
         self.prev_moving = False
         self.accum = 0.0
-
-        self.hash_timer = 0.0
-        self.local_tick = 0
-        self.last_peer_hash = None
-        self.last_local_hash = None
+        self.sim_tick = 0
+
+        self.shot_no = 0
+        self.shot_step = 0
+        self.shot_local = False
+        self.hashes.clear()
+        self.peer_hash = None
+        self.agreed_step = -1
+        self.world_since = 0
+        self.bisect = None
+        self.resync_wanted = False
         self.snapshot_cooldown = 0.0
 
         self.score_blue = 0
@@ -378,18 +510,60 @@ class GameScreen(Screen):
         self._returned = False
 
         # start UDP match
-        self.app.udp_peer.begin_match(
+        self.peer.begin_match(
             match_id=self.match.get("match_id"),
             peer_ip=self.match.get("peer_ip"),
             peer_port=self.match.get("peer_udp_port"),
             my_username=self.app.me,
+            relay_addr=(self.app.server_host, self.match["relay_port"]) if self.match.get("relay_port") else None,
+            relay_token=self.match.get("relay_token"),
         )
 
         you_team = 0 if self.match.get("you_start") else 1
         from client.game_world import GameWorld
         self.world = GameWorld(you_team=you_team, start_turn_team=0)
-
-
+        self._record_step(0)
+        self._open_replay(you_team)
+
+    def on_exit(self):
+        self._close_replay()
+        if self.peer is not None and self.peer is not self.app.udp_peer:
+            self.peer.stop()
+        self.peer = None
+
+    # ---------- replay ----------
+    def _open_replay(self, you_team: int):
+        """Record this match under app.replay_dir (REPLAY_DIR); unset or empty disables it."""
+        self._close_replay()
+        folder = getattr(self.app, "replay_dir", None)
+        if not folder:
+            return
+        match_id = self.match.get("match_id") or "local"
+        me = self.app.me or "me"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{match_id}-{me}.ssr"
+        try:
+            os.makedirs(folder, exist_ok=True)
+            self.replay = replay.ReplayWriter.open(os.path.join(folder, name), {
+                "match_id": match_id,
+                "me": me,
+                "peer": self.match.get("peer_username"),
+                "you_team": you_team,
+                "start_turn": 0,
+                "win_score": self.WIN_SCORE,
+            })
+        except OSError as e:
+            print(f"! replay not recorded: {e}")
+            self.replay = None
+
+    def _close_replay(self):
+        if self.replay is not None:
+            self.replay.close()
+            self.replay = None
+
+    def _end_replay(self):
+        if self.replay is not None:
+            self.replay.end(self.sim_tick, self.world, self.winner_team, self.score_blue, self.score_red)
+            self._close_replay()
 
     # ---------- helpers ----------
     def _set_free_and_back_to_lobby(self):
@@ -401,6 +575,11 @@ class GameScreen(Screen):
             return
         self._returned = True
 
+        if self.match.get("practice"):
+            # the server never knew about this match
+            self.app.change_screen("lobby" if self.app.me and self.app.net.connected else "splash")
+            return
+
         # tell server we are free again
         if self.app.net.connected:
             self.app.net.send({"type": "MATCH_END"})
@@ -408,6 +587,157 @@ class GameScreen(Screen):
         # go back to lobby and refresh list
         self.app.change_screen("lobby")
 
+    # ---------- state hashes ----------
+    def _new_shot(self, local: bool):
+        self.shot_no += 1
+        self.shot_step = 0
+        self.shot_local = local
+        self.hashes.clear()
+        self.agreed_step = -1
+        self.world_since = 0
+        self.bisect = None  # its steps are gone; if we still differ, this shot's hashes say so
+        self._record_step(0)
+
+    def _record_step(self, step: int):
+        self.hashes.push(step, self.world.state_hash64(), desync.world_rows(self.world))
+
+    def _hash_step(self):
+        """After every physics step: record its hash, send every HASH_EVERY-th one."""
+        self.shot_step += 1
+        self._record_step(self.shot_step)
+        if self.world._corr_active:
+            self.world_since = self.shot_step + 1  # the next step still moves discs outside physics
+        if self.shot_step % self.HASH_EVERY == 0:
+            self.peer.send_state_hash(self.shot_no, self.shot_step, hash_hex(self.hashes.get(self.shot_step)))
+        if self.peer_hash is not None and self.peer_hash[1] == self.shot_step:
+            self._check_peer_hash()
+
+    def _authoritative(self) -> bool:
+        """The shooter's world wins a desync; before the first shot, BLUE's."""
+        return self.shot_local if self.shot_no else self.world.you_team == 0
+
+    def _check_peer_hash(self):
+        """Compare the peer's hash with ours at the same tick, once we have got there."""
+        shot, step, h = self.peer_hash
+        if shot > self.shot_no or (shot == self.shot_no and step > self.shot_step):
+            return  # the peer is ahead; _hash_step comes back here
+        self.peer_hash = None
+        mine = self.hashes.get(step) if shot == self.shot_no else None
+        if mine is None:
+            return
+        if hash_hex(mine) == h:
+            self.agreed_step = max(self.agreed_step, step)
+            if self.bisect is not None and step > self.bisect.detected:
+                self.bisect = None  # back in step by themselves (e.g. a goal seen a frame apart)
+                self.resync_wanted = False
+            return
+        self.sync_stats["mismatches"] += 1
+        if not self._authoritative() and self.bisect is None:
+            self.sync_stats["bisections"] += 1
+            self.bisect = desync.Bisector(shot, self.agreed_step, step)
+            self._bisect_send()
+
+    # ---------- desync bisection (client/desync.py) ----------
+    def _bisect_send(self):
+        b = self.bisect
+        if b.done():
+            digests = disc_digests(self.hashes.state(b.hi) or ())
+            n = self.peer.send_desync_fetch(b.shot, b.hi, [[did, hash_hex(v)] for did, v in sorted(digests.items())])
+        else:
+            n = self.peer.send_desync_probe(b.shot, b.probe_ticks())
+        b.bytes += n or 0
+        b.wait = desync.TIMEOUT
+
+    def _bisect_failed(self, why: str):
+        print(f"! desync in shot {self.bisect.shot} at step {self.bisect.detected}: {why}; asking for a snapshot")
+        self.sync_stats["fallbacks"] += 1
+        self.bisect = None
+        self.resync_wanted = True
+
+    def _bisect_timer(self, dt: float):
+        b = self.bisect
+        b.wait -= dt
+        if b.wait > 0.0:
+            return
+        if b.tries >= desync.TRIES:
+            self._bisect_failed("the peer did not answer")
+            return
+        b.tries += 1
+        self._bisect_send()
+
+    def _hashes_at(self, ticks) -> list:
+        return [None if h is None else hash_hex(h) for h in (self.hashes.get(t) for t in ticks)]
+
+    def _on_desync_msg(self, t: str, msg: dict):
+        try:
+            shot = int(msg["shot"])
+        except (KeyError, TypeError, ValueError):
+            return
+        b = self.bisect
+
+        # the shooter's side: answer from our history
+        if t == "DESYNC_PROBE":
+            if shot == self.shot_no:
+                ticks = [int(x) for x in msg.get("ticks", [])][:desync.PROBES]
+                self.peer.send_desync_hashes(shot, ticks, self._hashes_at(ticks))
+
+        elif t == "DESYNC_FETCH":
+            rows = self.hashes.state(int(msg.get("tick", -1))) if shot == self.shot_no else None
+            if rows is not None:
+                theirs = {int(did): h for did, h in msg.get("digests", [])}
+                mine = disc_digests(rows)
+                differ = [list(r) for r in rows if hash_hex(mine[r[0]]) != theirs.get(r[0])]
+                self.peer.send_desync_state(shot, int(msg["tick"]), differ)
+
+        # the searching side
+        elif t == "DESYNC_HASHES":
+            if b is None or shot != b.shot or b.done() or [int(x) for x in msg.get("ticks", [])] != b.ticks:
+                return
+            ticks = b.ticks
+            if not b.narrow(list(msg.get("hashes", [])), self._hashes_at(ticks)):
+                self._bisect_failed("those steps are no longer in the history")
+                return
+            b.tries = 0
+            self._bisect_send()
+
+        elif t == "DESYNC_STATE":
+            if b is None or shot != b.shot or not b.done() or int(msg.get("tick", -1)) != b.hi:
+                return
+            try:
+                theirs = {int(r[0]): tuple(float(v) for v in r[1:5]) for r in msg.get("discs", [])}
+            except (TypeError, ValueError, IndexError):
+                return
+            self._repair(theirs)
+
+    def _repair(self, theirs: dict):
+        """Put the discs that differ at the first bad step where the shooter had them, and re-simulate to now."""
+        b = self.bisect
+        w = self.world
+        ours = self.hashes.state(b.hi)
+        if ours is None or b.hi < self.world_since or w._corr_active:
+            self._bisect_failed(f"cannot re-simulate from step {b.hi}")
+            return
+        self.bisect = None
+        self.sync_stats["repairs"] += 1
+        before = desync.world_rows(w)
+        for did, x, y, vx, vy in ours:
+            d = w.get(did)
+            x, y, vx, vy = theirs.get(did, (x, y, vx, vy))
+            d.pos.update(x, y)
+            d.vel.update(vx, vy)
+        self._record_step(b.hi)
+        for step in range(b.hi + 1, self.shot_step + 1):
+            w.update(self.fixed_dt)
+            self._record_step(step)
+        self.agreed_step = b.hi
+        self.resync_wanted = False
+        for line in desync.report(self.shot_no, b, ours, theirs, self.shot_step - b.hi):
+            print(line)
+        if self.replay:
+            changed = [now for now, was in zip(desync.world_rows(w), before) if now != was]
+            if changed:
+                self.replay.repair(self.sim_tick, changed)
+
     # ---------- UDP handling ----------
     def _handle_udp(self, msg: dict):
         if not self.world:
@@ -422,25 +752,35 @@ class GameScreen(Screen):
             ok = self.world.apply_shot(piece_id, angle, power)
             if ok:
                 self.shot_in_progress = True
+                self._new_shot(local=False)
+                if self.replay:
+                    self.replay.shot(self.sim_tick, piece_id, angle, power, replay.PEER)
 
         # Phase 7
         elif t == "STATE_HASH":
-            self.last_peer_hash = msg.get("hash")
+            try:
+                self.peer_hash = (int(msg["shot"]), int(msg["tick"]), str(msg["hash"]))
+            except (KeyError, TypeError, ValueError):
+                return
+            self._check_peer_hash()
 
-            if (not self.world.any_moving()) and self.last_local_hash and self.last_peer_hash:
-                if self.last_local_hash != self.last_peer_hash and self.snapshot_cooldown <= 0.0:
-                    self.app.udp_peer.send_snapshot_req(self.local_tick)
-                    self.snapshot_cooldown = 0.7
+        elif t in ("DESYNC_PROBE", "DESYNC_HASHES", "DESYNC_FETCH", "DESYNC_STATE"):
+            self._on_desync_msg(t, msg)
 
         elif t == "SNAPSHOT_REQ":
             if not self.world.any_moving():
                 snap = self.world.make_snapshot()
-                self.app.udp_peer.send_snapshot(int(msg.get("tick", 0)), snap)
+                ack = msg.get("ack")
+                self.peer.send_snapshot(int(msg.get("tick", 0)), snap,
+                                        ack=int(ack) if ack is not None else None)
 
         elif t == "STATE_SNAPSHOT":
             snap = msg.get("state")
             if isinstance(snap, dict):
-                self.world.apply_snapshot_soft(snap, pos_threshold=6.0)
+                if self.world.apply_snapshot_soft(snap, pos_threshold=6.0):
+                    self.world_since = self.shot_step + 1
+                    if self.replay:
+                        self.replay.snapshot(self.sim_tick, snap)
 
         # Phase 8
         elif t == "GOAL":
@@ -449,13 +789,19 @@ class GameScreen(Screen):
             self.score_red = int(msg.get("score_red", self.score_red))
             self.banner = "GOAL! " + ("BLUE" if scorer == 0 else "RED")
             self.banner_timer = 1.4
+            if self.replay:
+                self.replay.goal(self.sim_tick, scorer, self.score_blue, self.score_red, replay.PEER)
 
         elif t == "RESET":
             payload = msg.get("payload")
             if isinstance(payload, dict):
                 self.world.import_positions(payload)
+                self.world_since = self.shot_step + 1
                 self.shot_in_progress = False
                 self.prev_moving = False
+                if self.replay:
+                    self.replay.reset(self.sim_tick, payload)
+                    self.replay.keyframe(self.sim_tick, self.world, self.score_blue, self.score_red)
 
         elif t == "END":
             # show end overlay, then auto return to lobby
@@ -464,6 +810,7 @@ class GameScreen(Screen):
             self.score_blue = int(msg.get("score_blue", self.score_blue))
             self.score_red = int(msg.get("score_red", self.score_red))
             self.return_timer = 2.0  # show winner 2 seconds then go lobby
+            self._end_replay()
 
     # ---------- Input ----------
     def handle_event(self, event):
@@ -472,6 +819,10 @@ class GameScreen(Screen):
 
         # allow ESC immediate exit still (your global handler will stop app)
 
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.show_net_stats = not self.show_net_stats
+            return
+
         if self.game_over:
             # ignore mouse controls after game over
             return
@@ -484,19 +835,28 @@ class GameScreen(Screen):
 
         elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
             shot = self.world.on_mouse_up(event.pos)
-            if shot and self.world.can_shoot_now():
-                piece_id, angle, power = shot
-                ok = self.world.apply_shot(piece_id, angle, power)
-                if ok:
-                    self.app.udp_peer.send_shot(piece_id, angle, power)
-                    self.shot_in_progress = True
+            if shot:
+                self.take_shot(*shot)
+
+    def take_shot(self, piece_id: int, angle: float, power: float) -> bool:
+        """Apply a local shot and send it to the peer (also used by headless drivers)."""
+        if not self.world or self.game_over or not self.world.can_shoot_now():
+            return False
+        ok = self.world.apply_shot(piece_id, angle, power)
+        if ok:
+            self.peer.send_shot(piece_id, angle, power)
+            self.shot_in_progress = True
+            self._new_shot(local=True)
+            if self.replay:
+                self.replay.shot(self.sim_tick, piece_id, angle, power, replay.LOCAL)
+        return ok
 
     # ---------- Update ----------
     def update(self, dt):
-        self.p2p_status = "P2P connected ✅" if self.app.udp_peer.connected else self.app.udp_peer.status_text
+        self.p2p_status = self.peer.status_text
 
         # pump UDP inbox
-        for m in self.app.udp_peer.poll():
+        for m in self.peer.poll():
             self._handle_udp(m)
 
         if not self.world:
@@ -505,6 +865,9 @@ class GameScreen(Screen):
         if self.snapshot_cooldown > 0.0:
             self.snapshot_cooldown -= dt
 
+        if self.bisect is not None:
+            self._bisect_timer(dt)
+
         if self.banner_timer > 0.0:
             self.banner_timer -= dt
             if self.banner_timer <= 0:
@@ -518,6 +881,10 @@ class GameScreen(Screen):
         while self.accum >= self.fixed_dt:
             if not self.game_over:
                 self.world.update(self.fixed_dt)
+                self.sim_tick += 1
+                self._hash_step()
+                if self.replay:
+                    self.replay.stepped(self.sim_tick, self.world)
             self.accum -= self.fixed_dt
 
         moving = self.world.any_moving()
@@ -526,6 +893,9 @@ class GameScreen(Screen):
         if (not self.game_over) and self.shot_in_progress and self.prev_moving and (not moving):
             self.world.turn_team = 1 - self.world.turn_team
             self.shot_in_progress = False
+            if self.replay:
+                self.replay.turn(self.sim_tick, self.world.turn_team)
+                self.replay.keyframe(self.sim_tick, self.world, self.score_blue, self.score_red)
 
         self.prev_moving = moving
 
@@ -540,7 +910,9 @@ class GameScreen(Screen):
 
                 self.banner = "GOAL! " + ("BLUE" if scorer == 0 else "RED")
                 self.banner_timer = 1.4
-                self.app.udp_peer.send_goal(scorer, self.score_blue, self.score_red)
+                self.peer.send_goal(scorer, self.score_blue, self.score_red)
+                if self.replay:
+                    self.replay.goal(self.sim_tick, scorer, self.score_blue, self.score_red, replay.LOCAL)
 
                 # win condition
                 if self.score_blue >= self.WIN_SCORE or self.score_red >= self.WIN_SCORE:
@@ -548,7 +920,8 @@ class GameScreen(Screen):
                     self.game_over = True
                     self.winner_team = winner
                     self.return_timer = 2.0
-                    self.app.udp_peer.send_end(winner, self.score_blue, self.score_red)
+                    self.peer.send_end(winner, self.score_blue, self.score_red)
+                    self._end_replay()
                     return
 
                 # reset for next kickoff; scoring team starts
@@ -556,22 +929,22 @@ class GameScreen(Screen):
                 from client.game_world import GameWorld
                 you_team = self.world.you_team
                 self.world = GameWorld(you_team=you_team, start_turn_team=next_turn)
+                self.world_since = self.shot_step + 1
+                if self.replay:
+                    self.replay.kickoff(self.sim_tick, next_turn)
+                    self.replay.keyframe(self.sim_tick, self.world, self.score_blue, self.score_red)
 
                 payload = self.world.export_positions()
-                self.app.udp_peer.send_reset(payload)
+                self.peer.send_reset(payload)
 
                 self.shot_in_progress = False
                 self.prev_moving = False
 
-        # Phase 7: send hash every 1s only between turns
-        self.hash_timer += dt
-        if self.hash_timer >= 1.0:
-            self.hash_timer = 0.0
-            self.local_tick += 1
-
-            if (not self.game_over) and (not self.world.any_moving()):
-                self.last_local_hash = self.world.state_hash()
-                self.app.udp_peer.send_state_hash(self.local_tick, self.last_local_hash)
+        # Phase 7: a hash differed and bisection could not repair it; ask for the shooter's state once at rest
+        if self.resync_wanted and not self.game_over and not moving and self.snapshot_cooldown <= 0.0:
+            self.resync_wanted = False
+            self.peer.send_snapshot_req(self.shot_step)
+            self.snapshot_cooldown = 0.7
 
         # auto return after end
         if self.game_over and self.return_timer > 0.0:
@@ -579,6 +952,15 @@ class GameScreen(Screen):
             if self.return_timer <= 0.0:
                 self._set_free_and_back_to_lobby()
 
+    def _net_stats_line(self) -> str:
+        u = self.peer.stats()
+        t = self.app.net.stats()
+        rtt = u.get("rtt_ms", {}).get("p50", 0.0)
+        wait = u.get("inbox_wait_ms", {}).get("p95", 0.0)
+        return (f"net: rtt {rtt:.0f}ms  {u.get('via', 'direct')}  udp in/out {u.get('bytes_in', 0) // 1024}/{u.get('bytes_out', 0) // 1024}kB  "
+                f"resend {u.get('resends', 0)}  timeout {u.get('timeouts', 0)}  dup {u.get('dup_drops', 0)}  "
+                f"queue {u.get('inbox_queued', 0)} ({wait:.0f}ms)  tcp {'up' if t.get('connected') else 'down'}")
+
     # ---------- Draw ----------
     def draw(self, surface):
         if not self.world:
@@ -593,6 +975,8 @@ class GameScreen(Screen):
             f"score: BLUE {self.score_blue}  -  RED {self.score_red}",
             f"turn: {turn_txt}",
         ]
+        if self.show_net_stats:
+            hud.append(self._net_stats_line())
         y = 10
         for line in hud:
             surface.blit(self.small_font.render(line, True, WHITE), (10, y))
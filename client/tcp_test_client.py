@@ -17,7 +17,7 @@ while True:
     print("\n1) Register")
     print("2) Login")
     print("3) List users")
-    print("4) Set busy")
+    print("4) Set UDP port")
     print("5) Logout")
     choice = input("> ")
 
@@ -43,8 +43,8 @@ while True:
         print(recv(sock))
 
     elif choice == "4":
-        send(sock, {"type": "SET_STATUS", "status": "busy"})
-        print("Status set to busy")
+        send(sock, {"type": "SET_UDP_PORT", "udp_port": int(input("udp port: "))})
+        print(recv(sock))
 
     elif choice == "5":
         send(sock, {"type": "LOGOUT"})
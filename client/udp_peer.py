@@ -6,9 +6,18 @@ import queue
 from typing import Optional, Tuple, Dict, Any, List
 
 from shared.netcodec import dumps_line, loads_line
+from shared.snapshot import SnapshotEncoder, SnapshotDecoder
+from shared.netstats import NetStats
 
 Addr = Tuple[str, int]
 
+# keep coalesced datagrams under a typical path MTU (no IP fragmentation)
+MAX_DATAGRAM = 1200
+
+# HELLO goes direct for DIRECT_TIMEOUT seconds, then through the server's relay
+DIRECT_TIMEOUT = 3.0
+RELAY_TIMEOUT = 8.0
+
 
 class UDPPeer:
     def __init__(self, local_port: int):
@@ -20,22 +29,41 @@ class UDPPeer:
         self.running = False
         self._listen_thread: Optional[threading.Thread] = None
         self._hello_thread: Optional[threading.Thread] = None
+        self._hello_gen: int = 0   # bumped per match: an older HELLO loop sees it and quits
         self._reliable_thread: Optional[threading.Thread] = None
 
         self.match_id: Optional[str] = None
         self.peer_addr: Optional[Addr] = None
         self.my_username: Optional[str] = None
 
+        # server relay (fallback when the peer isn't directly reachable)
+        self.relay_addr: Optional[Addr] = None
+        self.relay_token: Optional[str] = None
+        self.relay_bound: bool = False
+        self.via: str = "direct"
+
         self.connected: bool = False
         self.status_text: str = "Idle"
 
         self._seq: int = 0
-        self.inbox: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+        # outbound lines, packed into datagrams once per frame by flush()
+        self._outq: List[bytes] = []
+        self._out_lock = threading.Lock()
+
+        # (enqueue time, msg)
+        self.inbox: "queue.Queue[Tuple[float, Dict[str, Any]]]" = queue.Queue()
 
         # reliable resend only for SHOT
-        self._pending: Dict[int, Dict[str, Any]] = {}  # seq -> {msg, next_send, tries}
+        self._pending: Dict[int, Dict[str, Any]] = {}  # seq -> {msg, sent_at, next_send, tries}
         self._received_shots: set[int] = set()
 
+        # delta-encoded resync snapshots
+        self._snap_enc = SnapshotEncoder()
+        self._snap_dec = SnapshotDecoder()
+
+        self.net_stats = NetStats()
+
     def start(self):
         if self.running:
             return
@@ -46,34 +74,61 @@ class UDPPeer:
         self._reliable_thread.start()
 
     def stop(self):
+        self.flush()
         self.running = False
         try:
             self.sock.close()
         except Exception:
             pass
 
-    def begin_match(self, match_id: str, peer_ip: str, peer_port: int, my_username: str):
+    def begin_match(self, match_id: str, peer_ip: str, peer_port: int, my_username: str,
+                    relay_addr: Optional[Addr] = None, relay_token: Optional[str] = None):
         self.match_id = str(match_id)
         self.peer_addr = (str(peer_ip), int(peer_port))
         self.my_username = str(my_username)
+        self.relay_addr = (str(relay_addr[0]), int(relay_addr[1])) if relay_addr and relay_token else None
+        self.relay_token = str(relay_token) if self.relay_addr else None
+        self.relay_bound = False
+        self.via = "direct"
 
         self.connected = False
         self.status_text = "Connecting… (sending HELLO)"
         self._received_shots.clear()
         self._pending.clear()
+        self._snap_enc.reset()
+        self._snap_dec.reset()
 
         self.start()
         self._start_hello_loop()
 
     def poll(self) -> List[Dict[str, Any]]:
         msgs: List[Dict[str, Any]] = []
+        now = time.time()
+        self.net_stats.observe("inbox_depth", self.inbox.qsize())
         while True:
             try:
-                msgs.append(self.inbox.get_nowait())
+                t_in, msg = self.inbox.get_nowait()
             except queue.Empty:
                 break
+            self.net_stats.observe("inbox_wait_ms", (now - t_in) * 1000.0)
+            msgs.append(msg)
         return msgs
 
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters: bytes_in/out, packets_in/out, msgs_in/out, resends, timeouts,
+        dup_drops, snapshots_sent, keyframes_sent, desync_msgs, desync_bytes.
+        Histograms (n/p50/p95/max): rtt_ms, inbox_wait_ms, inbox_depth, snapshot_bytes.
+        """
+        out = self.net_stats.snapshot()
+        out["inbox_queued"] = self.inbox.qsize()
+        out["connected"] = self.connected
+        out["via"] = self.via
+        return out
+
+    def _deliver(self, msg: Dict[str, Any]):
+        self.inbox.put((time.time(), msg))
+
     # ---------------- SHOT reliable-ish ----------------
     def send_shot(self, piece_id: int, angle: float, power: float) -> int:
         self._seq += 1
@@ -87,7 +142,8 @@ class UDPPeer:
             "power": float(power),
         }
         self._send(msg)
-        self._pending[seq] = {"msg": msg, "next_send": time.time() + 0.08, "tries": 0}
+        now = time.time()
+        self._pending[seq] = {"msg": msg, "sent_at": now, "next_send": now + 0.08, "tries": 0}
         return seq
 
     def _reliable_loop(self):
@@ -98,23 +154,59 @@ class UDPPeer:
                 if now >= info["next_send"]:
                     if info["tries"] >= 6:
                         to_delete.append(seq)
+                        self.net_stats.incr("timeouts")
                         continue
                     self._send(info["msg"])
                     info["tries"] += 1
+                    self.net_stats.incr("resends")
                     info["next_send"] = now + 0.12
             for seq in to_delete:
                 self._pending.pop(seq, None)
             time.sleep(0.01)
 
     # ---------------- Phase 7 best-effort ----------------
-    def send_state_hash(self, tick: int, hash_str: str):
-        self._send({"type": "STATE_HASH", "match_id": self.match_id, "tick": int(tick), "hash": str(hash_str)})
+    def send_state_hash(self, shot: int, tick: int, hash_str: str):
+        """Our hash tick physics steps after shot number shot was applied."""
+        self._send({"type": "STATE_HASH", "match_id": self.match_id, "shot": int(shot), "tick": int(tick),
+                    "hash": str(hash_str)})
 
     def send_snapshot_req(self, tick: int):
-        self._send({"type": "SNAPSHOT_REQ", "match_id": self.match_id, "tick": int(tick)})
+        msg = {"type": "SNAPSHOT_REQ", "match_id": self.match_id, "tick": int(tick)}
+        if self._snap_dec.ack is not None:
+            msg["ack"] = self._snap_dec.ack
+        self._send(msg)
 
-    def send_snapshot(self, tick: int, state: dict):
-        self._send({"type": "STATE_SNAPSHOT", "match_id": self.match_id, "tick": int(tick), "state": state})
+    def send_snapshot(self, tick: int, state: dict, ack: Optional[int] = None):
+        """state is a GameWorld.make_snapshot() dict; ack is the requester's last decoded seq."""
+        payload = self._snap_enc.encode(state, ack)
+        n = self._send({"type": "STATE_SNAPSHOT", "match_id": self.match_id, "tick": int(tick), "state": payload})
+        self.net_stats.observe("snapshot_bytes", n)
+        self.net_stats.incr("snapshots_sent")
+        if payload.get("k"):
+            self.net_stats.incr("keyframes_sent")
+
+    # ---------------- desync bisection (client/desync.py), best-effort ----------------
+    def _send_desync(self, msg: Dict[str, Any]) -> int:
+        msg["match_id"] = self.match_id
+        n = self._send(msg)
+        self.net_stats.incr("desync_msgs")
+        self.net_stats.incr("desync_bytes", n)
+        return n
+
+    def send_desync_probe(self, shot: int, ticks: List[int]) -> int:
+        return self._send_desync({"type": "DESYNC_PROBE", "shot": int(shot), "ticks": [int(t) for t in ticks]})
+
+    def send_desync_hashes(self, shot: int, ticks: List[int], hashes: List[Optional[str]]) -> int:
+        return self._send_desync({"type": "DESYNC_HASHES", "shot": int(shot), "ticks": [int(t) for t in ticks],
+                                  "hashes": hashes})
+
+    def send_desync_fetch(self, shot: int, tick: int, digests: List[list]) -> int:
+        """digests: [[disc id, hash_hex], ...] of our discs at tick."""
+        return self._send_desync({"type": "DESYNC_FETCH", "shot": int(shot), "tick": int(tick), "digests": digests})
+
+    def send_desync_state(self, shot: int, tick: int, discs: List[list]) -> int:
+        """discs: exact [id, x, y, vx, vy] at tick of the discs whose digests differed."""
+        return self._send_desync({"type": "DESYNC_STATE", "shot": int(shot), "tick": int(tick), "discs": discs})
 
     # ---------------- Phase 8 events ----------------
     def send_goal(self, scorer_team: int, score_blue: int, score_red: int):
@@ -144,38 +236,117 @@ class UDPPeer:
 
     # ---------------- HELLO handshake ----------------
     def _start_hello_loop(self):
-        if self._hello_thread and self._hello_thread.is_alive():
-            return
-        self._hello_thread = threading.Thread(target=self._hello_loop, daemon=True)
+        # a loop from the previous match may still be waiting for its relay bind
+        self._hello_gen += 1
+        self._hello_thread = threading.Thread(target=self._hello_loop, args=(self._hello_gen,), daemon=True)
         self._hello_thread.start()
 
-    def _hello_loop(self):
+    def _hello_loop(self, gen: int):
         if not self.peer_addr or not self.match_id or not self.my_username:
             self.status_text = "Missing match info"
             return
 
+        if self.relay_addr:
+            # compare against recvfrom() addresses, so resolve the server name once
+            relay_addr = self.relay_addr
+            try:
+                relay_addr = (socket.gethostbyname(relay_addr[0]), relay_addr[1])
+            except OSError:
+                relay_addr = None
+            if gen != self._hello_gen:
+                return
+            self.relay_addr = relay_addr
+
+        # bind to the relay right away, even if direct works: the peer may need
+        # it (one-way NAT), and its fallback only works once we are bound too
         start = time.time()
-        while self.running and not self.connected:
-            if time.time() - start > 8.0:
-                self.status_text = "P2P timeout ❌ (no HELLO_ACK)"
+        limit = DIRECT_TIMEOUT + RELAY_TIMEOUT if self.relay_addr else RELAY_TIMEOUT
+        while (self.running and gen == self._hello_gen
+               and (not self.connected or (self.relay_addr and not self.relay_bound))):
+            elapsed = time.time() - start
+            if elapsed > limit:
+                if not self.connected:
+                    self.status_text = "P2P timeout ❌ (no HELLO_ACK)"
+                    self.net_stats.incr("timeouts")
                 return
-            self._send({"type": "HELLO", "match_id": self.match_id, "from": self.my_username, "udp_port": self.local_port})
+            if self.relay_addr and not self.relay_bound:
+                self._send_relay_bind()
+            if not self.connected:
+                if elapsed > DIRECT_TIMEOUT and self.relay_addr and self.via == "direct":
+                    self._use_relay()
+                self._send({"type": "HELLO", "match_id": self.match_id, "from": self.my_username,
+                            "udp_port": self.local_port, "t": time.time()})
             time.sleep(0.2)
 
-    # ---------------- low-level ----------------
-    def _send(self, msg: Dict[str, Any]):
-        if not self.peer_addr:
-            return
+    # ---------------- relay fallback ----------------
+    def _send_relay_bind(self):
+        pkt = dumps_line({"type": "RELAY_BIND", "match_id": self.match_id, "token": self.relay_token})
         try:
-            self.sock.sendto(dumps_line(msg), self.peer_addr)
+            self.sock.sendto(pkt, self.relay_addr)
         except Exception:
-            pass
+            return
+        self.net_stats.incr("packets_out")
+        self.net_stats.incr("bytes_out", len(pkt))
+
+    def _use_relay(self):
+        """Send everything through the server from now on."""
+        if self.via == "relay" or not self.relay_addr:
+            return
+        self.via = "relay"
+        self.peer_addr = self.relay_addr
+        self.net_stats.incr("relay_fallbacks")
+        self.status_text = self._connected_text() if self.connected else "Connecting… (via relay)"
+
+    # ---------------- low-level ----------------
+    def _send(self, msg: Dict[str, Any]) -> int:
+        """Queue one message; it goes out with the next flush()."""
+        if not self.peer_addr:
+            return 0
+        data = dumps_line(msg)
+        with self._out_lock:
+            self._outq.append(data)
+        self.net_stats.incr("msgs_out")
+        return len(data)
+
+    def flush(self) -> int:
+        """
+        Send everything queued since the last flush, packed in order into as
+        few MTU-bounded datagrams as possible. Called once per frame.
+        Returns the number of datagrams sent.
+        """
+        with self._out_lock:
+            if not self._outq:
+                return 0
+            lines, self._outq = self._outq, []
+        addr = self.peer_addr
+        if not addr:
+            return 0
+
+        packets: List[bytes] = []
+        cur: List[bytes] = []
+        size = 0
+        for line in lines:
+            if cur and size + len(line) > MAX_DATAGRAM:
+                packets.append(b"".join(cur))
+                cur, size = [], 0
+            cur.append(line)
+            size += len(line)
+        if cur:
+            packets.append(b"".join(cur))
+
+        for pkt in packets:
+            try:
+                self.sock.sendto(pkt, addr)
+            except Exception:
+                continue
+            self.net_stats.incr("packets_out")
+            self.net_stats.incr("bytes_out", len(pkt))
+        return len(packets)
 
     def _listen_loop(self):
-        buffer = b""
         while self.running:
             try:
-                data, _addr = self.sock.recvfrom(65535)
+                data, src = self.sock.recvfrom(65535)
             except BlockingIOError:
                 time.sleep(0.005)
                 continue
@@ -185,12 +356,18 @@ class UDPPeer:
                 time.sleep(0.01)
                 continue
 
-            buffer += data
-            while b"\n" in buffer:
-                line, buffer = buffer.split(b"\n", 1)
-                msg = loads_line(line)
-                if msg is None:
-                    continue
+            self.net_stats.incr("packets_in")
+            self.net_stats.incr("bytes_in", len(data))
+
+            # one datagram may carry several coalesced lines; handle them in order
+            msgs = [m for m in map(loads_line, data.split(b"\n")) if m is not None]
+
+            if src == self.relay_addr and self.via == "direct" and \
+                    any(m.get("type") != "RELAY_BIND_ACK" for m in msgs):
+                self._use_relay()  # the peer fell back: answer the same way
+
+            for msg in msgs:
+                self.net_stats.incr("msgs_in")
                 self._handle(msg)
 
     def _handle(self, msg: Dict[str, Any]):
@@ -201,25 +378,51 @@ class UDPPeer:
 
         if t == "HELLO":
             self.connected = True
-            self.status_text = "P2P connected ✅"
-            self._send({"type": "HELLO_ACK", "match_id": self.match_id})
+            self.status_text = self._connected_text()
+            ack = {"type": "HELLO_ACK", "match_id": self.match_id}
+            if "t" in msg:
+                ack["t"] = msg["t"]  # echo for the sender's RTT sample
+            self._send(ack)
 
         elif t == "HELLO_ACK":
             self.connected = True
-            self.status_text = "P2P connected ✅"
+            self.status_text = self._connected_text()
+            try:
+                self.net_stats.observe("rtt_ms", (time.time() - float(msg["t"])) * 1000.0)
+            except (KeyError, TypeError, ValueError):
+                pass
 
         elif t == "SHOT":
             seq = int(msg.get("seq", 0))
             if seq in self._received_shots:
+                self.net_stats.incr("dup_drops")
                 self._send({"type": "SHOT_ACK", "match_id": self.match_id, "seq": seq})
                 return
             self._received_shots.add(seq)
             self._send({"type": "SHOT_ACK", "match_id": self.match_id, "seq": seq})
-            self.inbox.put(msg)
+            self._deliver(msg)
 
         elif t == "SHOT_ACK":
             seq = int(msg.get("seq", 0))
-            self._pending.pop(seq, None)
-
-        elif t in ("STATE_HASH", "SNAPSHOT_REQ", "STATE_SNAPSHOT", "GOAL", "RESET", "END"):
-            self.inbox.put(msg)
\ No newline at end of file
+            info = self._pending.pop(seq, None)
+            # Karn: only unambiguous (never resent) shots give an RTT sample
+            if info and info["tries"] == 0:
+                self.net_stats.observe("rtt_ms", (time.time() - info["sent_at"]) * 1000.0)
+
+        elif t == "STATE_SNAPSHOT":
+            state = msg.get("state")
+            snap = self._snap_dec.decode(state) if isinstance(state, dict) else None
+            if snap is None:
+                return  # unknown base; our next SNAPSHOT_REQ acks what we have
+            msg["state"] = snap
+            self._deliver(msg)
+
+        elif t == "RELAY_BIND_ACK":
+            self.relay_bound = True
+
+        elif t in ("STATE_HASH", "SNAPSHOT_REQ", "GOAL", "RESET", "END",
+                   "DESYNC_PROBE", "DESYNC_HASHES", "DESYNC_FETCH", "DESYNC_STATE"):
+            self._deliver(msg)
+
+    def _connected_text(self) -> str:
+        return "Connected via relay ✅" if self.via == "relay" else "P2P connected ✅"
@@ -0,0 +1,153 @@
+# server/auth.py
+"""
+Password hashing (salted scrypt) run off the event loop.
+
+Stored format:  scrypt$<n>$<r>$<p>$<salt hex>$<key hex>
+Legacy unsalted SHA-256 hex digests still verify and are flagged for rehash,
+so accounts upgrade transparently on their next successful login.
+
+Resume tokens (ResumeTokens) let a reconnecting client get its session back
+without a password: an HMAC over username, session id and expiry.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+DKLEN = 32
+# scrypt needs 128 * n * r bytes; leave headroom over OpenSSL's 32 MiB default
+SCRYPT_MAXMEM = 64 * 1024 * 1024
+
+
+class Overloaded(Exception):
+    """Too many hash jobs already waiting."""
+
+
+def hash_password(pw: str) -> str:
+    salt = os.urandom(16)
+    key = hashlib.scrypt(pw.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                         maxmem=SCRYPT_MAXMEM, dklen=DKLEN)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${key.hex()}"
+
+
+def verify_password(pw: str, stored: str) -> Tuple[bool, bool]:
+    """Returns (ok, needs_rehash)."""
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, key = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            expect = bytes.fromhex(key)
+            got = hashlib.scrypt(pw.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p,
+                                 maxmem=SCRYPT_MAXMEM, dklen=len(expect))
+        except (ValueError, TypeError):
+            return False, False
+        ok = hmac.compare_digest(got, expect)
+        return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+    # legacy: unsalted sha256 hex
+    ok = hmac.compare_digest(hashlib.sha256(pw.encode()).hexdigest(), stored)
+    return ok, ok
+
+
+class PasswordHasher:
+    """
+    Bounded pool for hash/verify jobs.
+    At most `workers` jobs run at once; at most `max_waiting` may queue
+    behind them before new ones are rejected with Overloaded.
+    """
+
+    def __init__(self, workers: int = 2, max_waiting: int = 256):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+        self._sem: Optional[asyncio.Semaphore] = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    async def hash(self, pw: str) -> str:
+        return await self._run(hash_password, pw)
+
+    async def verify(self, pw: str, stored: str) -> Tuple[bool, bool]:
+        return await self._run(verify_password, pw, stored)
+
+    async def _run(self, fn, *args):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.workers)
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded()
+
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.busy_seconds += time.perf_counter() - t0
+            self.in_flight -= 1
+            self.completed += 1
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "peak_waiting": self.peak_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": (1000.0 * self.busy_seconds / self.completed) if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+class ResumeTokens:
+    """
+    token = b64url("<expires>.<sid>.<username>") "." hex HMAC-SHA256 (truncated).
+    The secret is per process unless given, so a restart invalidates every token.
+    """
+
+    def __init__(self, secret: Optional[bytes] = None, ttl: float = 12 * 3600):
+        self.secret = secret or secrets.token_bytes(32)
+        self.ttl = ttl
+
+    def _sign(self, payload: bytes) -> str:
+        return hmac.new(self.secret, payload, hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, username: str, sid: str) -> str:
+        payload = f"{int(time.time() + self.ttl)}.{sid}.{username}".encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=") + "." + self._sign(payload)
+
+    def verify(self, token) -> Optional[Tuple[str, str]]:
+        """(username, sid) if the token is ours and unexpired, else None."""
+        if not isinstance(token, str) or token.count(".") != 1:
+            return None
+        body, sig = token.split(".")
+        try:
+            payload = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+            expires, sid, username = payload.decode("utf-8").split(".", 2)
+            expires = int(expires)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if not hmac.compare_digest(self._sign(payload), sig) or expires < time.time():
+            return None
+        return username, sid
@@ -0,0 +1,254 @@
+# server/broker.py
+"""
+Worker <-> broker link for multi-process mode.
+
+Workers own the TCP sockets (all bound to PORT with SO_REUSEPORT) and do the
+per-connection work: framing, REGISTER, password checks. The broker owns the
+lobby state (online, status, invites, presence) and runs the regular handlers
+from server.py, so cross-worker INVITE / MATCH_START behave exactly like the
+single-process server.
+
+Link frames are single lines:  <OP> <conn id> <payload>\\n
+  worker -> broker:  OPEN (peer addr json), REQ (raw client line),
+                     LONG (client line over MAX_LINE, dropped by the worker),
+                     AUTH ({"username", "rid"} after a good password), GONE
+  broker -> worker:  OUT (raw line for the client), CLOSE (flush, then hang up)
+
+The transport is a Unix socket (BrokerServer / BrokerClient) or, for tests,
+LocalBroker, which wires both ends together inside one event loop.
+
+Each end of a socket link writes through an Outbox, like a client
+connection: past LINK_HIGH_WATER the side feeding it stops reading (the
+broker its worker's frames, a worker its clients' lines) until the other
+end catches up, and past LINK_MAX_BYTES the link is dropped; the worker
+then exits and its clients reconnect to the others.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from outbox import Outbox
+
+# frames carry whole client lines; allow big ones
+LINK_LIMIT = 1 << 20
+# a link carries a whole worker's traffic, so it gets more room than one client
+LINK_HIGH_WATER = 1 << 20
+LINK_MAX_BYTES = 16 << 20
+
+# worker side: (op, conn_id, payload) from the broker
+WorkerHandler = Callable[[str, int, bytes], None]
+# broker side: (link, op, conn_id, payload) from a worker
+BrokerHandler = Callable[["WorkerLink", str, int, bytes], Awaitable[None]]
+
+
+def encode_frame(op: str, conn_id: int, payload: bytes = b"") -> bytes:
+    return op.encode("ascii") + b" " + str(conn_id).encode("ascii") + b" " + payload + b"\n"
+
+
+def decode_frame(line: bytes) -> Optional[Tuple[str, int, bytes]]:
+    parts = line.rstrip(b"\n").split(b" ", 2)
+    if len(parts) < 2:
+        return None
+    try:
+        return parts[0].decode("ascii"), int(parts[1]), (parts[2] if len(parts) > 2 else b"")
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+# ---------------- broker-side stand-ins for a worker's connection ----------------
+class RemoteConn:
+    """Takes the place of a StreamWriter in the broker's tables."""
+    __slots__ = ("link", "conn_id", "addr", "username")
+
+    def __init__(self, link: "WorkerLink", conn_id: int, addr):
+        self.link = link
+        self.conn_id = conn_id
+        self.addr = addr
+        self.username: Optional[str] = None
+
+    def get_extra_info(self, name, default=None):
+        return self.addr if name == "peername" else default
+
+    def close(self):
+        self.link.send("CLOSE", self.conn_id)
+
+
+class RemoteOutbox:
+    """Outbox look-alike: the worker's real Outbox does the queueing and backpressure."""
+
+    def __init__(self, conn: RemoteConn):
+        self.conn = conn
+        self.closed = False
+
+    def put(self, data: bytes) -> bool:
+        if self.closed:
+            return False
+        self.conn.link.send("OUT", self.conn.conn_id, data.rstrip(b"\n"))
+        return True
+
+    async def wait_writable(self):
+        return
+
+    def close(self, close_writer: bool = False):
+        self.closed = True
+        if close_writer:
+            self.conn.close()
+
+    async def aclose(self, timeout: float = 2.0):
+        self.closed = True
+
+
+class WorkerLink:
+    """Broker's end of one worker connection."""
+
+    def __init__(self, worker_id: int, write: Callable[[bytes], None]):
+        self.worker_id = worker_id
+        self._write = write
+        self.conns: Dict[int, RemoteConn] = {}
+
+    def send(self, op: str, conn_id: int, payload: bytes = b""):
+        self._write(encode_frame(op, conn_id, payload))
+
+
+# ---------------- Unix socket transport ----------------
+class BrokerServer:
+    def __init__(self, path: str, handler: BrokerHandler, on_link_lost: Callable[[WorkerLink], Awaitable[None]]):
+        self.path = path
+        self.handler = handler
+        self.on_link_lost = on_link_lost
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._next_worker = 0
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=LINK_LIMIT)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._next_worker += 1
+        out = Outbox(writer, LINK_HIGH_WATER, LINK_MAX_BYTES)
+        link = WorkerLink(self._next_worker, out.put)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = decode_frame(line)
+                if frame:
+                    await self.handler(link, *frame)
+                await out.wait_writable()
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            await self.on_link_lost(link)
+            await out.aclose()
+            writer.close()
+
+    def close(self):
+        if self._server:
+            self._server.close()
+
+
+class BrokerClient:
+    """Worker's end of the link."""
+
+    def __init__(self, path: str, handler: WorkerHandler):
+        self.path = path
+        self.handler = handler
+        self._out: Optional[Outbox] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lost = asyncio.Event()
+
+    async def connect(self, retries: int = 50, delay: float = 0.1):
+        for _ in range(retries):
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=LINK_LIMIT)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(delay)
+        else:
+            raise ConnectionError(f"broker not reachable at {self.path}")
+        self._out = Outbox(writer, LINK_HIGH_WATER, LINK_MAX_BYTES)
+        self._task = asyncio.create_task(self._read(reader))
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = decode_frame(line)
+                if frame:
+                    self.handler(*frame)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            self.lost.set()
+
+    def send(self, op: str, conn_id: int, payload: bytes = b""):
+        if self._out is not None:
+            self._out.put(encode_frame(op, conn_id, payload))
+
+    async def wait_writable(self):
+        if self._out is not None:
+            await self._out.wait_writable()
+
+
+# ---------------- in-process stand-in ----------------
+class LocalBroker:
+    """
+    Both ends in one event loop, no sockets: frames are handed over with
+    call_soon / a queue, preserving per-link ordering like the Unix socket.
+    """
+
+    def __init__(self, handler: BrokerHandler, on_link_lost: Callable[[WorkerLink], Awaitable[None]]):
+        self.handler = handler
+        self.on_link_lost = on_link_lost
+        self._next_worker = 0
+
+    def connect_worker(self, worker_handler: WorkerHandler) -> "LocalBrokerClient":
+        self._next_worker += 1
+        client = LocalBrokerClient(worker_handler)
+        link = WorkerLink(self._next_worker, client._from_broker)
+        client._attach(self, link)
+        return client
+
+
+class LocalBrokerClient:
+    def __init__(self, handler: WorkerHandler):
+        self.handler = handler
+        self._queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+        self._broker: Optional[LocalBroker] = None
+        self._link: Optional[WorkerLink] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lost = asyncio.Event()
+
+    def _attach(self, broker: LocalBroker, link: WorkerLink):
+        self._broker = broker
+        self._link = link
+        self._task = asyncio.create_task(self._pump())
+
+    async def connect(self):
+        return
+
+    def _from_broker(self, data: bytes):
+        frame = decode_frame(data)
+        if frame:
+            asyncio.get_running_loop().call_soon(self.handler, *frame)
+
+    def send(self, op: str, conn_id: int, payload: bytes = b""):
+        self._queue.put_nowait(encode_frame(op, conn_id, payload))
+
+    async def wait_writable(self):
+        return
+
+    async def _pump(self):
+        while True:
+            data = await self._queue.get()
+            if data is None:
+                break
+            frame = decode_frame(data)
+            if frame:
+                await self._broker.handler(self._link, *frame)
+        await self._broker.on_link_lost(self._link)
+        self.lost.set()
+
+    def close(self):
+        self._queue.put_nowait(None)
@@ -0,0 +1,60 @@
+# server/heartbeat.py
+"""
+Application-level keepalive for one client connection.
+
+TCP never notices a peer that vanished without a FIN (pulled cable, NAT
+dropped the mapping, laptop lid closed), so such a user would stay online,
+and busy, forever. Every chunk the client sends counts as a sign of life:
+seen() stores a timestamp and nothing else. A single wheel timer per
+connection looks at that timestamp when it fires:
+
+  - quiet for less than IDLE seconds: look again when it could be IDLE;
+  - quiet for IDLE seconds: send PING, look again TIMEOUT seconds later;
+  - still quiet after the PING: the connection is dead.
+
+Clients answer PING with PONG (and may PING the server themselves).
+"""
+import time
+from typing import Callable, Optional
+
+IDLE = 20.0      # seconds of silence before the server asks
+TIMEOUT = 10.0   # seconds to answer a PING
+
+
+class Heartbeat:
+    __slots__ = ("wheel", "ping", "dead", "idle", "timeout", "last_seen", "pinged_at", "timer")
+
+    def __init__(self, wheel, ping: Callable[[], None], dead: Callable[[], None],
+                 idle: float = IDLE, timeout: float = TIMEOUT):
+        self.wheel = wheel
+        self.ping = ping
+        self.dead = dead
+        self.idle = idle
+        self.timeout = timeout
+        self.last_seen = time.monotonic()
+        self.pinged_at: Optional[float] = None
+        self.timer = wheel.schedule(idle, self._check)
+
+    def seen(self):
+        self.last_seen = time.monotonic()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _check(self):
+        now = time.monotonic()
+        quiet = now - self.last_seen
+        if quiet < self.idle:
+            self.timer = self.wheel.schedule(self.idle - quiet, self._check)
+        elif self.pinged_at is not None and self.pinged_at >= self.last_seen:
+            if now - self.pinged_at < self.timeout:
+                self.timer = self.wheel.schedule(self.timeout - (now - self.pinged_at), self._check)
+            else:
+                self.timer = None
+                self.dead()
+        else:
+            self.pinged_at = now
+            self.timer = self.wheel.schedule(self.timeout, self._check)
+            self.ping()
@@ -0,0 +1,120 @@
+# server/matchmaking.py
+"""
+QUICKMATCH queue.
+
+Waiting players are indexed by region, then by rating bucket
+(RATING_BUCKET points wide); each bucket is a FIFO. A player is paired
+with the longest-waiting player in their own bucket, else in the nearest
+bucket either of them is willing to reach: the allowed spread starts at 0
+and widens by one bucket every WIDEN_EVERY seconds of waiting, up to
+MAX_SPREAD. Pairing looks at no more than 2 * MAX_SPREAD + 1 bucket heads,
+so it costs the same with ten players queued or ten thousand.
+
+The server keeps no ratings yet, so the rating is whatever the client
+declares (DEFAULT_RATING if it sends none).
+
+Like SessionRegistry this only keeps state; server.py runs the timers and
+sends MATCH_START / QUICKMATCH_TIMEOUT.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+DEFAULT_REGION = "any"
+DEFAULT_RATING = 1000
+RATING_BUCKET = 100
+WIDEN_EVERY = 2.0      # seconds of waiting per extra bucket of spread
+MAX_SPREAD = 5
+TIMEOUT = 60.0         # seconds before a ticket is dropped
+
+
+class Ticket:
+    __slots__ = ("username", "region", "rating", "bucket", "since", "timer")
+
+    def __init__(self, username: str, region: str, rating: int, since: float):
+        self.username = username
+        self.region = region
+        self.rating = rating
+        self.bucket = rating // RATING_BUCKET
+        self.since = since
+        self.timer = None  # asyncio.TimerHandle of the next retry / timeout
+
+    def spread(self, now: float) -> int:
+        return min(MAX_SPREAD, int((now - self.since) / WIDEN_EVERY))
+
+
+class MatchQueue:
+    def __init__(self):
+        # region -> bucket -> username -> Ticket (insertion order = waiting order)
+        self._regions: Dict[str, Dict[int, "OrderedDict[str, Ticket]"]] = {}
+        self._tickets: Dict[str, Ticket] = {}
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._tickets
+
+    def get(self, username: str) -> Optional[Ticket]:
+        return self._tickets.get(username)
+
+    def join(self, username: str, region: str, rating: int, now: float) -> Ticket:
+        """Queue username (replacing any older ticket of theirs)."""
+        self.leave(username)
+        t = Ticket(username, region, rating, now)
+        self._insert(t)
+        return t
+
+    def requeue(self, t: Ticket):
+        """Put back a ticket pop_pair took out (its partner was gone); it keeps its waiting time."""
+        self.leave(t.username)
+        self._insert(t)
+
+    def _insert(self, t: Ticket):
+        self._tickets[t.username] = t
+        self._regions.setdefault(t.region, {}).setdefault(t.bucket, OrderedDict())[t.username] = t
+
+    def leave(self, username: str) -> Optional[Ticket]:
+        t = self._tickets.pop(username, None)
+        if t is None:
+            return None
+        if t.timer is not None:
+            t.timer.cancel()
+            t.timer = None
+        buckets = self._regions[t.region]
+        q = buckets[t.bucket]
+        del q[username]
+        if not q:
+            del buckets[t.bucket]
+            if not buckets:
+                del self._regions[t.region]
+        return t
+
+    def _head(self, q: "OrderedDict[str, Ticket]", skip: Ticket) -> Optional[Ticket]:
+        for other in q.values():
+            if other is not skip:
+                return other
+        return None
+
+    def find_partner(self, t: Ticket, now: float) -> Optional[Ticket]:
+        buckets = self._regions.get(t.region)
+        if not buckets:
+            return None
+        mine = t.spread(now)
+        for d in range(MAX_SPREAD + 1):
+            for b in ((t.bucket,) if d == 0 else (t.bucket - d, t.bucket + d)):
+                q = buckets.get(b)
+                if not q:
+                    continue
+                other = self._head(q, t)
+                if other is not None and max(mine, other.spread(now)) >= d:
+                    return other
+        return None
+
+    def pop_pair(self, t: Ticket, now: float) -> Optional[Tuple[Ticket, Ticket]]:
+        """Take t and its partner out of the queue, longest-waiting first."""
+        other = self.find_partner(t, now)
+        if other is None:
+            return None
+        self.leave(t.username)
+        self.leave(other.username)
+        return (other, t) if other.since <= t.since else (t, other)
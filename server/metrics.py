@@ -0,0 +1,188 @@
+# server/metrics.py
+"""
+In-process metrics, served in Prometheus text exposition format.
+
+Everything runs on the event loop thread, so recording is a dict lookup
+plus an add (counters) or a bisect plus two adds (histograms); no locks.
+Gauges are callbacks evaluated only when /metrics is scraped.
+
+    metrics = Registry()
+    msgs = metrics.counter("soccer_messages_total", "Client messages", ("type",))
+    msgs.inc("LOGIN")
+    await metrics.serve("127.0.0.1", 9100)
+"""
+import asyncio
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# seconds; handler latency is mostly well under a millisecond
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LAG_INTERVAL = 0.25
+
+Labels = Tuple[str, ...]
+GaugeValue = Union[float, Dict[Labels, float]]
+
+
+def _fmt_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_num(x: float) -> str:
+    if x == float("inf"):
+        return "+Inf"
+    return repr(float(x)) if isinstance(x, float) and not x.is_integer() else str(int(x))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str):
+        self.values[labels] = self.values.get(labels, 0) + 1
+
+    def add(self, n: float, *labels: str):
+        self.values[labels] = self.values.get(labels, 0) + n
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_num(v)}" for k, v in self.values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        v = self.values.get(labels)
+        if v is None:
+            v = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        v[0][bisect_left(self.buckets, value)] += 1
+        v[1] += value
+
+    def render(self) -> List[str]:
+        out = []
+        for k, (counts, total) in self.values.items():
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le_label = 'le="' + _fmt_num(le) + '"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, le_label)} {acc}")
+            lbl = _fmt_labels(self.labelnames, k)
+            out.append(f"{self.name}_sum{lbl} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{lbl} {acc}")
+        return out
+
+
+class Gauge:
+    """Value read from fn() at scrape time: a number, or {label tuple: number}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], GaugeValue],
+                 labelnames: Sequence[str] = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind  # "counter" for totals kept elsewhere (e.g. relay.total_packets)
+
+    def render(self) -> List[str]:
+        v = self.fn()
+        if isinstance(v, dict):
+            return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_num(x)}" for k, x in v.items()]
+        return [f"{self.name} {_fmt_num(v)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Union[Counter, Histogram, Gauge]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], GaugeValue],
+              labelnames: Sequence[str] = (), kind: str = "gauge") -> Gauge:
+        return self._add(Gauge(name, help, fn, labelnames, kind))
+
+    def _add(self, m):
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            try:
+                body = m.render()
+            except Exception as e:  # a broken gauge must not take down the scrape
+                lines.append(f"# {m.name} failed: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+    # ---------- event loop lag ----------
+    def watch_loop_lag(self, hist: Histogram, interval: float = LAG_INTERVAL):
+        """Observe how late a sleep(interval) wakes up: time the loop spent busy elsewhere."""
+        async def run():
+            loop = asyncio.get_running_loop()
+            while True:
+                t0 = loop.time()
+                await asyncio.sleep(interval)
+                hist.observe(max(0.0, loop.time() - t0 - interval))
+
+        self._lag_task = asyncio.create_task(run())
+
+    # ---------- HTTP ----------
+    async def serve(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+            parts = head.split(b" ", 2)
+            path = parts[1].split(b"?", 1)[0] if len(parts) > 1 else b""
+            if parts[0] == b"GET" and path in (b"/", b"/metrics"):
+                status, body = b"200 OK", self.render().encode("utf-8")
+            else:
+                status, body = b"404 Not Found", b"try /metrics\n"
+            writer.write(b"HTTP/1.1 " + status + b"\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n"
+                         b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self._lag_task is not None:
+            self._lag_task.cancel()
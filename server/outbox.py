@@ -0,0 +1,99 @@
+# server/outbox.py
+"""
+Per-connection outbound queue.
+
+Handlers never await a peer's socket: they put() encoded lines here and one
+writer task per connection drains everything queued in a single write.
+
+Backpressure:
+  - above HIGH_WATER bytes, wait_writable() blocks (the connection's own
+    reader stops taking new requests until its replies go out);
+  - above MAX_BYTES the client is too slow to keep up and is dropped.
+"""
+import asyncio
+from collections import deque
+from typing import Deque
+
+HIGH_WATER = 64 * 1024
+MAX_BYTES = 256 * 1024
+
+
+class Outbox:
+    def __init__(self, writer: asyncio.StreamWriter,
+                 high_water: int = HIGH_WATER, max_bytes: int = MAX_BYTES):
+        self.writer = writer
+        self.high_water = high_water
+        self.max_bytes = max_bytes
+
+        self._buf: Deque[bytes] = deque()
+        self.size = 0
+        self.closed = False
+        self.overflowed = False
+        self._close_writer = False
+
+        self._wake = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, data: bytes) -> bool:
+        """Queue bytes; False if the connection is closed or was just dropped for overflowing."""
+        if self.closed:
+            return False
+        if self.size + len(data) > self.max_bytes:
+            self._overflow()
+            return False
+        self._buf.append(data)
+        self.size += len(data)
+        if self.size >= self.high_water:
+            self._writable.clear()
+        self._wake.set()
+        return True
+
+    async def wait_writable(self):
+        await self._writable.wait()
+
+    def close(self, close_writer: bool = False):
+        """Stop accepting data; whatever is queued is still flushed (then the socket closed if asked)."""
+        self.closed = True
+        self._close_writer = self._close_writer or close_writer
+        self._wake.set()
+
+    async def aclose(self, timeout: float = 2.0):
+        self.close()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+
+    def _overflow(self):
+        self.overflowed = True
+        self.closed = True
+        self._buf.clear()
+        self.size = 0
+        self._writable.set()
+        self._wake.set()
+        # abort: a slow consumer must not hold the flush (or the handler) hostage
+        self.writer.transport.abort()
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                if self._buf:
+                    chunk = b"".join(self._buf)
+                    self._buf.clear()
+                    self.size = 0
+                    self.writer.write(chunk)
+                    await self.writer.drain()
+                    if self.size < self.high_water:
+                        self._writable.set()
+                if self.closed and not self._buf:
+                    break
+        except (ConnectionError, OSError):
+            self.closed = True
+        finally:
+            self._writable.set()
+            if self._close_writer:
+                self.writer.close()
@@ -0,0 +1,111 @@
+# server/ratelimit.py
+"""
+Per-connection token buckets.
+
+Every client line costs one token from the connection's "total" bucket and
+one from the bucket of its command class (COMMAND_CLASS; bad JSON and
+unknown commands are "invalid"). A bucket refills at `rate` tokens per
+second up to `burst`, so a player clicking around never notices it while
+a script hammering LIST_USERS is cut down to `rate` lines a second.
+
+Each rejected line also costs a "strikes" token; a connection that runs
+out of strikes is abusive and gets disconnected. Strikes refill too, so a
+client that hits a limit now and then is never cut off, and a flooder
+gets at most `burst` strikes worth of error replies before it is.
+
+Limits are (rate, burst) pairs and can be overridden with a spec string:
+
+    parse_limits("query=1/5,lobby=0.5/3,strikes=1/20")
+    parse_limits("off")   # no limiting at all
+
+Like SessionRegistry this only keeps state; server.py decides what to send.
+"""
+from typing import Dict, Optional, Tuple
+
+Limit = Tuple[float, float]   # (tokens per second, burst)
+
+COMMAND_CLASS = {
+    "REGISTER": "auth", "LOGIN": "auth", "RESUME": "auth",
+    "LIST_USERS": "query", "SUBSCRIBE_PRESENCE": "query",
+    "INVITE": "lobby", "INVITE_RESPONSE": "lobby", "QUICKMATCH": "lobby", "QUICKMATCH_CANCEL": "lobby",
+    "SET_UDP_PORT": "session", "MATCH_END": "session", "LOGOUT": "session", "PING": "session", "PONG": "session",
+}
+INVALID = "invalid"
+
+DEFAULT_LIMITS: Dict[str, Limit] = {
+    "total": (20.0, 40.0),
+    "auth": (0.2, 5.0),
+    "query": (2.0, 10.0),
+    "lobby": (2.0, 10.0),
+    "session": (5.0, 20.0),
+    INVALID: (0.5, 5.0),
+    "strikes": (0.5, 30.0),
+}
+
+
+def parse_limits(spec: Optional[str]) -> Optional[Dict[str, Limit]]:
+    """DEFAULT_LIMITS with "name=rate/burst,..." applied; None for "off"."""
+    if spec is None or not spec.strip():
+        return dict(DEFAULT_LIMITS)
+    if spec.strip().lower() == "off":
+        return None
+    limits = dict(DEFAULT_LIMITS)
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if name not in limits:
+            raise ValueError(f"unknown rate limit {name!r} (known: {', '.join(limits)})")
+        rate, _, burst = value.partition("/")
+        try:
+            limit = (float(rate), float(burst or rate))
+        except ValueError:
+            raise ValueError(f"rate limit {name!r} must look like {name}=RATE/BURST") from None
+        if limit[0] < 0 or limit[1] < 1:
+            raise ValueError(f"rate limit {name!r} needs rate >= 0 and burst >= 1")
+        limits[name] = limit
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, limit: Limit, now: float):
+        self.rate, self.burst = limit
+        self.tokens = self.burst
+        self.stamp = now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return self.tokens
+
+
+class RateLimiter:
+    """One per connection. Buckets for command classes are made on first use."""
+    __slots__ = ("limits", "buckets", "total", "strikes", "abusive")
+
+    def __init__(self, limits: Dict[str, Limit], now: float):
+        self.limits = limits
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.total = TokenBucket(limits["total"], now)
+        self.strikes = TokenBucket(limits["strikes"], now)
+        self.abusive = False   # out of strikes: disconnect
+
+    def check(self, cmd, now: float) -> Optional[str]:
+        """None if a line of type cmd may run (and charge it), else the class that refused it."""
+        cls = COMMAND_CLASS.get(cmd, INVALID)
+        bucket = self.buckets.get(cls)
+        if bucket is None:
+            bucket = self.buckets[cls] = TokenBucket(self.limits[cls], now)
+        if self.total.refill(now) < 1.0:
+            refused = "total"
+        elif bucket.refill(now) < 1.0:
+            refused = cls
+        else:
+            self.total.tokens -= 1.0
+            bucket.tokens -= 1.0
+            return None
+        if self.strikes.refill(now) < 1.0:
+            self.abusive = True
+        else:
+            self.strikes.tokens -= 1.0
+        return refused
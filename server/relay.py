@@ -0,0 +1,180 @@
+# server/relay.py
+"""
+UDP relay for matches whose players can't reach each other directly (NAT).
+
+On MATCH_START each player gets a relay token. A client binds by sending
+    {"type":"RELAY_BIND","match_id":...,"token":...}
+to the relay port (answered with RELAY_BIND_ACK). From then on every
+datagram from a bound address is forwarded as-is to the other player's
+bound address: one dict lookup and one sendto, no parsing, no copy.
+
+Routes are per match_id and count bytes / packets in each direction.
+A route closes when both players have released it (MATCH_END / logout)
+or after IDLE_TIMEOUT seconds without traffic.
+"""
+import asyncio
+import secrets
+import socket
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from shared.netcodec import dumps_line, loads_line
+
+Addr = Tuple[str, int]
+
+IDLE_TIMEOUT = 60.0
+SWEEP_EVERY = 10.0
+# room for bursts from many matches between two loop wakeups
+SOCKET_BUFFER = 4 * 1024 * 1024
+# binds are rare; everything else from a bound address is forwarded untouched
+BIND_PREFIX = b'{"type":"RELAY_BIND"'
+
+
+class RelayRoute:
+    __slots__ = ("match_id", "tokens", "addrs", "members", "bytes", "packets", "dropped", "created", "last_seen")
+
+    def __init__(self, match_id: str, usernames: Iterable[str]):
+        self.match_id = match_id
+        self.members = list(usernames)
+        self.tokens = {secrets.token_hex(8): side for side in range(len(self.members))}
+        self.addrs: list = [None] * len(self.members)
+        self.bytes = [0] * len(self.members)      # sent by each side
+        self.packets = [0] * len(self.members)
+        self.dropped = 0                          # peer not bound yet
+        self.created = self.last_seen = time.monotonic()
+
+    def token_for(self, username: str) -> Optional[str]:
+        for token, side in self.tokens.items():
+            if self.members[side] == username:
+                return token
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "match_id": self.match_id,
+            "seconds": round(time.monotonic() - self.created, 1),
+            "bytes": list(self.bytes),
+            "packets": list(self.packets),
+            "dropped": self.dropped,
+        }
+
+
+class Relay(asyncio.DatagramProtocol):
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.routes: Dict[str, RelayRoute] = {}
+        self._by_addr: Dict[Addr, Tuple[RelayRoute, int]] = {}
+        self._sweeper: Optional[asyncio.TimerHandle] = None
+
+        self.total_bytes = 0
+        self.total_packets = 0
+        self.total_dropped = 0
+        self.closed_routes = 0
+
+    @property
+    def running(self) -> bool:
+        return self.transport is not None
+
+    # ---------- routes ----------
+    def open(self, match_id: str, usernames: Iterable[str]) -> RelayRoute:
+        self.close_route(match_id)
+        route = self.routes[match_id] = RelayRoute(match_id, usernames)
+        return route
+
+    def release(self, match_id: str, username: str) -> Optional[dict]:
+        """username is done with the match; the route closes once nobody is left."""
+        route = self.routes.get(match_id)
+        if route is None:
+            return None
+        if username in route.members:
+            route.members[route.members.index(username)] = None
+        if any(route.members):
+            return None
+        return self.close_route(match_id)
+
+    def close_route(self, match_id: str) -> Optional[dict]:
+        route = self.routes.pop(match_id, None)
+        if route is None:
+            return None
+        for addr in route.addrs:
+            if addr is not None and self._by_addr.get(addr, (None,))[0] is route:
+                del self._by_addr[addr]
+        self.closed_routes += 1
+        st = route.stats()
+        if any(route.packets):
+            print(f"[relay] match {match_id} closed after {st['seconds']}s: "
+                  f"bytes {st['bytes']} packets {st['packets']} dropped {st['dropped']}")
+        return st
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self.routes),
+            "bound_addrs": len(self._by_addr),
+            "closed_routes": self.closed_routes,
+            "bytes": self.total_bytes,
+            "packets": self.total_packets,
+            "dropped": self.total_dropped,
+        }
+
+    # ---------- DatagramProtocol ----------
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, opt, SOCKET_BUFFER)
+                except OSError:
+                    pass  # capped by the OS; the default still works
+        self._sweeper = asyncio.get_running_loop().call_later(SWEEP_EVERY, self._sweep)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def datagram_received(self, data: bytes, addr: Addr):
+        hit = self._by_addr.get(addr)
+        if hit is not None and not data.startswith(BIND_PREFIX):
+            route, side = hit
+            peer = route.addrs[1 - side]
+            if peer is None:
+                route.dropped += 1
+                self.total_dropped += 1
+                return
+            self.transport.sendto(data, peer)
+            n = len(data)
+            route.bytes[side] += n
+            route.packets[side] += 1
+            route.last_seen = time.monotonic()
+            self.total_bytes += n
+            self.total_packets += 1
+            return
+        self._bind(data, addr)
+
+    def _bind(self, data: bytes, addr: Addr):
+        msg = loads_line(data.split(b"\n", 1)[0])
+        if msg is None or msg.get("type") != "RELAY_BIND":
+            return
+        token = msg.get("token")
+        if not isinstance(token, str):
+            return  # tokens are hex strings; a list or dict can't even be looked up
+        route = self.routes.get(str(msg.get("match_id")))
+        side = route.tokens.get(token) if route else None
+        if side is None:
+            return
+        old = route.addrs[side]
+        if old is not None and old != addr:
+            self._by_addr.pop(old, None)  # client's NAT mapping changed
+        route.addrs[side] = addr
+        route.last_seen = time.monotonic()
+        self._by_addr[addr] = (route, side)
+        self.transport.sendto(dumps_line({"type": "RELAY_BIND_ACK", "match_id": route.match_id}), addr)
+
+    def _sweep(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for match_id in [m for m, r in self.routes.items() if r.last_seen < cutoff]:
+            self.close_route(match_id)
+        self._sweeper = asyncio.get_running_loop().call_later(SWEEP_EVERY, self._sweep)
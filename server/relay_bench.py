@@ -0,0 +1,164 @@
+# server/relay_bench.py
+"""
+Throughput benchmark for the UDP relay (relay.py).
+
+    python server/relay_bench.py --matches 200 --rate 30 --size 200 --seconds 10
+
+The relay runs alone in a child process; this process plays both players of
+every match, binds them, then sends --rate datagrams per second per player
+for --seconds. Reports delivery, forwarding latency and the relay's CPU
+time, i.e. what one relayed match costs and how many one core can carry.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import selectors
+import socket
+import struct
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from shared.netcodec import dumps_line, loads_line
+from relay import Relay
+
+STAMP = struct.Struct("!Id")  # sender index, send time
+
+
+def run_relay(port, n_matches, conn):
+    async def main():
+        relay = Relay(idle_timeout=3600.0)
+        tokens = {}
+        for i in range(n_matches):
+            route = relay.open(f"m{i}", ("a", "b"))
+            tokens[route.match_id] = [route.token_for("a"), route.token_for("b")]
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: relay, local_addr=("127.0.0.1", port))
+        conn.send(tokens)
+        cpu0 = time.process_time()
+        await loop.run_in_executor(None, conn.recv)  # "stop"
+        conn.send({"cpu": time.process_time() - cpu0, "stats": relay.stats()})
+        transport.close()
+
+    asyncio.run(main())
+
+
+def percentile(xs, q):
+    if not xs:
+        return float("nan")
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def bench(args):
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.get_context("spawn").Process(
+        target=run_relay, args=(args.port, args.matches, child), daemon=True)
+    proc.start()
+    tokens = parent.recv()
+    relay_addr = ("127.0.0.1", args.port)
+
+    # two players per match; player i's partner is i ^ 1
+    socks = []
+    sel = selectors.DefaultSelector()
+    for i in range(args.matches):
+        for side in (0, 1):
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(("127.0.0.1", 0))
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            s.setblocking(False)
+            sel.register(s, selectors.EVENT_READ, len(socks))
+            socks.append((s, f"m{i}", tokens[f"m{i}"][side]))
+
+    # bind everyone (resend until acked)
+    bound = set()
+    deadline = time.time() + 10.0
+    while len(bound) < len(socks) and time.time() < deadline:
+        for idx, (s, match_id, token) in enumerate(socks):
+            if idx not in bound:
+                s.sendto(dumps_line({"type": "RELAY_BIND", "match_id": match_id, "token": token}), relay_addr)
+        end = time.time() + 0.2
+        while time.time() < end:
+            for key, _ in sel.select(0.05):
+                try:
+                    data = key.fileobj.recv(2048)
+                except BlockingIOError:
+                    continue
+                msg = loads_line(data)
+                if msg and msg.get("type") == "RELAY_BIND_ACK":
+                    bound.add(key.data)
+    if len(bound) < len(socks):
+        print(f"only {len(bound)}/{len(socks)} players bound; giving up")
+        parent.send("stop")
+        proc.join(5)
+        return
+
+    pad = b"x" * max(0, args.size - STAMP.size)
+    sent = received = 0
+    lat = []
+    interval = 1.0 / args.rate
+    t0 = time.time()
+    next_tick = t0
+    end = t0 + args.seconds
+    while True:
+        now = time.time()
+        if now >= next_tick and now < end:
+            for idx, (s, _, _) in enumerate(socks):
+                try:
+                    s.sendto(STAMP.pack(idx, time.time()) + pad, relay_addr)
+                    sent += 1
+                except (BlockingIOError, OSError):
+                    pass
+            next_tick += interval
+        if now >= end + 1.0:  # grace for packets in flight
+            break
+        for key, _ in sel.select(max(0.0, min(next_tick, end + 1.0) - time.time())):
+            while True:
+                try:
+                    data = key.fileobj.recv(2048)
+                except BlockingIOError:
+                    break
+                if len(data) >= STAMP.size:
+                    src, t_sent = STAMP.unpack_from(data)
+                    if src ^ 1 == key.data:
+                        received += 1
+                        lat.append((time.time() - t_sent) * 1000.0)
+    elapsed = time.time() - t0 - 1.0
+
+    parent.send("stop")
+    res = parent.recv()
+    proc.join(5)
+    for s, _, _ in socks:
+        s.close()
+
+    st = res["stats"]
+    cpu = res["cpu"]
+    pps = st["packets"] / elapsed if elapsed > 0 else 0.0
+    per_match_cpu = cpu / elapsed / args.matches if elapsed > 0 else 0.0
+    print(f"matches: {args.matches}  rate: {args.rate}/s per player  size: {args.size} B  seconds: {elapsed:.1f}")
+    print(f"sent: {sent}  forwarded: {st['packets']}  received: {received}  "
+          f"loss: {100.0 * (1 - received / sent) if sent else 0.0:.2f}%  dropped (unbound): {st['dropped']}")
+    print(f"latency ms: p50={percentile(lat, 0.5):.2f}  p99={percentile(lat, 0.99):.2f}  max={max(lat, default=float('nan')):.2f}")
+    print(f"relay: {pps:.0f} pkt/s  {st['bytes'] / elapsed / 1e6:.2f} MB/s  cpu {cpu:.2f}s "
+          f"({100.0 * cpu / elapsed:.0f}% of a core)  {1e6 * cpu / max(1, st['packets']):.1f} us/pkt")
+    if per_match_cpu > 0:
+        print(f"per match: {100.0 * per_match_cpu:.3f}% of a core -> ~{1.0 / per_match_cpu:.0f} matches per core at this rate")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the UDP relay's forwarding throughput")
+    ap.add_argument("--matches", type=int, default=200)
+    ap.add_argument("--rate", type=float, default=30.0, help="datagrams per second per player")
+    ap.add_argument("--size", type=int, default=200, help="datagram size in bytes")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--port", type=int, default=9101)
+    args = ap.parse_args()
+    bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,324 @@
-# server/server.py  (only the invite state + handlers changed; you can replace whole file if easier)
-import asyncio, json, hashlib, secrets
+# server/server.py
+"""
+Soccer Stars lobby server: newline-delimited JSON over TCP.
+
+    python server/server.py                 one process, PORT
+    python server/server.py --workers 4     a presence broker + 4 SO_REUSEPORT workers
+
+Clients REGISTER / LOGIN (accounts in userstore.py, passwords hashed off the
+loop by auth.py), RESUME a dropped session with a signed token, follow the
+lobby through LIST_USERS / PRESENCE_DELTA, and get paired by INVITE or
+QUICKMATCH (matchmaking.py); MATCH_START hands both players each other's UDP
+address, plus a relay.py token for when they can't reach each other
+directly. Every connection writes through a bounded Outbox, is rate limited
+(ratelimit.py) and PINGed (heartbeat.py); all deadlines run on one
+timerwheel.py. Lobby state lives in a SessionRegistry (sessions.py).
+
+With --workers, each worker owns its sockets and the password work, and the
+broker owns the lobby state and runs the same handlers (broker.py). Metrics
+are served in Prometheus text format (metrics.py).
+"""
+import argparse, asyncio, contextvars, multiprocessing, os, secrets, sqlite3, sys, time
 from pathlib import Path
 
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from shared.netcodec import MAX_LINE, Encoded, LineFramer, dumps, dumps_line, loads, loads_line, status_msg
+from auth import PasswordHasher, Overloaded, ResumeTokens
+from broker import BrokerClient, BrokerServer, RemoteConn, RemoteOutbox
+from heartbeat import Heartbeat
+from outbox import Outbox
+from ratelimit import RateLimiter, parse_limits
+from relay import Relay
+from metrics import Registry
+from matchmaking import DEFAULT_RATING, DEFAULT_REGION, MatchQueue, TIMEOUT as QUICKMATCH_TIMEOUT, WIDEN_EVERY
+from sessions import FREE, SessionRegistry
+from timerwheel import TimerWheel
+from userstore import UserStore
+
 HOST = "0.0.0.0"
 PORT = 9000
-USERS_FILE = Path(__file__).resolve().parent / "users.json"
-
-users = {}
-online = {}
-status = {}
-user_ip = {}
-udp_port = {}
-pending_invite = {}   # to_user -> from_user
-
-# NEW: invitation sets
-# outgoing[from_user] = set(to_users)
-outgoing = {}
-# incoming[to_user] = from_user  (only allow 1 incoming at a time per target)
-incoming = {}
-
-def load_users():
-    global users
-    if USERS_FILE.exists():
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            users = json.load(f).get("users", {})
+RELAY_PORT = 9001     # UDP; 0 disables the relay
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100   # Prometheus text on /metrics; workers use METRICS_PORT + 1 + index; 0 disables
+BROKER_SOCKET = "/tmp/soccer-stars-broker.sock"
+USERS_DB = Path(__file__).resolve().parent / "users.db"
+USERS_FILE = Path(__file__).resolve().parent / "users.json"  # legacy, imported once
+
+users = UserStore(USERS_DB, legacy_json=USERS_FILE)
+# credential hashing runs in a small thread pool, never on the loop
+hasher = PasswordHasher(workers=2, max_waiting=256)
+# every deadline below runs on one timer wheel (timerwheel.py), started by main / broker_main / worker_main
+wheel = TimerWheel()
+# RESUME: a dropped connection keeps its session this long
+RESUME_GRACE = 60.0
+# an invite nobody answers is withdrawn after this long
+INVITE_TIMEOUT = 30.0
+# a match is over after MATCH_TIMEOUT, or MATCH_ABANDON after one player reported MATCH_END
+MATCH_TIMEOUT = 30 * 60.0
+MATCH_ABANDON = 60.0
+PING = Encoded({"type": "PING"})
+PONG = Encoded({"type": "PONG"})
+resume_tokens = ResumeTokens()
+# per-connection token buckets (ratelimit.py); None = no limiting
+rate_limits = parse_limits(None)
+RATE_LIMITED = status_msg("ERROR", "Too many requests, slow down")
+RATE_KICKED = status_msg("ERROR", "Too many requests, disconnecting")
+LINE_TOO_LONG = status_msg("ERROR", f"Line too long (max {MAX_LINE} bytes)")
+# bytes asked of the socket per wakeup; every complete line in them is handled before the next read
+READ_CHUNK = 64 * 1024
+# every logged-in user is one Session; the registry keeps the indexes in step
+sessions = SessionRegistry()
+# players waiting for QUICKMATCH, by region and rating bucket
+quickmatch = MatchQueue()
+# UDP fallback for players that can't reach each other directly
+relay = Relay()
+
+# presence: each subscriber's session holds {username: pending event};
+# events are coalesced per subscriber and pushed every PRESENCE_WINDOW seconds
+PRESENCE_WINDOW = 0.1
+_presence_flush = None
+
+# (writer, rid) of the request being handled: direct replies echo the client's rid
+_reply_to = contextvars.ContextVar("_reply_to", default=None)
+REPLY_TYPES = ("OK", "ERROR", "USERS", "PONG")
+
+# writer -> Outbox; every connection gets a bounded queue + its own writer task
+outboxes = {}
+
+# ---------- metrics ----------
+COMMANDS = frozenset(("REGISTER", "LOGIN", "RESUME", "SET_UDP_PORT", "LIST_USERS", "SUBSCRIBE_PRESENCE", "INVITE",
+                      "INVITE_RESPONSE", "QUICKMATCH", "QUICKMATCH_CANCEL", "LOGOUT", "MATCH_END", "PING", "PONG"))
+
+metrics = Registry()
+m_connections = metrics.counter("soccer_connections_total", "TCP connections accepted")
+m_messages = metrics.counter("soccer_messages_total", "Client messages handled, by type", ("type",))
+m_latency = metrics.histogram("soccer_command_seconds", "Time to handle one client message, by type", ("type",))
+m_invites = metrics.counter("soccer_invites_total", "Invites, by outcome", ("result",))
+m_matches = metrics.counter("soccer_matches_started_total", "Matches started, by route", ("via",))
+m_matches_expired = metrics.counter("soccer_matches_expired_total", "Matches ended by their deadline, not MATCH_END")
+m_heartbeat_timeouts = metrics.counter("soccer_heartbeat_timeouts_total", "Connections dropped for not answering PING")
+m_quickmatch_timeouts = metrics.counter("soccer_quickmatch_timeouts_total", "QUICKMATCH tickets that expired")
+m_resumes = metrics.counter("soccer_resumes_total", "RESUME attempts, by result", ("result",))
+m_rate_limited = metrics.counter("soccer_rate_limited_total", "Client lines dropped by a rate limit, by bucket",
+                                 ("bucket",))
+m_rate_kicks = metrics.counter("soccer_rate_limit_disconnects_total", "Connections cut off for flooding")
+m_outbox_overflows = metrics.counter("soccer_outbox_overflows_total", "Connections dropped for not reading replies")
+m_loop_lag = metrics.histogram("soccer_event_loop_lag_seconds", "How late a periodic timer fires",
+                               buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+metrics.gauge("soccer_connections", "Open client connections", lambda: len(outboxes))
+metrics.gauge("soccer_sessions", "Logged-in users, by status",
+              lambda: {("free",): len(sessions.free), ("busy",): len(sessions) - len(sessions.free)}, ("status",))
+metrics.gauge("soccer_sessions_detached", "Sessions waiting for RESUME",
+              lambda: sum(1 for s in sessions if s.writer is None))
+metrics.gauge("soccer_presence_subscribers", "Sessions receiving PRESENCE_DELTA", lambda: len(sessions.subscribers))
+metrics.gauge("soccer_matches_active", "Matches without a MATCH_END from every player", lambda: len(sessions.matches))
+metrics.gauge("soccer_timers", "Timers pending on the timer wheel", lambda: len(wheel))
+metrics.gauge("soccer_pending_invites", "Invites waiting for an answer", lambda: len(sessions.invites))
+metrics.gauge("soccer_quickmatch_waiting", "Players in the QUICKMATCH queue", lambda: len(quickmatch))
+metrics.gauge("soccer_outbox_queued_bytes", "Bytes queued for clients: total and largest single connection",
+              lambda: _outbox_depths(), ("agg",))
+metrics.gauge("soccer_password_jobs", "Password hash jobs, by state",
+              lambda: {("waiting",): hasher.waiting, ("running",): hasher.in_flight}, ("state",))
+metrics.gauge("soccer_password_rejected_total", "Password jobs refused as overloaded",
+              lambda: hasher.rejected, kind="counter")
+metrics.gauge("soccer_user_cache", "User records in memory: cached and waiting to be written",
+              lambda: {(k,): n for k, n in users.sizes().items()}, ("state",))
+metrics.gauge("soccer_user_write_failures_total", "User records the store failed to commit",
+              lambda: users.write_failures, kind="counter")
+metrics.gauge("soccer_relay_routes", "Matches with a relay route", lambda: len(relay.routes))
+metrics.gauge("soccer_relay_packets_total", "Datagrams forwarded by the relay", lambda: relay.total_packets, kind="counter")
+metrics.gauge("soccer_relay_bytes_total", "Bytes forwarded by the relay", lambda: relay.total_bytes, kind="counter")
+
+def _outbox_depths():
+    sizes = [getattr(ob, "size", 0) for ob in outboxes.values()]
+    return {("total",): sum(sizes), ("max",): max(sizes, default=0)}
+
+async def start_metrics(port):
+    metrics.watch_loop_lag(m_loop_lag)
+    if port:
+        await metrics.serve(METRICS_HOST, port)
+        print(f"Metrics on http://{METRICS_HOST}:{port}/metrics")
+
+def post(writer, data) -> bool:
+    """Queue data (a dict or a pre-encoded Encoded) for writer. Never waits on the peer's socket."""
+    ob = outboxes.get(writer)
+    if ob is None:
+        return False
+    ctx = _reply_to.get()
+    is_reply = ctx is not None and ctx[0] is writer
+    if isinstance(data, Encoded):
+        line = data.with_rid(ctx[1]) if is_reply and data.type in REPLY_TYPES else data.line
     else:
-        users = {}
-
-def save_users():
-    USERS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump({"users": users}, f, indent=2)
-
-def hash_password(pw: str) -> str:
-    return hashlib.sha256(pw.encode()).hexdigest()
-
-async def send(writer, data: dict):
-    writer.write((json.dumps(data) + "\n").encode("utf-8"))
-    await writer.drain()
-
-async def send_to(username: str, data: dict):
-    w = online.get(username)
-    if w:
-        await send(w, data)
-
-def _set_status(u: str, st: str):
-    if u in online:
-        status[u] = st
-
-def _clear_incoming_for(to_user: str):
-    """Remove incoming invite for to_user and corresponding outgoing mapping."""
-    from_user = incoming.pop(to_user, None)
-    if from_user:
-        s = outgoing.get(from_user)
-        if s:
-            s.discard(to_user)
-            if not s:
-                outgoing.pop(from_user, None)
-
-def _cancel_all_outgoing(from_user: str):
-    """Cancel all invites sent by from_user; notify recipients to close modal."""
-    tos = outgoing.pop(from_user, set())
-    for to_user in list(tos):
-        if incoming.get(to_user) == from_user:
-            incoming.pop(to_user, None)
-            # notify the recipient
-            # (if they later click accept, server will reject anyway)
-            asyncio.create_task(send_to(to_user, {"type": "INVITE_CANCELLED", "from": from_user}))
+        if is_reply and data.get("type") in REPLY_TYPES:
+            data = dict(data, rid=ctx[1])
+        line = dumps_line(data)
+    return ob.put(line)
+
+def post_to(username: str, data) -> bool:
+    s = sessions.get(username)
+    return post(s.writer, data) if s else False
+
+async def send(writer, data):
+    post(writer, data)
+
+async def send_to(username: str, data):
+    post_to(username, data)
+
+def _set_status(s, st: str):
+    if sessions.set_status(s, st):
+        _presence_event("STATUS", s)
+
+# USERS reply, encoded once per change of the online set / statuses
+_users_snapshot = None
+
+def _users_list():
+    global _users_snapshot
+    if _users_snapshot is None:
+        _users_snapshot = Encoded({"type": "USERS", "users": [s.info() for s in sessions]})
+    return _users_snapshot
+
+# ---------- presence push ----------
+def _presence_event(ev: str, s):
+    """Queue JOIN/LEAVE/STATUS for session s to every subscriber (latest state wins)."""
+    global _presence_flush, _users_snapshot
+    _users_snapshot = None
+    if not sessions.subscribers:
+        return
+    u = s.username
+    item = {"ev": ev, "username": u}
+    if ev != "LEAVE":
+        item["status"] = s.status
+    for sub in sessions.subscribers.values():
+        pending = sub.presence
+        prev = pending.get(u)
+        if ev == "STATUS" and prev and prev["ev"] == "JOIN":
+            pending[u] = dict(prev, status=item["status"])  # still news of a join
+        else:
+            pending[u] = item
+    if _presence_flush is None:
+        _presence_flush = asyncio.get_running_loop().call_later(PRESENCE_WINDOW, _flush_presence)
+
+def _flush_presence():
+    global _presence_flush
+    _presence_flush = None
+    # subscribers usually share the very same event dicts: encode each distinct batch once
+    encoded = {}
+    for sub in sessions.subscribers.values():
+        if sub.presence:
+            events = list(sub.presence.values())
+            sub.presence.clear()
+            key = tuple(map(id, events))
+            enc = encoded.get(key)
+            if enc is None:
+                enc = encoded[key] = Encoded({"type": "PRESENCE_DELTA", "events": events})
+            post(sub.writer, enc)
+
+def _notify_cancelled(from_user: str, tos):
+    # recipients close their invite modal (a late accept is rejected anyway)
+    for to_user in tos:
+        post_to(to_user, {"type": "INVITE_CANCELLED", "from": from_user})
+        m_invites.inc("cancelled")
 
 def safe_close(username: str):
-    # clear invites involving username
-    # 1) cancel all outgoing invites from username
-    _cancel_all_outgoing(username)
-    # 2) if username had an incoming invite, clear it
-    _clear_incoming_for(username)
-    status[username] = "free"
-
-    online.pop(username, None)
-    status.pop(username, None)
-    user_ip.pop(username, None)
-    udp_port.pop(username, None)
+    """Tear down username's session: cancel its invites, tell subscribers it left."""
+    quickmatch.leave(username)
+    s, cancelled = sessions.logout(username)
+    if s is None:
+        return
+    if s.grace is not None:
+        s.grace.cancel()
+        s.grace = None
+    _leave_match(s)
+    _notify_cancelled(username, cancelled)
+    _presence_event("LEAVE", s)
+
+# ---------- matches ----------
+def _start_match(first, second, via):
+    """Both players busy, their other invites and queue tickets dropped, MATCH_START to each. first shoots first."""
+    quickmatch.leave(first.username)
+    quickmatch.leave(second.username)
+    match_id = secrets.token_hex(4)
+    while match_id in sessions.matches:
+        match_id = secrets.token_hex(4)
+    m, cancelled = sessions.start_match(first, second, match_id, via, time.time())
+    m.deadline = wheel.schedule(MATCH_TIMEOUT, _match_expired, match_id)
+    for frm, to_user in cancelled:
+        _notify_cancelled(frm, (to_user,))
+    _presence_event("STATUS", first)
+    _presence_event("STATUS", second)
+
+    m_matches.inc(via)
+    route = relay.open(match_id, (first.username, second.username)) if relay.running else None
+    for me, peer, you_start in ((first, second, True), (second, first, False)):
+        start = {
+            "type": "MATCH_START",
+            "match_id": match_id,
+            "peer_username": peer.username,
+            "peer_ip": peer.ip,
+            "peer_udp_port": peer.udp_port,
+            "you_start": you_start
+        }
+        if route:
+            start["relay_port"] = RELAY_PORT
+            start["relay_token"] = route.token_for(me.username)
+        post(me.writer, start)
+
+def _leave_match(s):
+    match_id = s.match_id
+    m = sessions.leave_match(s)
+    if match_id:
+        relay.release(match_id, s.username)
+    if m is not None and m.players:
+        # the other player should report MATCH_END soon too; don't keep them busy for the full MATCH_TIMEOUT
+        m.deadline.cancel()
+        m.deadline = wheel.schedule(MATCH_ABANDON, _match_expired, match_id)
+
+def _match_expired(match_id):
+    """Deadline hit: free whoever never reported MATCH_END."""
+    m = sessions.matches.get(match_id)
+    if m is None:
+        return
+    m.deadline = None
+    m_matches_expired.inc()
+    for username in list(m.players):
+        s = sessions.get(username)
+        if s is not None and s.match_id == match_id:
+            post(s.writer, {"type": "MATCH_EXPIRED", "match_id": match_id})
+            sessions.leave_match(s)
+            _set_status(s, FREE)
+    sessions.matches.pop(match_id, None)
+    relay.close_route(match_id)
+
+def _quickmatch_try(ticket):
+    """Pair ticket now if anyone fits, else look again once its spread widens (or drop it on timeout)."""
+    now = asyncio.get_running_loop().time()
+    pair = quickmatch.pop_pair(ticket, now)
+    if pair:
+        first, second = sessions.get(pair[0].username), sessions.get(pair[1].username)
+        if first and second:
+            _start_match(first, second, "quickmatch")
+            return
+        # one of them logged out meanwhile: the other keeps waiting (and looks again right away)
+        for t, s in ((pair[0], first), (pair[1], second)):
+            if s is not None:
+                quickmatch.requeue(t)
+                _quickmatch_try(t)
+        return
+    waited = now - ticket.since
+    if waited >= QUICKMATCH_TIMEOUT:
+        quickmatch.leave(ticket.username)
+        post_to(ticket.username, {"type": "QUICKMATCH_TIMEOUT"})
+        m_quickmatch_timeouts.inc()
+        return
+    ticket.timer = wheel.schedule(min(WIDEN_EVERY, QUICKMATCH_TIMEOUT - waited), _quickmatch_retry, ticket)
+
+def _quickmatch_retry(ticket):
+    ticket.timer = None
+    if quickmatch.get(ticket.username) is ticket:
+        _quickmatch_try(ticket)
 
 # ---------- handlers ----------
 async def handle_register(msg, writer):
@@ -87,208 +326,640 @@ async def handle_register(msg, writer):
     email = (msg.get("email") or "").strip()
     pw = msg.get("password") or ""
     if not u:
-        return await send(writer, {"type": "ERROR", "message": "Username is required"})
+        return await send(writer, status_msg("ERROR", "Username is required"))
     if not email:
-        return await send(writer, {"type": "ERROR", "message": "Email is required"})
+        return await send(writer, status_msg("ERROR", "Email is required"))
     if not pw:
-        return await send(writer, {"type": "ERROR", "message": "Password is required"})
-    if u in users:
-        return await send(writer, {"type": "ERROR", "message": "Username already exists"})
-    users[u] = {"email": email, "password": hash_password(pw)}
-    save_users()
-    await send(writer, {"type": "OK", "message": "Registered successfully"})
-
-async def handle_login(msg, writer, addr):
+        return await send(writer, status_msg("ERROR", "Password is required"))
+    if await users.get(u) is not None:
+        return await send(writer, status_msg("ERROR", "Username already exists"))
+    try:
+        pw_hash = await hasher.hash(pw)
+    except Overloaded:
+        return await send(writer, status_msg("ERROR", "Server busy, try again"))
+    try:
+        added = await users.add(u, {"email": email, "password": pw_hash})
+    except sqlite3.Error:
+        return await send(writer, status_msg("ERROR", "Could not save the account, try again"))
+    if not added:
+        return await send(writer, status_msg("ERROR", "Username already exists"))
+    await send(writer, status_msg("OK", "Registered successfully"))
+
+async def _check_login(msg, writer):
+    """Password step of LOGIN (runs on the worker in multi-process mode)."""
     u = (msg.get("username") or "").strip()
     pw = msg.get("password") or ""
-    if u not in users:
-        await send(writer, {"type": "ERROR", "message": "User not found"})
+    try:
+        rec = await users.get(u, pending=False)  # committed accounts and hashes only
+    except sqlite3.Error:
+        await send(writer, status_msg("ERROR", "Server busy, try again"))
+        return None
+    if rec is None:
+        await send(writer, status_msg("ERROR", "User not found"))
         return None
-    if users[u]["password"] != hash_password(pw):
-        await send(writer, {"type": "ERROR", "message": "Wrong password"})
+    try:
+        ok, needs_rehash = await hasher.verify(pw, rec["password"])
+    except Overloaded:
+        await send(writer, status_msg("ERROR", "Server busy, try again"))
         return None
+    if not ok:
+        await send(writer, status_msg("ERROR", "Wrong password"))
+        return None
+    return u, rec, pw, needs_rehash
 
-    # kick old session
-    if u in online and online[u] is not writer:
-        try:
-            await send(online[u], {"type": "ERROR", "message": "Logged in elsewhere"})
-            online[u].close()
-        except Exception:
-            pass
+async def _upgrade_hash(u, rec, pw):
+    """Transparently upgrade legacy sha256 / old-parameter hashes."""
+    try:
+        await users.put(u, dict(rec, password=await hasher.hash(pw)))
+    except (Overloaded, sqlite3.Error):
+        pass  # the old hash still works; try again next login (the store logs write failures)
+
+def _hang_up(writer, reason):
+    """Tell an old connection why, flush, then close it."""
+    post(writer, status_msg("ERROR", reason))
+    ob = outboxes.get(writer)
+    if ob:
+        ob.close(close_writer=True)
+    else:
+        writer.close()
+
+def _start_session(u, writer, addr):
+    """Session step of LOGIN (runs on the broker in multi-process mode)."""
+    old = sessions.get(u)
+    if old is not None:
+        if old.writer is not None and old.writer is not writer:
+            _hang_up(old.writer, "Logged in elsewhere")  # kick old session
         safe_close(u)
 
-    online[u] = writer
-    status[u] = "free"
-    user_ip[u] = addr[0]
-    await send(writer, {"type": "OK", "message": "Login successful"})
+    s = sessions.login(u, writer, addr[0])
+    _presence_event("JOIN", s)
+    post(writer, {"type": "OK", "message": "Login successful", "token": resume_tokens.issue(u, s.sid)})
+    return u
+
+def _connection_lost(username, writer):
+    """Connection gone without LOGOUT: keep the session RESUME_GRACE seconds for a RESUME."""
+    s = _session(username, writer)
+    if s is None:
+        return
+    quickmatch.leave(username)  # a MATCH_START now would go nowhere
+    sessions.detach(s)
+    s.grace = wheel.schedule(RESUME_GRACE, _grace_expired, s)
+
+def _grace_expired(s):
+    s.grace = None
+    if sessions.get(s.username) is s and s.writer is None:
+        safe_close(s.username)
+
+def _session(username, writer):
+    """The caller's live session, or None (not logged in, or kicked by a newer login)."""
+    s = sessions.get(username)
+    return s if s is not None and s.writer is writer else None
+
+async def handle_login(msg, writer, addr, current=None):
+    """current: who this connection is logged in as already (None if nobody)."""
+    checked = await _check_login(msg, writer)
+    if not checked:
+        return None
+    u, rec, pw, needs_rehash = checked
+    if current and current != u:
+        await handle_logout(current, writer)  # re-login as someone else on one socket
+    _start_session(u, writer, addr)
+    if needs_rehash:
+        await _upgrade_hash(u, rec, pw)
     return u
 
+async def handle_resume(msg, writer, addr):
+    """Reattach a live or detached session to this connection; no password needed."""
+    claim = resume_tokens.verify(msg.get("token"))
+    s = sessions.get(claim[0]) if claim else None
+    if s is None or s.sid != claim[1]:
+        m_resumes.inc("rejected")
+        await send(writer, status_msg("ERROR", "Session expired, login again"))
+        return None
+
+    if s.writer is not None and s.writer is not writer:
+        # the old socket is dead but we haven't noticed yet
+        _hang_up(s.writer, "Resumed elsewhere")
+    if s.grace is not None:
+        s.grace.cancel()
+        s.grace = None
+    sessions.attach(s, writer, addr[0])
+    m_resumes.inc("ok")
+    await send(writer, {
+        "type": "OK",
+        "message": "Session resumed",
+        "token": resume_tokens.issue(s.username, s.sid),
+        "username": s.username,
+        "status": s.status,
+        "udp_port": s.udp_port,
+        "invite_from": sessions.invites.get(s.username),
+        "match_id": s.match_id,
+    })
+    return s.username
+
 async def handle_set_udp_port(msg, username, writer):
-    if not username:
-        return await send(writer, {"type": "ERROR", "message": "Login first"})
+    s = _session(username, writer)
+    if not s:
+        return await send(writer, status_msg("ERROR", "Login first"))
     try:
         p = int(msg.get("udp_port"))
         if p <= 0 or p > 65535:
             raise ValueError()
     except Exception:
-        return await send(writer, {"type": "ERROR", "message": "Invalid udp_port"})
-    udp_port[username] = p
+        return await send(writer, status_msg("ERROR", "Invalid udp_port"))
+    s.udp_port = p
     await send(writer, {"type": "OK", "message": f"UDP port set to {p}"})
 
 async def handle_list_users(writer):
-    data = [{"username": u, "status": status.get(u, "free")} for u in online.keys()]
-    await send(writer, {"type": "USERS", "users": data})
+    await send(writer, _users_list())
+
+async def handle_subscribe_presence(username, writer):
+    """Full USERS snapshot now, then PRESENCE_DELTA events as things change."""
+    s = _session(username, writer)
+    if not s:
+        return await send(writer, status_msg("ERROR", "Login first"))
+    sessions.subscribe(s)
+    await send(writer, _users_list())
 
 async def handle_invite(msg, username, writer):
-    if not username:
-        return await send(writer, {"type": "ERROR", "message": "Login first"})
+    s = _session(username, writer)
+    if not s:
+        return await send(writer, status_msg("ERROR", "Login first"))
 
     to_user = msg.get("to")
-    if not to_user or to_user not in online:
-        return await send(writer, {"type": "ERROR", "message": "User not online"})
+    if not to_user or to_user not in sessions:
+        return await send(writer, status_msg("ERROR", "User not online"))
     if to_user == username:
-        return await send(writer, {"type": "ERROR", "message": "Cannot invite yourself"})
+        return await send(writer, status_msg("ERROR", "Cannot invite yourself"))
 
-    if status.get(username) != "free":
-        return await send(writer, {"type": "ERROR", "message": "You are busy"})
-    if status.get(to_user) != "free":
-        return await send(writer, {"type": "ERROR", "message": "User is busy"})
+    if not sessions.is_free(username):
+        return await send(writer, status_msg("ERROR", "You are busy"))
+    if not sessions.is_free(to_user):
+        return await send(writer, status_msg("ERROR", "User is busy"))
 
     # Target can have only 1 incoming invite at a time
-    if to_user in incoming:
-        return await send(writer, {"type": "ERROR", "message": "User already has a pending invite"})
+    if to_user in sessions.invites:
+        return await send(writer, status_msg("ERROR", "User already has a pending invite"))
 
-    incoming[to_user] = username
-    outgoing.setdefault(username, set()).add(to_user)
+    sessions.invite(s, to_user, wheel.schedule(INVITE_TIMEOUT, _invite_expired, username, to_user))
+    m_invites.inc("sent")
 
     await send_to(to_user, {"type": "INVITE_RECEIVED", "from": username})
     await send(writer, {"type": "OK", "message": f"Invite sent to {to_user}"})
 
+def _invite_expired(from_user, to_user):
+    if not sessions.take_invite(to_user, from_user):
+        return
+    post_to(to_user, {"type": "INVITE_CANCELLED", "from": from_user, "reason": "expired"})
+    post_to(from_user, {"type": "INVITE_EXPIRED", "to": to_user})
+    m_invites.inc("expired")
+
 async def handle_invite_response(msg, username, writer):
-    if not username:
-        return await send(writer, {"type": "ERROR", "message": "Login first"})
+    s = _session(username, writer)
+    if not s:
+        return await send(writer, status_msg("ERROR", "Login first"))
 
     from_user = msg.get("from")
     accepted = bool(msg.get("accepted", False))
 
-    # Validate that username currently has an invite from from_user
-    if incoming.get(username) != from_user:
-        return await send(writer, {"type": "ERROR", "message": "Invite expired or not found"})
-
-    # Remove this invite from tables (whether accepted or declined)
-    _clear_incoming_for(username)
+    # Validate that username currently has an invite from from_user,
+    # and remove it from the tables (whether accepted or declined)
+    if not sessions.take_invite(username, from_user):
+        return await send(writer, status_msg("ERROR", "Invite expired or not found"))
 
     if not accepted:
+        m_invites.inc("declined")
         await send_to(from_user, {"type": "INVITE_DECLINED", "by": username})
-        return await send(writer, {"type": "OK", "message": "Invite declined"})
+        return await send(writer, status_msg("OK", "Invite declined"))
 
     # Re-check free state at accept time (race-safe)
-    if status.get(from_user) != "free" or status.get(username) != "free":
-        await send(writer, {"type": "ERROR", "message": "Cannot start match: one player is busy"})
-        await send_to(from_user, {"type": "ERROR", "message": "Match failed: player busy"})
+    inviter = sessions.get(from_user)
+    if inviter is not None and inviter.writer is None:
+        await send(writer, status_msg("ERROR", "Cannot start match: player is reconnecting"))
         return
-
-    if from_user not in udp_port or username not in udp_port:
-        await send(writer, {"type": "ERROR", "message": "UDP port missing (both players must set it)"})
-        await send_to(from_user, {"type": "ERROR", "message": "Match failed: UDP port missing"})
+    if inviter is None or not sessions.is_free(from_user) or not sessions.is_free(username):
+        await send(writer, status_msg("ERROR", "Cannot start match: one player is busy"))
+        await send_to(from_user, status_msg("ERROR", "Match failed: player busy"))
         return
 
-    # IMPORTANT FIX:
-    # As soon as match starts, inviter becomes busy and ALL other outgoing invites must be cancelled.
-    _set_status(from_user, "busy")
-    _set_status(username, "busy")
-    _cancel_all_outgoing(from_user)  # cancels remaining invites from inviter
-    _cancel_all_outgoing(username)   # (optional) cancels any from accepter too
-
-    match_id = secrets.token_hex(4)
-
-    await send_to(from_user, {
-        "type": "MATCH_START",
-        "match_id": match_id,
-        "peer_username": username,
-        "peer_ip": user_ip[username],
-        "peer_udp_port": udp_port[username],
-        "you_start": True
-    })
-    await send_to(username, {
-        "type": "MATCH_START",
-        "match_id": match_id,
-        "peer_username": from_user,
-        "peer_ip": user_ip[from_user],
-        "peer_udp_port": udp_port[from_user],
-        "you_start": False
-    })
-
-    await send(writer, {"type": "OK", "message": "Match starting"})
+    if inviter.udp_port is None or s.udp_port is None:
+        await send(writer, status_msg("ERROR", "UDP port missing (both players must set it)"))
+        await send_to(from_user, status_msg("ERROR", "Match failed: UDP port missing"))
+        return
 
-async def handle_logout(username):
-    if username:
+    m_invites.inc("accepted")
+    _start_match(inviter, s, "invite")
+    await send(writer, status_msg("OK", "Match starting"))
+
+async def handle_quickmatch(msg, username, writer):
+    s = _session(username, writer)
+    if not s:
+        return await send(writer, status_msg("ERROR", "Login first"))
+    if not sessions.is_free(username):
+        return await send(writer, status_msg("ERROR", "You are busy"))
+    if s.udp_port is None:
+        return await send(writer, status_msg("ERROR", "UDP port missing (set it first)"))
+    region = str(msg.get("region") or DEFAULT_REGION)[:16]
+    try:
+        rating = max(0, min(10000, int(msg.get("rating", DEFAULT_RATING))))
+    except (TypeError, ValueError):
+        return await send(writer, status_msg("ERROR", "Invalid rating"))
+
+    ticket = quickmatch.join(username, region, rating, asyncio.get_running_loop().time())
+    await send(writer, status_msg("OK", "Searching for a match"))
+    _quickmatch_try(ticket)
+
+async def handle_quickmatch_cancel(username, writer):
+    if not _session(username, writer):
+        return await send(writer, status_msg("ERROR", "Login first"))
+    if quickmatch.leave(username) is None:
+        return await send(writer, status_msg("ERROR", "Not in queue"))
+    await send(writer, status_msg("OK", "Left the queue"))
+
+async def handle_logout(username, writer=None):
+    # a connection kicked by a newer login must not tear down the new session
+    if username and (writer is None or sessions.owns(username, writer)):
         safe_close(username)
 
-async def handle_match_end(msg, username):
-    """
-    Called when a client finishes a match.
-    Frees this user and clears any pending invites involving them.
-    """
-    global pending_invite
-    if not username:
-        return
-
-    global pending_invite, status
+async def handle_match_end(msg, username, writer):
+    """Called when a client finishes a match: the player is free again."""
+    s = _session(username, writer)
+    if s:
+        _leave_match(s)
+        _set_status(s, FREE)
+
+def _rate_limited(limiter, cmd, writer) -> bool:
+    """True if the line must be dropped; limiter.abusive then says whether to hang up."""
+    if limiter is None:
+        return False
+    refused = limiter.check(cmd, time.monotonic())
+    if refused is None:
+        return False
+    m_rate_limited.inc(refused)
+    if limiter.abusive:
+        m_rate_kicks.inc()
+        post(writer, RATE_KICKED)
+    else:
+        post(writer, RATE_LIMITED)  # pre-encoded; strikes bound how many of these one peer gets
+    return True
+
+async def dispatch_line(line, username, writer, addr, limiter=None):
+    """Parse and run one client line (None: over-long, see LineFramer). Returns (username, keep_open)."""
+    _reply_to.set(None)
+    if line is None:
+        if _rate_limited(limiter, None, writer):
+            return username, not limiter.abusive
+        m_messages.inc("too_long")
+        await send(writer, LINE_TOO_LONG)
+        return username, True
+
+    msg = loads_line(line)
+    if msg is None:
+        if _rate_limited(limiter, None, writer):
+            return username, not limiter.abusive
+        m_messages.inc("invalid")
+        await send(writer, status_msg("ERROR", "Bad JSON"))
+        return username, True
+
+    rid = msg.get("rid")
+    _reply_to.set((writer, rid) if rid is not None else None)
+
+    cmd = msg.get("type")
+    if _rate_limited(limiter, cmd, writer):
+        return username, not limiter.abusive
+    label = cmd if cmd in COMMANDS else "unknown"
+    t0 = time.perf_counter()
+    try:
+        return await _dispatch(msg, cmd, username, writer, addr)
+    finally:
+        m_messages.inc(label)
+        m_latency.observe(time.perf_counter() - t0, label)
+
+async def _dispatch(msg, cmd, username, writer, addr):
+    if cmd == "REGISTER":
+        await handle_register(msg, writer)
+    elif cmd == "LOGIN":
+        username = await handle_login(msg, writer, addr, username) or username
+    elif cmd == "RESUME":
+        username = await handle_resume(msg, writer, addr) or username
+    elif cmd == "SET_UDP_PORT":
+        await handle_set_udp_port(msg, username, writer)
+    elif cmd == "LIST_USERS":
+        await handle_list_users(writer)
+    elif cmd == "SUBSCRIBE_PRESENCE":
+        await handle_subscribe_presence(username, writer)
+    elif cmd == "INVITE":
+        await handle_invite(msg, username, writer)
+    elif cmd == "INVITE_RESPONSE":
+        await handle_invite_response(msg, username, writer)
+    elif cmd == "QUICKMATCH":
+        await handle_quickmatch(msg, username, writer)
+    elif cmd == "QUICKMATCH_CANCEL":
+        await handle_quickmatch_cancel(username, writer)
+    elif cmd == "LOGOUT":
+        await handle_logout(username, writer)
+        return username, False
+    elif cmd == "MATCH_END":
+        await handle_match_end(msg, username, writer)
+    elif cmd == "PING":
+        await send(writer, PONG)
+    elif cmd == "PONG":
+        pass  # only proves the client is alive, which its Heartbeat already noted
+    else:
+        await send(writer, status_msg("ERROR", "Unknown command"))
+    return username, True
 
-    # mark user as free
-    status[username] = "free"
+def _heartbeat(writer):
+    return Heartbeat(wheel, lambda: post(writer, PING), lambda: _heartbeat_dead(writer))
 
-    # remove any pending invites involving this user
-    for to_u, from_u in list(pending_invite.items()):
-        if to_u == username or from_u == username:
-            pending_invite.pop(to_u, None)
+def _heartbeat_dead(writer):
+    """No answer to PING: drop the connection now (close() would wait to flush to a dead peer)."""
+    m_heartbeat_timeouts.inc()
+    writer.transport.abort()
 
 async def client_handler(reader, writer):
     addr = writer.get_extra_info("peername")
     username = None
+    outbox = outboxes[writer] = Outbox(writer)
+    limiter = RateLimiter(rate_limits, time.monotonic()) if rate_limits else None
+    framer = LineFramer()
+    hb = _heartbeat(writer)
+    m_connections.inc()
+    keep_open = True
     try:
-        while True:
-            line = await reader.readline()
-            if not line:
+        while keep_open:
+            data = await reader.read(READ_CHUNK)
+            if not data:
                 break
-            try:
-                msg = json.loads(line.decode("utf-8"))
-            except Exception:
-                await send(writer, {"type": "ERROR", "message": "Bad JSON"})
-                continue
+            hb.seen()
+            for line in framer.feed(data):
+                username, keep_open = await dispatch_line(line, username, writer, addr, limiter)
+                if not keep_open:
+                    break
+
+            # backpressure: don't take more requests while our replies are stuck
+            await outbox.wait_writable()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        hb.stop()
+        _connection_lost(username, writer)
+        if outbox.overflowed:
+            m_outbox_overflows.inc()
+        await outbox.aclose()
+        outboxes.pop(writer, None)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+# ---------- multi-process mode: broker side (see broker.py) ----------
+async def on_worker_frame(link, op, conn_id, payload):
+    _reply_to.set(None)
+    if op == "OPEN":
+        try:
+            addr = tuple(loads(payload))
+        except Exception:
+            addr = ("0.0.0.0", 0)
+        rc = link.conns[conn_id] = RemoteConn(link, conn_id, addr)
+        outboxes[rc] = RemoteOutbox(rc)
+        return
+
+    rc = link.conns.get(conn_id)
+    if rc is None:
+        return
+    if op in ("REQ", "LONG"):
+        line = payload if op == "REQ" else None
+        rc.username, keep_open = await dispatch_line(line, rc.username, rc, rc.addr)
+        if not keep_open:
+            rc.close()
+    elif op == "AUTH":
+        info = loads(payload)
+        rid = info.get("rid")
+        _reply_to.set((rc, rid) if rid is not None else None)
+        if rc.username and rc.username != info["username"]:
+            await handle_logout(rc.username, rc)  # re-login as someone else on one socket
+        rc.username = _start_session(info["username"], rc, rc.addr)
+    elif op == "GONE":
+        _connection_lost(rc.username, rc)
+        outboxes.pop(rc, None)
+        link.conns.pop(conn_id, None)
+
+async def on_worker_lost(link):
+    # the worker's clients reconnect to the others and RESUME
+    for rc in list(link.conns.values()):
+        _connection_lost(rc.username, rc)
+        outboxes.pop(rc, None)
+    link.conns.clear()
+
+# ---------- multi-process mode: worker side ----------
+class Worker:
+    """
+    One worker's state: its link to the broker and its client connections.
+    worker_main runs one per process; a test can run several in one loop
+    against a LocalBroker.
+    """
 
+    def __init__(self):
+        self.link = None     # BrokerClient (or a LocalBroker client in tests)
+        self.conns = {}      # conn id -> StreamWriter
+        self._next_conn_id = 0
+
+    def on_broker_frame(self, op, conn_id, payload):
+        w = self.conns.get(conn_id)
+        ob = outboxes.get(w) if w is not None else None
+        if ob is None:
+            return
+        if op == "OUT":
+            ob.put(payload + b"\n")
+        elif op == "CLOSE":
+            ob.close(close_writer=True)
+
+    async def _line(self, line, conn_id, writer, limiter) -> bool:
+        """One client line on a worker: login work here, the rest to the broker. False = hang up."""
+        _reply_to.set(None)
+        msg = loads_line(line) if line is not None else None
+        cmd = rid = None
+        if msg is not None:
             cmd = msg.get("type")
-            if cmd == "REGISTER":
-                await handle_register(msg, writer)
-            elif cmd == "LOGIN":
-                username = await handle_login(msg, writer, addr)
-            elif cmd == "SET_UDP_PORT":
-                await handle_set_udp_port(msg, username, writer)
-            elif cmd == "LIST_USERS":
-                await handle_list_users(writer)
-            elif cmd == "INVITE":
-                await handle_invite(msg, username, writer)
-            elif cmd == "INVITE_RESPONSE":
-                await handle_invite_response(msg, username, writer)
-            elif cmd == "LOGOUT":
-                await handle_logout(username)
-                break
-            elif cmd == "MATCH_END":
-                await handle_match_end(msg, username)
-            else:
-                await send(writer, {"type": "ERROR", "message": "Unknown command"})
+            rid = msg.get("rid")
+            _reply_to.set((writer, rid) if rid is not None else None)
+        # floods stop here, before they reach the broker
+        if _rate_limited(limiter, cmd, writer):
+            return not limiter.abusive
+        if line is None:
+            # answered by the broker, so it stays in order with the lines before it
+            self.link.send("LONG", conn_id)
+            return True
+        if msg is None:
+            # let the broker produce the same error the single-process server would
+            self.link.send("REQ", conn_id, line)
+            return True
+        if cmd == "PING" or cmd == "PONG":
+            # heartbeats belong to the connection, which lives here
+            if cmd == "PING":
+                post(writer, PONG)
+            m_messages.inc(cmd)
+            return True
+
+        t0 = time.perf_counter()
+        if cmd == "REGISTER":
+            await handle_register(msg, writer)
+        elif cmd == "LOGIN":
+            checked = await _check_login(msg, writer)
+            if checked:
+                u, rec, pw, needs_rehash = checked
+                self.link.send("AUTH", conn_id, dumps({"username": u, "rid": rid}))
+                if needs_rehash:
+                    await _upgrade_hash(u, rec, pw)
+        else:
+            self.link.send("REQ", conn_id, line)  # timed on the broker
+            return True
+        m_messages.inc(cmd)
+        m_latency.observe(time.perf_counter() - t0, cmd)
+        return True
+
+    async def client_handler(self, reader, writer):
+        """Like client_handler, but lobby commands are forwarded to the broker."""
+        self._next_conn_id += 1
+        conn_id = self._next_conn_id
+        self.conns[conn_id] = writer
+        outbox = outboxes[writer] = Outbox(writer)
+        limiter = RateLimiter(rate_limits, time.monotonic()) if rate_limits else None
+        framer = LineFramer()
+        hb = _heartbeat(writer)
+        m_connections.inc()
+        addr = writer.get_extra_info("peername")
+        self.link.send("OPEN", conn_id, dumps(list(addr[:2])))
+        keep_open = True
+        try:
+            while keep_open:
+                data = await reader.read(READ_CHUNK)
+                if not data:
+                    break
+                hb.seen()
+                for line in framer.feed(data):
+                    keep_open = await self._line(line, conn_id, writer, limiter)
+                    if not keep_open:
+                        break
+
+                await outbox.wait_writable()
+                # and don't forward more while the broker isn't keeping up
+                await self.link.wait_writable()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            hb.stop()
+            self.link.send("GONE", conn_id)
+            if outbox.overflowed:
+                m_outbox_overflows.inc()
+            await outbox.aclose()
+            outboxes.pop(writer, None)
+            self.conns.pop(conn_id, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+async def worker_main(index, sock_path, metrics_port, limits):
+    global rate_limits
+    rate_limits = limits
+    worker = Worker()
+    worker.link = BrokerClient(sock_path, worker.on_broker_frame)
+    await worker.link.connect()
+    server = await asyncio.start_server(worker.client_handler, HOST, PORT, reuse_port=True)
+    print(f"Worker {index} (pid {os.getpid()}) serving {HOST}:{PORT}")
+    wheel.start()
+    await start_metrics(metrics_port)
+    try:
+        async with server:
+            await worker.link.lost.wait()
     finally:
-        await handle_logout(username)
-        writer.close()
-        await writer.wait_closed()
+        wheel.stop()
+        metrics.close()
+        hasher.shutdown()
+        users.close()
+
+def run_worker(index, sock_path, metrics_port, limits):
+    try:
+        asyncio.run(worker_main(index, sock_path, metrics_port, limits))
+    except KeyboardInterrupt:
+        pass
+
+async def start_relay():
+    if RELAY_PORT:
+        await asyncio.get_running_loop().create_datagram_endpoint(lambda: relay, local_addr=(HOST, RELAY_PORT))
+        print(f"UDP relay on {HOST}:{RELAY_PORT}")
+
+def stop_relay():
+    if relay.transport is not None:
+        relay.transport.close()
+
+async def broker_main(n_workers, sock_path):
+    if os.path.exists(sock_path):
+        os.unlink(sock_path)
+    broker = BrokerServer(sock_path, on_worker_frame, on_worker_lost)
+    await broker.start()
+    await start_relay()  # the broker owns the matches, so it owns the relay too
+    wheel.start()
+    await start_metrics(METRICS_PORT)
+    print(f"Broker on {sock_path}, starting {n_workers} workers")
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=run_worker,
+                         args=(i, sock_path, METRICS_PORT + 1 + i if METRICS_PORT else 0, rate_limits),
+                         daemon=True) for i in range(n_workers)]
+    for p in procs:
+        p.start()
+    try:
+        while any(p.is_alive() for p in procs):
+            await asyncio.sleep(1.0)
+    finally:
+        wheel.stop()
+        stop_relay()
+        metrics.close()
+        broker.close()
+        for p in procs:
+            p.terminate()
+        if os.path.exists(sock_path):
+            os.unlink(sock_path)
 
 async def main():
-    load_users()
     server = await asyncio.start_server(client_handler, HOST, PORT)
     print(f"Server running on {HOST}:{PORT}")
-    async with server:
-        await server.serve_forever()
+    await start_relay()
+    wheel.start()
+    await start_metrics(METRICS_PORT)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        wheel.stop()
+        stop_relay()
+        metrics.close()
+        hasher.shutdown()
+        users.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Soccer Stars lobby server")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="run N worker processes on PORT (SO_REUSEPORT) behind a presence broker")
+    ap.add_argument("--broker-socket", default=BROKER_SOCKET)
+    ap.add_argument("--relay-port", type=int, default=RELAY_PORT, help="UDP relay port (0 = no relay)")
+    ap.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                    help="Prometheus /metrics on 127.0.0.1 (0 = off; workers use the following ports)")
+    ap.add_argument("--rate-limits", metavar="SPEC",
+                    help='per-connection limits as bucket=RATE/BURST,... (see ratelimit.py), or "off"')
+    args = ap.parse_args()
+    try:
+        rate_limits = parse_limits(args.rate_limits)
+    except ValueError as e:
+        ap.error(str(e))
+    RELAY_PORT = args.relay_port
+    METRICS_PORT = args.metrics_port
+    if args.workers > 0:
+        asyncio.run(broker_main(args.workers, args.broker_socket))
+    else:
+        asyncio.run(main())
\ No newline at end of file
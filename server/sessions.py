@@ -0,0 +1,210 @@
+# server/sessions.py
+"""
+Lobby sessions: one Session per logged-in user, held in a SessionRegistry.
+
+The registry owns every index over the sessions (by name, free users,
+pending invites, presence subscribers) and each transition below updates
+all of them together. None of them await, so on the event loop a handler
+never sees the indexes half-updated, and invite / accept / disconnect are
+a few dict and set operations regardless of how many users are online.
+
+A session whose connection dropped without LOGOUT is detached (writer is
+None) rather than removed, so RESUME can hand it to a new connection with
+its status, udp port and invites intact.
+
+Matches in progress are kept too (matches), so a match whose MATCH_END
+never arrives can be ended by its deadline instead of leaving both
+players busy forever.
+
+The registry only keeps state; server.py sends the notifications and runs
+the timers. Timers it hands over (invite and match deadlines) are
+cancelled here when what they guard goes away.
+"""
+import secrets
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+FREE = "free"
+BUSY = "busy"
+
+
+class Session:
+    __slots__ = ("username", "sid", "writer", "ip", "udp_port", "status", "match_id", "outgoing", "presence",
+                 "grace")
+
+    def __init__(self, username: str, writer, ip: str):
+        self.username = username
+        self.sid = secrets.token_hex(8)   # what a resume token is bound to
+        self.writer = writer          # StreamWriter, RemoteConn in multi-process mode, None while detached
+        self.ip = ip
+        self.udp_port: Optional[int] = None
+        self.status = FREE
+        self.match_id: Optional[str] = None
+        # invitees; allocated on the first invite, most sessions never send one
+        self.outgoing: Optional[Set[str]] = None
+        # username -> pending presence event, only while subscribed
+        self.presence: Optional[Dict[str, dict]] = None
+        # asyncio.TimerHandle that ends the session if it stays detached
+        self.grace = None
+
+    def info(self) -> dict:
+        return {"username": self.username, "status": self.status}
+
+
+class Match:
+    __slots__ = ("match_id", "players", "via", "started", "deadline")
+
+    def __init__(self, match_id: str, players: List[str], via: str, started: float):
+        self.match_id = match_id
+        self.players = players    # usernames that have not left yet
+        self.via = via
+        self.started = started
+        self.deadline = None      # timer that ends the match if MATCH_END never comes
+
+
+class SessionRegistry:
+    def __init__(self):
+        self.by_name: Dict[str, Session] = {}
+        self.free: Set[str] = set()
+        self.invites: Dict[str, str] = {}           # to_user -> from_user (one incoming per user)
+        self.invite_timers: Dict[str, object] = {}  # to_user -> expiry timer of that invite
+        self.subscribers: Dict[str, Session] = {}   # presence subscribers
+        self.matches: Dict[str, Match] = {}
+
+    # ---------- lookups ----------
+    def get(self, username: Optional[str]) -> Optional[Session]:
+        return self.by_name.get(username) if username else None
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.by_name
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def __iter__(self) -> Iterator[Session]:
+        return iter(self.by_name.values())
+
+    def is_free(self, username: str) -> bool:
+        return username in self.free
+
+    def owns(self, username: Optional[str], writer) -> bool:
+        """True if username's live session is on this connection."""
+        s = self.by_name.get(username) if username else None
+        return s is not None and s.writer is writer
+
+    # ---------- transitions ----------
+    def login(self, username: str, writer, ip: str) -> Session:
+        """New free session; the caller has already removed any older one."""
+        s = self.by_name[username] = Session(username, writer, ip)
+        self.free.add(username)
+        return s
+
+    def logout(self, username: str) -> Tuple[Optional[Session], List[str]]:
+        """Drop a session and every invite touching it. Returns (session, invitees cancelled)."""
+        s = self.by_name.pop(username, None)
+        if s is None:
+            return None, []
+        cancelled = self.cancel_outgoing(s)
+        self.clear_incoming(username)
+        self.free.discard(username)
+        self.subscribers.pop(username, None)
+        s.presence = None
+        return s, cancelled
+
+    def set_status(self, s: Session, status: str) -> bool:
+        """True if the status actually changed."""
+        if s.status == status:
+            return False
+        s.status = status
+        if status == FREE:
+            self.free.add(s.username)
+        else:
+            self.free.discard(s.username)
+        return True
+
+    def detach(self, s: Session):
+        """Connection lost: keep the session, but nothing can be sent to it."""
+        s.writer = None
+        self.subscribers.pop(s.username, None)
+        s.presence = None
+
+    def attach(self, s: Session, writer, ip: str):
+        """RESUME: hand the session to a new connection; tokens for the old sid stop working."""
+        s.writer = writer
+        s.ip = ip
+        s.sid = secrets.token_hex(8)
+
+    def subscribe(self, s: Session):
+        s.presence = {}
+        self.subscribers[s.username] = s
+
+    # ---------- invites ----------
+    def invite(self, frm: Session, to_user: str, timer=None):
+        self.invites[to_user] = frm.username
+        if timer is not None:
+            self.invite_timers[to_user] = timer
+        if frm.outgoing is None:
+            frm.outgoing = set()
+        frm.outgoing.add(to_user)
+
+    def _drop_invite_timer(self, to_user: str):
+        timer = self.invite_timers.pop(to_user, None)
+        if timer is not None:
+            timer.cancel()
+
+    def clear_incoming(self, to_user: str) -> Optional[str]:
+        """Remove to_user's pending invite (both directions). Returns the inviter."""
+        from_user = self.invites.pop(to_user, None)
+        self._drop_invite_timer(to_user)
+        if from_user:
+            frm = self.by_name.get(from_user)
+            if frm is not None and frm.outgoing:
+                frm.outgoing.discard(to_user)
+        return from_user
+
+    def take_invite(self, to_user: str, from_user: str) -> bool:
+        """Consume the invite from_user -> to_user if it is still pending."""
+        if from_user is None or self.invites.get(to_user) != from_user:
+            return False
+        self.clear_incoming(to_user)
+        return True
+
+    def cancel_outgoing(self, frm: Session) -> List[str]:
+        """Withdraw every invite frm sent. Returns the invitees that still had it."""
+        tos = frm.outgoing
+        frm.outgoing = None
+        if not tos:
+            return []
+        cancelled = []
+        for to_user in tos:
+            if self.invites.get(to_user) == frm.username:
+                del self.invites[to_user]
+                self._drop_invite_timer(to_user)
+                cancelled.append(to_user)
+        return cancelled
+
+    # ---------- matches ----------
+    def start_match(self, a: Session, b: Session, match_id: str, via: str,
+                    now: float) -> Tuple[Match, List[Tuple[str, str]]]:
+        """Both players busy and in a new Match, their outgoing invites withdrawn.
+        Returns (match, (from, to) pairs cancelled)."""
+        self.set_status(a, BUSY)
+        self.set_status(b, BUSY)
+        m = self.matches[match_id] = Match(match_id, [a.username, b.username], via, now)
+        a.match_id = b.match_id = match_id
+        return m, ([(a.username, t) for t in self.cancel_outgoing(a)] +
+                   [(b.username, t) for t in self.cancel_outgoing(b)])
+
+    def leave_match(self, s: Session) -> Optional[Match]:
+        """s is done with its match. Returns the match (dropped from matches once nobody is left)."""
+        m = self.matches.get(s.match_id) if s.match_id else None
+        s.match_id = None
+        if m is None:
+            return None
+        if s.username in m.players:
+            m.players.remove(s.username)
+        if not m.players:
+            del self.matches[m.match_id]
+            if m.deadline is not None:
+                m.deadline.cancel()
+                m.deadline = None
+        return m
@@ -0,0 +1,132 @@
+# server/timerwheel.py
+"""
+Hierarchical timer wheel for the server's many long, mostly-cancelled timers
+(heartbeats, resume grace, invite and match deadlines, quickmatch retries).
+
+Time is counted in ticks of `resolution` seconds. Level 0 has one slot per
+tick for the next SLOTS ticks; level 1 one slot per SLOTS ticks, and so on,
+so LEVELS levels cover SLOTS ** LEVELS ticks. A timer sits in the slot of
+the lowest level that can hold it. Whenever the level-0 hand completes a
+turn, the next slot of the level above is emptied into the levels below.
+
+schedule() and cancel() are a set add / remove; each tick fires one
+level-0 slot and, every SLOTS ticks, re-files one slot from above, so the
+cost per timer is O(1) amortized however many are pending. Nothing ever
+scans all timers. The whole wheel is driven by one loop callback per tick,
+instead of one asyncio TimerHandle (and heap entry) per timer.
+
+    wheel = TimerWheel()
+    wheel.start()
+    t = wheel.schedule(30.0, expire_invite, "bob")
+    t.cancel()
+"""
+import asyncio
+import time
+import traceback
+from typing import Callable, List, Optional, Set
+
+RESOLUTION = 0.1   # seconds per tick
+SLOT_BITS = 8
+SLOTS = 1 << SLOT_BITS
+LEVELS = 4         # 256 ** 4 ticks: years at RESOLUTION
+
+
+class Timer:
+    __slots__ = ("when", "callback", "args", "slot")
+
+    def __init__(self, when: int, callback: Callable, args: tuple):
+        self.when = when          # tick it fires on
+        self.callback = callback  # None once cancelled or fired
+        self.args = args
+        self.slot: Optional[Set["Timer"]] = None
+
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+        self.callback = None
+        self.args = ()
+
+    def cancelled(self) -> bool:
+        return self.callback is None
+
+
+class TimerWheel:
+    def __init__(self, resolution: float = RESOLUTION, clock: Callable[[], float] = time.monotonic):
+        self.resolution = resolution
+        self.clock = clock
+        self.now_tick = int(clock() / resolution)
+        self._levels: List[List[Set[Timer]]] = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return sum(len(slot) for level in self._levels for slot in level)
+
+    # ---------- timers ----------
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """Run callback(*args) in about delay seconds (rounded up to a tick)."""
+        ticks = max(1, -int(-delay // self.resolution))
+        t = Timer(self.now_tick + ticks, callback, args)
+        self._file(t)
+        return t
+
+    def _file(self, t: Timer):
+        delta = t.when - self.now_tick
+        for level in range(LEVELS):
+            if delta < SLOTS << (SLOT_BITS * level) or level == LEVELS - 1:
+                slot = self._levels[level][(t.when >> (SLOT_BITS * level)) & (SLOTS - 1)]
+                slot.add(t)
+                t.slot = slot
+                return
+
+    # ---------- driving ----------
+    def advance(self, now: Optional[float] = None):
+        """Fire everything due up to now (clock() by default)."""
+        target = int((self.clock() if now is None else now) / self.resolution)
+        while self.now_tick < target:
+            self.now_tick += 1
+            tick = self.now_tick
+            for level in range(1, LEVELS):
+                if tick & ((1 << (SLOT_BITS * level)) - 1):
+                    break
+                self._cascade(self._levels[level][(tick >> (SLOT_BITS * level)) & (SLOTS - 1)])
+            self._fire(self._levels[0][tick & (SLOTS - 1)])
+
+    def _cascade(self, slot: Set[Timer]):
+        timers = list(slot)
+        slot.clear()
+        for t in timers:
+            self._file(t)
+
+    def _fire(self, slot: Set[Timer]):
+        if not slot:
+            return
+        due = list(slot)
+        slot.clear()
+        for t in due:
+            t.slot = None  # a callback cancelling a later timer in `due` just clears it
+        for t in due:
+            callback, args = t.callback, t.args
+            if callback is None:
+                continue
+            t.callback = None
+            t.args = ()
+            self.fired += 1
+            try:
+                callback(*args)
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        """Tick on the running event loop until stop()."""
+        self._handle = asyncio.get_running_loop().call_later(self.resolution, self._tick)
+
+    def _tick(self):
+        self.advance()
+        self._handle = asyncio.get_running_loop().call_later(self.resolution, self._tick)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
@@ -0,0 +1,247 @@
+# server/userstore.py
+"""
+User accounts in SQLite (WAL mode).
+
+Lookups are indexed by username, run on a reader thread and keep the most
+recently used CACHE_MAX records; nothing is loaded up front. Writes are
+queued and committed in batches by a background thread, so neither
+REGISTER nor LOGIN blocks the event loop on disk I/O. Every write returns
+a future that says whether it was committed, at most BATCH_WINDOW after
+it was queued. Until then the record is pending: get() shows it unless
+asked for committed data only, and a failed write is simply dropped again.
+"""
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    email    TEXT NOT NULL,
+    password TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+# a new account never overwrites one that exists (rowcount 0 -> name taken);
+# put() updates the record of an existing one (e.g. a rehashed password)
+INSERT_NEW = ("INSERT INTO users (username, email, password) VALUES (?, ?, ?) "
+              "ON CONFLICT(username) DO NOTHING")
+UPSERT = ("INSERT INTO users (username, email, password) VALUES (?, ?, ?) "
+          "ON CONFLICT(username) DO UPDATE SET email = excluded.email, password = excluded.password")
+
+# how long the writer waits for more writes to join a batch
+BATCH_WINDOW = 0.05
+BATCH_MAX = 500
+# records kept in memory (least recently used go first); pending writes don't count
+CACHE_MAX = 10000
+
+
+class UserStore:
+    def __init__(self, db_path: Path, legacy_json: Optional[Path] = None, cache_max: int = CACHE_MAX):
+        self.db_path = Path(db_path)
+        self.legacy_json = legacy_json
+        self.cache_max = cache_max
+
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._pending: Dict[str, dict] = {}   # queued, not yet committed
+        self._conn: Optional[sqlite3.Connection] = None   # only used on the reader thread
+        self._reads = ThreadPoolExecutor(max_workers=1, thread_name_prefix="userstore")
+        self._ready = threading.Event()       # legacy import done, reads may start
+
+        self._writes: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.write_failures = 0
+
+    # ---------- lifecycle ----------
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(SCHEMA)
+        return conn
+
+    def _start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """One-time import of the old users.json into an empty database."""
+        if not self.legacy_json or not Path(self.legacy_json).exists():
+            return
+        if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        with open(self.legacy_json, "r", encoding="utf-8") as f:
+            old = json.load(f).get("users", {})
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, email, password) VALUES (?, ?, ?)",
+                [(u, r.get("email", ""), r.get("password", "")) for u, r in old.items()],
+            )
+
+    def flush(self):
+        """Block until every queued write is committed."""
+        if self._writer is not None:
+            self._writes.join()
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        self._reads.submit(self._close_reader).result()
+        self._reads.shutdown(wait=True)
+
+    def _close_reader(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- reads ----------
+    async def get(self, username: str, pending: bool = True) -> Optional[dict]:
+        """
+        A user's record, or None. pending=False skips writes not committed yet:
+        LOGIN checks passwords against those only, so it never succeeds on an
+        account (or hash) whose write then fails and is dropped.
+        """
+        rec = self._pending.get(username) if pending else None
+        if rec is not None:
+            return rec
+        rec = self._cache.get(username)
+        if rec is not None:
+            self._cache.move_to_end(username)
+            return rec
+        self._start()
+        row = await asyncio.get_running_loop().run_in_executor(self._reads, self._select, username)
+        # a write may have landed while we were away; it is newer than the row
+        rec = (self._pending.get(username) if pending else None) or self._cache.get(username)
+        if rec is not None:
+            return rec
+        if row is None:
+            return None
+        rec = {"email": row[0], "password": row[1]}
+        self._remember(username, rec)
+        return rec
+
+    def _select(self, username: str):
+        """Reader thread: one indexed lookup."""
+        self._ready.wait()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn.execute(
+            "SELECT email, password FROM users WHERE username = ?", (username,)
+        ).fetchone()
+
+    def sizes(self) -> dict:
+        return {"cached": len(self._cache), "pending": len(self._pending)}
+
+    def _remember(self, username: str, rec: dict):
+        self._cache[username] = rec
+        self._cache.move_to_end(username)
+        while len(self._cache) > self.cache_max:
+            self._cache.popitem(last=False)
+
+    # ---------- writes ----------
+    async def add(self, username: str, record: dict) -> bool:
+        """
+        Create a user; False if the name is taken. The table decides, not the
+        cache: another worker process may have registered it a moment ago.
+        Raises sqlite3.Error if it could not be stored.
+        """
+        if username in self._pending or await self.get(username) is not None:
+            return False
+        return await self._queue(INSERT_NEW, username, record)
+
+    def put(self, username: str, record: dict) -> "asyncio.Future":
+        """Insert or update a user record; the future is True once committed, or raises sqlite3.Error."""
+        return self._queue(UPSERT, username, record)
+
+    def _queue(self, sql: str, username: str, record: dict) -> "asyncio.Future":
+        rec = {"email": record.get("email", ""), "password": record["password"]}
+        self._pending[username] = rec
+        self._start()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        fut.add_done_callback(lambda f: self._written(username, rec, f))
+        self._writes.put((sql, username, rec["email"], rec["password"], loop, fut))
+        return fut
+
+    def _written(self, username: str, rec: dict, fut: "asyncio.Future"):
+        """Loop thread: a queued write finished; only a committed record goes into the cache."""
+        if self._pending.get(username) is not rec:
+            return   # a newer write for this user is still queued
+        del self._pending[username]
+        self._cache.pop(username, None)
+        if not fut.cancelled() and fut.exception() is None and fut.result():
+            self._remember(username, rec)
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            self._import_legacy(conn)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"[userstore] legacy import from {self.legacy_json} failed: {e}")
+        self._ready.set()
+        stop = False
+        while not stop:
+            item = self._writes.get()
+            batch = []
+            taken = 1
+            if item is None:
+                stop = True
+            else:
+                batch.append(item)
+                # the window runs from the batch's first write, so none waits longer than BATCH_WINDOW
+                deadline = time.monotonic() + BATCH_WINDOW
+                while len(batch) < BATCH_MAX:
+                    try:
+                        item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    taken += 1
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+            try:
+                if batch:
+                    # one transaction, but row by row: each write learns whether it took
+                    with conn:
+                        done = [conn.execute(item[0], item[1:4]).rowcount == 1 for item in batch]
+                    for item, ok in zip(batch, done):
+                        self._resolve(item, ok)
+            except sqlite3.Error as e:
+                self.write_failures += len(batch)
+                print(f"[userstore] write failed, {len(batch)} row(s) dropped "
+                      f"({', '.join(item[1] for item in batch)}): {e}")
+                for item in batch:
+                    self._resolve(item, e)
+            finally:
+                for _ in range(taken):
+                    self._writes.task_done()
+        conn.close()
+
+    @staticmethod
+    def _resolve(item, result):
+        """Writer thread: hand a write's outcome (True, False if the name was taken, or the error) back to its loop."""
+        loop, fut = item[4], item[5]
+
+        def done():
+            if fut.done():
+                return
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+        try:
+            loop.call_soon_threadsafe(done)
+        except RuntimeError:
+            pass   # loop already closed (shutdown): nobody is waiting any more
@@ -1,18 +1,129 @@
 # shared/netcodec.py
+"""
+Line-JSON codec shared by client and server: one compact JSON object per line.
+
+Uses orjson when it is installed (same wire format, much less CPU per
+message), the standard json module otherwise. BACKEND says which one.
+
+Messages that repeat verbatim (status replies, USERS snapshots) can be
+encoded once into an Encoded and queued many times; a request id is
+spliced onto the cached bytes instead of re-encoding the whole dict.
+
+LineFramer cuts a byte stream into lines with a hard cap on line length,
+so a peer that never sends a newline costs at most max_line bytes.
+"""
 import json
-from typing import Any, Dict, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+if orjson is not None:
+    BACKEND = "orjson"
+    _OPTS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """Compact JSON bytes, no newline."""
+        return orjson.dumps(obj, option=_OPTS)
+
+    _loads = orjson.loads
+    _DecodeError = orjson.JSONDecodeError
+else:
+    BACKEND = "json"
+    _encode = json.JSONEncoder(separators=(",", ":")).encode
+
+    def dumps(obj: Any) -> bytes:
+        """Compact JSON bytes, no newline."""
+        return _encode(obj).encode("utf-8")
+
+    _loads = json.loads
+    _DecodeError = ValueError
+
+
+def loads(data: bytes) -> Any:
+    """Decode JSON bytes; raises ValueError if invalid."""
+    return _loads(data)
+
 
 def dumps_line(msg: Dict[str, Any]) -> bytes:
     """Encode dict as compact JSON + newline."""
-    return (json.dumps(msg, separators=(",", ":")) + "\n").encode("utf-8")
+    return dumps(msg) + b"\n"
+
 
 def loads_line(line: bytes) -> Optional[Dict[str, Any]]:
     """Decode one JSON line -> dict, or None if invalid."""
     try:
-        s = line.decode("utf-8").strip()
-        if not s:
-            return None
-        obj = json.loads(s)
-        return obj if isinstance(obj, dict) else None
-    except Exception:
-        return None
\ No newline at end of file
+        obj = _loads(line)
+    except (_DecodeError, UnicodeDecodeError, TypeError):
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+class Encoded:
+    """A message encoded once, to be queued as often as needed."""
+    __slots__ = ("type", "line", "_head")
+
+    def __init__(self, msg: Dict[str, Any]):
+        if not msg:
+            raise ValueError("cannot pre-encode an empty message")
+        self.type = msg.get("type")
+        self.line = dumps_line(msg)
+        self._head = self.line[:-2]  # without the closing "}\n"
+
+    def with_rid(self, rid: Any) -> bytes:
+        return self._head + b',"rid":' + dumps(rid) + b"}\n"
+
+
+@lru_cache(maxsize=1024)
+def status_msg(type_: str, message: str) -> Encoded:
+    """Cached {"type": type_, "message": message}, e.g. status_msg("ERROR", "Login first")."""
+    return Encoded({"type": type_, "message": message})
+
+
+# client requests are a few hundred bytes; anything near this is not ours
+MAX_LINE = 16 * 1024
+
+
+class LineFramer:
+    """
+    Splits received chunks into lines (without the newline).
+
+    feed() returns every line completed by the chunk, in order. A line
+    longer than max_line comes out as None, once, as soon as it is known
+    to be too long; the rest of it is skipped up to its newline. Only an
+    unfinished line is buffered, so memory per connection stays below
+    max_line.
+    """
+    __slots__ = ("max_line", "_buf", "_skipping")
+
+    def __init__(self, max_line: int = MAX_LINE):
+        self.max_line = max_line
+        self._buf = bytearray()
+        self._skipping = False
+
+    def feed(self, data: bytes) -> List[Optional[bytes]]:
+        parts = data.split(b"\n")
+        tail = parts.pop()  # after the last newline: unfinished
+        out: List[Optional[bytes]] = []
+        if parts:
+            if self._skipping:
+                self._skipping = False
+                del parts[0]  # end of a line already reported as too long
+            elif self._buf:
+                parts[0] = bytes(self._buf) + parts[0]
+                self._buf.clear()
+            limit = self.max_line
+            for line in parts:
+                out.append(line if len(line) <= limit else None)
+        if self._skipping:
+            return out
+        if len(self._buf) + len(tail) > self.max_line:
+            self._buf.clear()
+            self._skipping = True
+            out.append(None)
+        elif tail:
+            self._buf += tail
+        return out
@@ -0,0 +1,59 @@
+# shared/netstats.py
+import threading
+from collections import deque
+from typing import Any, Deque, Dict
+
+
+def _pick(xs, p: float) -> float:
+    """Nearest-rank p-th percentile of sorted, non-empty xs."""
+    return xs[min(len(xs) - 1, max(0, int(round(p / 100.0 * (len(xs) - 1)))))]
+
+
+class RollingHistogram:
+    """Keeps the last `size` samples; percentiles are computed on demand."""
+
+    def __init__(self, size: int = 256):
+        self._xs: Deque[float] = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, x: float):
+        self._xs.append(float(x))
+        self.count += 1
+        self.total += float(x)
+
+    def percentile(self, p: float) -> float:
+        return _pick(sorted(self._xs), p) if self._xs else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        if not self._xs:
+            return {"n": 0}
+        xs = sorted(self._xs)
+        return {"n": self.count, "p50": _pick(xs, 50), "p95": _pick(xs, 95), "max": xs[-1]}
+
+
+class NetStats:
+    """Thread-safe counters + rolling histograms shared by the network threads; read them with snapshot()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.hists: Dict[str, RollingHistogram] = {}
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            h = self.hists.get(name)
+            if h is None:
+                h = self.hists[name] = RollingHistogram()
+            h.add(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self.counters)
+            for name, h in self.hists.items():
+                out[name] = h.summary()
+        return out
@@ -0,0 +1,126 @@
+# shared/snapshot.py
+"""
+Quantized, delta-encoded state snapshots for P2P resync.
+
+A snapshot row is [id, x, y, vx, vy] as ints:
+  x, y   in 1/POS_SCALE px
+  vx, vy in 1/VEL_SCALE px/s
+
+Keyframes carry every disc. Deltas carry only the rows that changed
+against a base snapshot the receiver has acknowledged (the "ack" field
+of SNAPSHOT_REQ). Every KEYFRAME_EVERY-th snapshot is a keyframe, so a
+lost base can never wedge the resync.
+"""
+from typing import Any, Dict, List, Optional
+
+POS_SCALE = 8
+VEL_SCALE = 4
+
+KEYFRAME_EVERY = 8
+HISTORY = 8
+
+Row = List[int]
+
+
+def quantize_snapshot(snap: Dict[str, Any]) -> Dict[int, Row]:
+    """make_snapshot() dict -> {id: row}."""
+    rows: Dict[int, Row] = {}
+    for item in snap.get("discs", []):
+        try:
+            did = int(item["id"])
+            rows[did] = [
+                did,
+                int(round(float(item["x"]) * POS_SCALE)),
+                int(round(float(item["y"]) * POS_SCALE)),
+                int(round(float(item.get("vx", 0.0)) * VEL_SCALE)),
+                int(round(float(item.get("vy", 0.0)) * VEL_SCALE)),
+            ]
+        except Exception:
+            continue
+    return rows
+
+
+def dequantize_rows(rows: Dict[int, Row], turn_team: int) -> Dict[str, Any]:
+    """{id: row} -> make_snapshot() shaped dict."""
+    discs = []
+    for did in sorted(rows):
+        _, x, y, vx, vy = rows[did]
+        discs.append({
+            "id": did,
+            "x": x / POS_SCALE,
+            "y": y / POS_SCALE,
+            "vx": vx / VEL_SCALE,
+            "vy": vy / VEL_SCALE,
+        })
+    return {"discs": discs, "turn_team": int(turn_team)}
+
+
+class SnapshotEncoder:
+    """Sender side: remembers what it sent so it can delta against an acked base."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._seq = 0
+        self._since_key = KEYFRAME_EVERY
+        self._sent: Dict[int, Dict[int, Row]] = {}
+
+    def encode(self, snap: Dict[str, Any], ack: Optional[int] = None) -> Dict[str, Any]:
+        rows = quantize_snapshot(snap)
+        self._seq += 1
+        seq = self._seq
+
+        base = self._sent.get(ack) if ack is not None else None
+        if base is None or self._since_key >= KEYFRAME_EVERY:
+            payload = {"seq": seq, "k": 1, "d": [rows[i] for i in sorted(rows)]}
+            self._since_key = 1
+        else:
+            changed = [rows[i] for i in sorted(rows) if base.get(i) != rows[i]]
+            payload = {"seq": seq, "base": int(ack), "d": changed}
+            self._since_key += 1
+        payload["turn"] = int(snap.get("turn_team", 0))
+
+        self._sent[seq] = rows
+        if len(self._sent) > HISTORY:
+            self._sent.pop(min(self._sent))
+        return payload
+
+
+class SnapshotDecoder:
+    """Receiver side: rebuilds full snapshots and tracks the base to acknowledge."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ack: Optional[int] = None
+        self._recv: Dict[int, Dict[int, Row]] = {}
+
+    def decode(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns a make_snapshot() shaped dict, or None if the base is unknown."""
+        try:
+            seq = int(payload["seq"])
+            items = payload.get("d", [])
+            if payload.get("k"):
+                rows: Dict[int, Row] = {}
+            else:
+                base = self._recv.get(int(payload["base"]))
+                if base is None:
+                    return None
+                rows = dict(base)
+            for r in items:
+                row = [int(v) for v in r]
+                if len(row) != 5:
+                    return None
+                rows[row[0]] = row
+            turn = int(payload.get("turn", 0))
+        except Exception:
+            return None
+
+        self._recv[seq] = rows
+        if len(self._recv) > HISTORY:
+            self._recv.pop(min(self._recv))
+        if self.ack is None or seq > self.ack:
+            self.ack = seq
+        return dequantize_rows(rows, turn)
@@ -0,0 +1,112 @@
+# shared/statehash.py
+"""
+Per-tick state hash over quantized disc positions and velocities.
+
+Each disc's row [id, x, y, vx, vy] is quantized the way a snapshot row is
+(shared.snapshot scales) and packed into one buffer; the world hash is
+the XOR of a 64-bit digest of every row. update() re-digests only the
+rows whose quantized values changed since the last call, so a world at
+rest costs a few integer compares and a moving one a digest per moving
+disc: cheap enough to hash every physics step.
+
+HashRing keeps the last SIZE per-tick hashes, so a hash the peer took at
+tick t is checked against ours at t, not against whatever we have now.
+It can keep each tick's exact disc rows alongside, which is what
+client/desync.py needs to say which discs differ at a tick and to
+re-simulate from there.
+"""
+import struct
+from hashlib import blake2b
+from typing import Dict, List, Optional, Sequence
+
+from shared.snapshot import POS_SCALE, VEL_SCALE
+
+ROW = struct.Struct("<iiiii")
+SIZE = 1024   # ticks of history (8.5s at 120 ticks/s)
+
+
+def hash_hex(value: int) -> str:
+    """Wire form of a hash (STATE_HASH "hash")."""
+    return f"{value:016x}"
+
+
+def _quantize(did: int, x: float, y: float, vx: float, vy: float) -> tuple:
+    return (did, round(x * POS_SCALE), round(y * POS_SCALE), round(vx * VEL_SCALE), round(vy * VEL_SCALE))
+
+
+def _digest(packed) -> int:
+    return int.from_bytes(blake2b(packed, digest_size=8).digest(), "little")
+
+
+def disc_digests(rows: Sequence[tuple]) -> Dict[int, int]:
+    """Exact (id, x, y, vx, vy) rows -> {id: the digest StateHasher uses for that disc}."""
+    return {int(r[0]): _digest(ROW.pack(*_quantize(*r))) for r in rows}
+
+
+class StateHasher:
+    __slots__ = ("_buf", "_rows", "_digests", "value")
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._rows: List[Optional[tuple]] = []
+        self._digests: List[int] = []
+        self.value = 0
+
+    def update(self, discs) -> int:
+        """Bring the hash up to date with discs (same list, same order every call) and return it."""
+        if len(discs) != len(self._rows):
+            self._buf = bytearray(ROW.size * len(discs))
+            self._rows = [None] * len(discs)
+            self._digests = [0] * len(discs)
+            self.value = 0
+        buf, rows, digests = self._buf, self._rows, self._digests
+        h = self.value
+        for i, d in enumerate(discs):
+            p, v = d.pos, d.vel
+            row = _quantize(d.id, p.x, p.y, v.x, v.y)
+            if row != rows[i]:
+                rows[i] = row
+                off = i * ROW.size
+                ROW.pack_into(buf, off, *row)
+                new = _digest(buf[off:off + ROW.size])
+                h ^= digests[i] ^ new
+                digests[i] = new
+        self.value = h
+        return h
+
+
+class HashRing:
+    """The hashes (and optionally states) of the last size ticks; ticks are pushed in increasing order."""
+    __slots__ = ("size", "_ticks", "_values", "_states", "last")
+
+    def __init__(self, size: int = SIZE):
+        self.size = size
+        self._ticks = [-1] * size
+        self._values = [0] * size
+        self._states: List[Optional[tuple]] = [None] * size
+        self.last = -1   # newest tick pushed
+
+    def clear(self):
+        self._ticks = [-1] * self.size
+        self.last = -1
+
+    def push(self, tick: int, value: int, state: Optional[tuple] = None):
+        i = tick % self.size
+        self._ticks[i] = tick
+        self._values[i] = value
+        self._states[i] = state
+        self.last = tick
+
+    def get(self, tick: int) -> Optional[int]:
+        """Hash at tick, or None if it was never pushed or has been overwritten."""
+        if tick < 0:
+            return None
+        i = tick % self.size
+        return self._values[i] if self._ticks[i] == tick else None
+
+    def state(self, tick: int) -> Optional[tuple]:
+        """What was pushed with the hash at tick, or None."""
+        if tick < 0:
+            return None
+        i = tick % self.size
+        return self._states[i] if self._ticks[i] == tick else None
@@ -0,0 +1,11 @@
+# tests/conftest.py
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# the server's modules import each other by bare name (server/server.py runs as a script)
+for path in (ROOT, os.path.join(ROOT, "server")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
@@ -0,0 +1,93 @@
+# tests/test_broker.py
+"""Two workers behind one LocalBroker, in one event loop: INVITE -> MATCH_START across them."""
+import asyncio
+import json
+
+import server
+from broker import LocalBroker, decode_frame, encode_frame
+from userstore import UserStore
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.rid = 0
+
+    async def send(self, msg):
+        self.writer.write((json.dumps(msg) + "\n").encode())
+        await self.writer.drain()
+
+    async def request(self, msg):
+        """Send with a rid and wait for the reply carrying it."""
+        self.rid += 1
+        await self.send(dict(msg, rid=self.rid))
+        return await self.wait_for(lambda m: m.get("rid") == self.rid)
+
+    async def wait_for(self, match, timeout=5.0):
+        async def read():
+            while True:
+                msg = json.loads(await self.reader.readline())
+                if match(msg):
+                    return msg
+        return await asyncio.wait_for(read(), timeout)
+
+
+async def _login(port, username):
+    c = Client(*await asyncio.open_connection("127.0.0.1", port))
+    reply = await c.request({"type": "REGISTER", "username": username, "email": f"{username}@x.y", "password": "pw"})
+    assert reply["type"] == "OK", reply
+    assert (await c.request({"type": "LOGIN", "username": username, "password": "pw"}))["type"] == "OK"
+    assert (await c.request({"type": "SET_UDP_PORT", "udp_port": 10001}))["type"] == "OK"
+    return c
+
+
+async def _invite_across_workers():
+    broker = LocalBroker(server.on_worker_frame, server.on_worker_lost)
+    workers, listeners = [], []
+    for _ in range(2):
+        w = server.Worker()
+        w.link = broker.connect_worker(w.on_broker_frame)
+        workers.append(w)
+        listeners.append(await asyncio.start_server(w.client_handler, "127.0.0.1", 0))
+    server.wheel.start()
+    try:
+        ports = [ls.sockets[0].getsockname()[1] for ls in listeners]
+        alice = await _login(ports[0], "alice")
+        bob = await _login(ports[1], "bob")
+        assert workers[0].conns and workers[1].conns  # one client on each worker
+
+        assert (await alice.request({"type": "INVITE", "to": "bob"}))["type"] == "OK"
+        await bob.wait_for(lambda m: m.get("type") == "INVITE_RECEIVED" and m.get("from") == "alice")
+        await bob.send({"type": "INVITE_RESPONSE", "from": "alice", "accepted": True})
+
+        a_start = await alice.wait_for(lambda m: m.get("type") == "MATCH_START")
+        b_start = await bob.wait_for(lambda m: m.get("type") == "MATCH_START")
+        assert a_start["match_id"] == b_start["match_id"]
+        assert (a_start["peer_username"], a_start["you_start"]) == ("bob", True)
+        assert (b_start["peer_username"], b_start["you_start"]) == ("alice", False)
+        assert not server.sessions.is_free("alice") and not server.sessions.is_free("bob")
+
+        for c in (alice, bob):
+            c.writer.close()
+    finally:
+        server.wheel.stop()
+        for ls in listeners:
+            ls.close()
+        for w in workers:
+            w.link.close()
+        await asyncio.sleep(0.05)
+
+
+def test_invite_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "users", UserStore(tmp_path / "users.db"))
+    try:
+        asyncio.run(_invite_across_workers())
+    finally:
+        server.users.close()
+
+
+def test_frame_round_trip():
+    line = b'{"type":"INVITE","to":"bob b"}'
+    assert decode_frame(encode_frame("REQ", 42, line)) == ("REQ", 42, line)
+    assert decode_frame(encode_frame("GONE", 7)) == ("GONE", 7, b"")
+    assert decode_frame(b"garbage\n") is None
@@ -0,0 +1,45 @@
+import math
+import random
+
+from client import replay
+from client.game_world import GameWorld
+
+DT = 1.0 / replay.TICK_RATE
+
+
+def _play(seed, shots, steps_per_frame):
+    """
+    Shots as GameScreen plays them: steps_per_frame physics steps, then
+    any_moving() once per frame. steps_per_frame=None steps until every
+    disc has stopped without calling it, like ReplayPlayer and the desync
+    bisection do.
+    """
+    w = GameWorld(you_team=0, start_turn_team=0)
+    rng = random.Random(seed)
+    rests = []
+    for _ in range(shots):
+        piece = rng.choice([d.id for d in w.discs if d.team == w.turn_team])
+        w.apply_shot(piece, rng.uniform(-math.pi, math.pi), rng.uniform(0.3, 1.0))
+        for frame in range(20 * replay.TICK_RATE // (steps_per_frame or 1)):
+            for _ in range(steps_per_frame or 1):
+                w.update(DT)
+            if (not w.any_moving()) if steps_per_frame else not any(d.vel for d in w.discs):
+                break
+        else:
+            raise AssertionError(f"shot {len(rests) + 1} never came to rest")
+        rests.append(replay.state_digest(w))
+        w.turn_team = 1 - w.turn_team
+    return rests
+
+
+def test_frame_rate_does_not_change_the_simulation():
+    # physics steps alone, then 120, 60 and 40 fps; the old stop_eps test
+    # (before the wall bounce, strict <) diverged from the 10th shot on
+    runs = [_play(3, 12, spf) for spf in (None, 1, 2, 3)]
+    assert runs[0] == runs[1] == runs[2] == runs[3]
+
+
+def test_resting_overlap_does_not_freeze_the_shot():
+    # shot 9 leaves two discs resting on an overlap too small for floats to push
+    # apart; that used to count as a collision every step, so the shot never ended
+    assert len(_play(0, 10, 2)) == 10
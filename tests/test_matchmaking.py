@@ -0,0 +1,15 @@
+from matchmaking import MatchQueue
+
+
+def test_requeue_keeps_waiting_time():
+    q = MatchQueue()
+    a = q.join("a", "eu", 1000, 0.0)
+    b = q.join("b", "eu", 1000, 5.0)
+    assert q.pop_pair(b, 5.0) == (a, b)
+    assert len(q) == 0
+
+    # b's partner logged out before MATCH_START: b goes back, still waiting since 5.0
+    q.requeue(b)
+    assert q.get("b") is b and b.since == 5.0
+    c = q.join("c", "eu", 1350, 11.0)
+    assert q.pop_pair(c, 11.0) == (b, c)   # b's wait has widened its spread to 3 buckets
@@ -0,0 +1,66 @@
+import importlib.util
+import json
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+
+@pytest.fixture(params=["json", "orjson"])
+def codec(request, monkeypatch):
+    """A fresh copy of shared/netcodec.py on each backend (orjson is skipped if not installed)."""
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setitem(sys.modules, "orjson", None)  # import fails -> json fallback
+    spec = importlib.util.spec_from_file_location("netcodec_" + request.param, f"{ROOT}/shared/netcodec.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    assert mod.BACKEND == request.param
+    return mod
+
+
+def test_wire_format(codec):
+    msg = {"type": "LOGIN", "username": "zoe", "n": [1, 2.5, None, True]}
+    line = codec.dumps_line(msg)
+    assert line == b'{"type":"LOGIN","username":"zoe","n":[1,2.5,null,true]}\n'
+    assert codec.loads_line(line) == msg
+    # non-ASCII may be escaped (json) or raw UTF-8 (orjson); either decodes the same
+    assert codec.loads_line(codec.dumps_line({"username": "zoë"})) == {"username": "zoë"}
+    for bad in (b"", b"{", b"[1,2]", b"\xff"):
+        assert codec.loads_line(bad) is None
+
+
+def test_encoded_with_rid(codec):
+    enc = codec.Encoded({"type": "OK", "message": "hi"})
+    assert enc.type == "OK"
+    assert enc.line == b'{"type":"OK","message":"hi"}\n'
+    assert json.loads(enc.with_rid(7)) == {"type": "OK", "message": "hi", "rid": 7}
+    assert json.loads(enc.with_rid("a\"b")) == {"type": "OK", "message": "hi", "rid": "a\"b"}
+    with pytest.raises(ValueError):
+        codec.Encoded({})
+    assert codec.status_msg("ERROR", "x") is codec.status_msg("ERROR", "x")
+
+
+def test_framer_joins_lines_split_across_chunks(codec):
+    f = codec.LineFramer(max_line=16)
+    assert f.feed(b'{"a"') == []
+    assert f.feed(b":1}\n{") == [b'{"a":1}']
+    assert f.feed(b'"b":2}\n\n{"c"') == [b'{"b":2}', b""]
+    assert f.feed(b":3}\n") == [b'{"c":3}']
+    assert f.feed(b"") == []
+
+
+def test_framer_drops_long_lines_once(codec):
+    f = codec.LineFramer(max_line=8)
+    # known to be too long before its newline: reported at once, the rest skipped
+    assert f.feed(b"0123456789") == [None]
+    assert f.feed(b"more") == []
+    assert f.feed(b"tail\nok\n") == [b"ok"]
+    # too long within one chunk
+    assert f.feed(b"x" * 9 + b"\nshort\n") == [None, b"short"]
+    # exactly max_line is fine, also when it arrives in pieces
+    assert f.feed(b"1234") == []
+    assert f.feed(b"5678\n") == [b"12345678"]
+    assert len(f._buf) == 0
@@ -0,0 +1,99 @@
+import math
+import random
+
+import pytest
+
+from client import replay
+from client.game_world import GameWorld
+from client.replay_player import ReplayPlayer, _motion
+
+SHOTS = 12
+
+
+def _record(path):
+    """A headless match the way GameScreen records one: shots, steps, turns and keyframes."""
+    w = GameWorld(you_team=0, start_turn_team=0)
+    rec = replay.ReplayWriter.open(str(path), {"you_team": 0, "start_turn": 0})
+    rng = random.Random(7)
+    tick = 0
+    for _ in range(SHOTS):
+        piece = rng.choice([d.id for d in w.discs if d.team == w.turn_team])
+        angle, power = rng.uniform(-math.pi, math.pi), rng.uniform(0.4, 1.0)
+        rec.shot(tick, piece, angle, power, replay.LOCAL)
+        w.apply_shot(piece, angle, power)
+        while w._corr_active or any(d.vel for d in w.discs):
+            w.update(1.0 / replay.TICK_RATE)
+            tick += 1
+            rec.stepped(tick, w)
+            assert tick < 100 * replay.TICK_RATE
+        w.turn_team = 1 - w.turn_team
+        rec.turn(tick, w.turn_team)
+        rec.keyframe(tick, w, 0, 0)
+    rec.end(tick, w, 0, 0, 0)
+    rec.close()
+    return rec.index, tick
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    mp = pytest.MonkeyPatch()
+    mp.setattr(replay, "KEYFRAME_EVERY", 2 * replay.TICK_RATE)   # several keyframes in a short match
+    path = tmp_path_factory.mktemp("replay") / "match.ssr"
+    index, last = _record(path)
+    mp.undo()
+    return path, index, last
+
+
+def test_index_round_trip(recorded):
+    path, index, last = recorded
+    assert len(index) >= 3
+    reader = replay.ReplayReader.map(str(path))
+    try:
+        assert reader.keyframes == index and reader.last_tick == last
+        assert reader.keyframe_before(index[1][0]) == index[1]
+        assert reader.keyframe_before(index[1][0] - 1) == index[0]
+        assert reader.keyframe_before(index[0][0] - 1) is None
+        # without the footer the same index is rebuilt from the records
+        bare = replay.ReplayReader(path.read_bytes()[:reader.end])
+        assert bare.keyframes == index and bare.last_tick == last and not bare.truncated
+    finally:
+        reader.close()
+
+
+def test_playback_reproduces_the_hashes(recorded):
+    player = ReplayPlayer(replay.ReplayReader.load(str(recorded[0]))).run()
+    assert player.hash_checks > SHOTS and player.mismatches == []
+    assert player.tick == recorded[2]
+
+
+def test_seek_matches_playing_from_kickoff(recorded):
+    path, index, last = recorded
+    reader = replay.ReplayReader.load(str(path))
+    seeker = ReplayPlayer(reader)
+    # forwards past keyframes, backwards, onto a keyframe tick and mid-shot
+    for target in (index[2][0] + 30, index[0][0] + 1, index[1][0], last // 3, last):
+        seeker.seek(target)
+        ref = ReplayPlayer(reader)
+        ref.play_to(target)
+        assert seeker.tick == ref.tick == target
+        assert _motion(seeker.world) == _motion(ref.world), target
+    assert seeker.mismatches == []
+
+    # from the last keyframe, only the tail of the match is simulated
+    jump = ReplayPlayer(reader)
+    jump.seek(last)
+    assert jump.steps <= last - index[-1][0] < ReplayPlayer(reader).run().steps
+
+
+def test_truncated_and_garbled_tails(recorded):
+    path = recorded[0]
+    data = path.read_bytes()
+    full = replay.ReplayReader(data)
+    records = list(full)
+    assert not full.truncated
+
+    cut = replay.ReplayReader(data[:full.end - 3])   # END record half written
+    assert list(cut) == records[:-1] and cut.truncated
+
+    junk = replay.ReplayReader(data[:full.end] + bytes((0xEE, 0)))   # no such record kind
+    assert list(junk) == records and junk.truncated
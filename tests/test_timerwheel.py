@@ -0,0 +1,69 @@
+from timerwheel import SLOTS, TimerWheel
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_timers_fire_on_their_tick_across_levels():
+    clock = Clock(1000.0)   # not aligned to a level-1 turn
+    wheel = TimerWheel(resolution=1.0, clock=clock)
+    start = wheel.now_tick
+    fired = []
+    delays = [1, 5, SLOTS - 1, SLOTS, SLOTS + 1, 3 * SLOTS + 7, SLOTS ** 2 - 1, SLOTS ** 2, SLOTS ** 2 + SLOTS + 3]
+    for d in delays:
+        wheel.schedule(d, lambda d=d: fired.append((d, wheel.now_tick - start)))
+    assert len(wheel) == len(delays)
+
+    # step one tick at a time so every cascade runs with timers due right after it
+    for _ in range(max(delays)):
+        clock.now += 1.0
+        wheel.advance()
+    assert fired == [(d, d) for d in delays]
+    assert len(wheel) == 0 and wheel.fired == len(delays)
+
+
+def test_advance_catches_up_in_one_call():
+    clock = Clock()
+    wheel = TimerWheel(resolution=0.5, clock=clock)
+    fired = []
+    for d in (0.1, 0.6, 1.2, 200.0, 1000.0):
+        wheel.schedule(d, fired.append, d)
+    wheel.advance(600.0)
+    assert fired == [0.1, 0.6, 1.2, 200.0]   # rounded up to ticks, in order
+    wheel.advance(1000.0)
+    assert fired[-1] == 1000.0
+
+
+def test_cancel():
+    clock = Clock()
+    wheel = TimerWheel(resolution=1.0, clock=clock)
+    fired = []
+    near = wheel.schedule(3, fired.append, "near")
+    far = wheel.schedule(SLOTS * 2, fired.append, "far")
+    kept = wheel.schedule(SLOTS * 2, fired.append, "kept")
+    near.cancel()
+    assert near.cancelled() and len(wheel) == 2
+    near.cancel()   # twice is harmless
+
+    wheel.advance(SLOTS * 2 - 1)   # far has cascaded down to level 0 by now
+    far.cancel()
+    assert len(wheel) == 1
+    wheel.advance(SLOTS * 2)
+    assert fired == ["kept"] and kept.cancelled()
+    kept.cancel()   # after firing: a no-op
+
+
+def test_callback_may_cancel_a_timer_due_on_the_same_tick():
+    wheel = TimerWheel(resolution=1.0, clock=Clock())
+    fired = []
+    timers = {}
+    for name in "ab":
+        other = "b" if name == "a" else "a"
+        timers[name] = wheel.schedule(2, lambda n=name, o=other: (fired.append(n), timers[o].cancel()))
+    wheel.advance(2)
+    assert len(fired) == 1 and wheel.fired == 1